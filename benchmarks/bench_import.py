@@ -0,0 +1,50 @@
+"""
+Measures the time of `import toolbox.*` in fresh interpreters and checks that no heavy optional dependency is imported.
+Exits with an error code if a forbidden module is imported or if the median import time exceeds --max-ms,
+so that it can guard the startup time of CLI tools and short-lived workers.
+Usage: python benchmarks/bench_import.py [--runs 10] [--max-ms 1000]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+MODULES = ["toolbox", "toolbox.printing", "toolbox.log"]
+FORBIDDEN = ["wandb", "dowel", "torch", "tensorboardX", "matplotlib", "pandas", "PIL"]
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+duration = time.perf_counter() - start
+print(json.dumps({{"duration": duration, "loaded": [m for m in {forbidden} if m in sys.modules]}}))
+"""
+
+
+def measure(module: str) -> dict:
+    """Imports module in a fresh interpreter and returns the import duration and the forbidden modules loaded."""
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    output = subprocess.run([sys.executable, "-c", SCRIPT.format(module=module, forbidden=FORBIDDEN)],
+                            env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--max-ms", type=float, default=1000.)
+    args = parser.parse_args()
+
+    failed = False
+    for module in MODULES:
+        results = [measure(module) for _ in range(args.runs)]
+        median_ms = statistics.median(r["duration"] for r in results) * 1e3
+        loaded = sorted(set(m for r in results for m in r["loaded"]))
+        print(f"import {module:<18} {median_ms:8.1f} ms (median of {args.runs})" + (f"  FORBIDDEN: {loaded}" if loaded else ""))
+        if loaded or median_ms > args.max_ms:
+            failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,48 @@
+"""
+Compares the per-metric overhead of Logger.log_value called in a loop with Logger.log_values and Logger.log_value_array.
+Usage: python benchmarks/bench_log_values.py [--metrics 200] [--steps 1000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+# The repository root is not on the path when the script is run as python benchmarks/bench_log_values.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from toolbox.log import Logger
+from toolbox.printing import print_color
+
+
+def bench(fn, n_calls: int) -> float:
+    """Returns the time spent per call of fn in microseconds."""
+    start = time.perf_counter()
+    for step in range(n_calls):
+        fn(step)
+    return (time.perf_counter() - start) / n_calls * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--metrics", type=int, default=200)
+    parser.add_argument("--steps", type=int, default=1000)
+    args = parser.parse_args()
+
+    names = [f"metric_{i}" for i in range(args.metrics)]
+    values = np.random.rand(args.metrics).tolist()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for scalar_store in [False, True]:
+            print_color(f"\n{args.metrics} metrics per step, {args.steps} steps (scalar_store={scalar_store})", "bold")
+            with Logger(save_path=tmp_dir, scalar_store=scalar_store) as logger:
+                def loop(step):
+                    for name, value in zip(names, values):
+                        logger.log_value(name, value, index=step)
+                t_loop = bench(loop, args.steps)
+            with Logger(save_path=tmp_dir, scalar_store=scalar_store) as logger:
+                t_bulk = bench(lambda step: logger.log_values(dict(zip(names, values)), index=step), args.steps)
+            with Logger(save_path=tmp_dir, scalar_store=scalar_store) as logger:
+                array = np.asarray(values)
+                t_array = bench(lambda step: logger.log_value_array("metric", array), args.steps)
+            print(f"log_value loop:  {t_loop / args.metrics:8.3f} us/metric")
+            print(f"log_values:      {t_bulk / args.metrics:8.3f} us/metric ({t_loop / t_bulk:.1f}x)")
+            print(f"log_value_array: {t_array / args.metrics:8.3f} us/value  ({t_loop / t_array:.1f}x)")
@@ -0,0 +1,218 @@
+"""
+Benchmark suite of the logging and printing hot paths (offline, CPU only).
+Each case is run for at least --min-time seconds (after one warmup call) and --repeats times,
+the median time per call is reported. Results are written as JSON so that releases can be compared:
+    python benchmarks/bench_suite.py --output results.json
+    python benchmarks/bench_suite.py --compare results.json --threshold 1.2
+exits with an error code if a case is more than --threshold times slower than in the baseline.
+Use --filter to only run the cases whose name contains a string.
+Usage: python benchmarks/bench_suite.py [--filter log_] [--output results.json] [--compare baseline.json]
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import numpy as np
+# The repository root is not on the path when the script is run as python benchmarks/bench_suite.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from toolbox.log import Logger
+from toolbox.log.optional import optional_import
+from toolbox.printing import print_color, debug, str_without_colors, str_display_width, strike
+from toolbox.printing.debug import return_str_value
+
+
+# name -> function returning (function to time, number of items processed per call, unit of the items)
+CASES: Dict[str, Callable[[str], Tuple[Callable[[], Any], int, str]]] = {}
+# Loggers created by the current case, closed once it is timed
+LOGGERS: List[Logger] = []
+
+
+def case(name: str) -> Callable:
+    def register(setup: Callable[[str], Tuple[Callable[[], Any], int, str]]) -> Callable:
+        CASES[name] = setup
+        return setup
+    return register
+
+
+def time_case(fn: Callable[[], Any], min_time: float, repeats: int) -> List[float]:
+    """Returns the time per call (in seconds) of each repeat."""
+    fn() # Warmup
+    results = []
+    for _ in range(repeats):
+        n_calls, start = 0, time.perf_counter()
+        while True:
+            fn()
+            n_calls += 1
+            duration = time.perf_counter() - start
+            if duration >= min_time:
+                break
+        results.append(duration / n_calls)
+    return results
+
+
+# Logger
+
+def make_logger(tmp_dir: str, **kwargs: Any) -> Logger:
+    logger = Logger(save_path=tmp_dir, **kwargs)
+    LOGGERS.append(logger)
+    return logger
+
+
+@case("log_value")
+def log_value(tmp_dir: str):
+    logger = make_logger(tmp_dir)
+    return (lambda: logger.log_value("loss", 0.5)), 1, "value"
+
+
+@case("log_value_scalar_store")
+def log_value_scalar_store(tmp_dir: str):
+    logger = make_logger(tmp_dir, scalar_store=True)
+    return (lambda: logger.log_value("loss", 0.5)), 1, "value"
+
+
+@case("log_values_100")
+def log_values_100(tmp_dir: str):
+    logger = make_logger(tmp_dir, scalar_store=True)
+    values = {f"metric_{i}": float(i) for i in range(100)}
+    return (lambda: logger.log_values(values)), 100, "value"
+
+
+for size in [32, 256, 1024]:
+    @case(f"log_image_{size}")
+    def log_image(tmp_dir: str, size: int = size):
+        if optional_import("PIL.Image") is None:
+            return None
+        logger = make_logger(tmp_dir)
+        image = np.random.rand(size, size, 3)
+        return (lambda: logger.log_image("image", image)), 1, "image"
+
+for size in [1_000, 100_000, 1_000_000]:
+    @case(f"log_histogram_{size}")
+    def log_histogram(tmp_dir: str, size: int = size):
+        logger = make_logger(tmp_dir, histogram_mode="ddsketch")
+        values = np.random.randn(size)
+        return (lambda: logger.log_histogram("weights", values)), size, "value"
+
+
+# Printing
+
+def _silent(fn: Callable[[], Any]) -> Callable[[], Any]:
+    def silent_fn() -> Any:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return fn()
+    return silent_fn
+
+
+@case("debug_nested_list")
+def debug_nested_list(tmp_dir: str):
+    var = [[list(range(100)) for _ in range(100)] for _ in range(10)]
+    return _silent(lambda: debug(var)), 1, "call"
+
+
+@case("debug_array")
+def debug_array(tmp_dir: str):
+    var = np.random.rand(1000, 1000)
+    return _silent(lambda: debug(var)), 1, "call"
+
+
+@case("debug_dataframe")
+def debug_dataframe(tmp_dir: str):
+    pd = optional_import("pandas")
+    if pd is None:
+        return None
+    var = pd.DataFrame(np.random.rand(100_000, 20))
+    return _silent(lambda: debug(var)), 1, "call"
+
+
+@case("return_str_value_nested_list")
+def return_str_value_nested_list(tmp_dir: str):
+    var = [[list(range(100)) for _ in range(100)] for _ in range(10)]
+    return (lambda: return_str_value(var, 80)), 1, "call"
+
+
+@case("return_str_value_array")
+def return_str_value_array(tmp_dir: str):
+    var = np.random.rand(1000, 1000)
+    return (lambda: return_str_value(var, 80)), 1, "call"
+
+
+@case("str_without_colors_1MB")
+def str_without_colors_1MB(tmp_dir: str):
+    text = "\033[1m\033[94mDEBUG:\033[0m some text " * 30_000
+    return (lambda: str_without_colors(text)), len(text), "char"
+
+
+def _debug_output(n_lines: int) -> str:
+    """Colored multi-line output such as the one of ldebug on tensors."""
+    line = f"\033[1mDEBUG: \033[0mt \033[94m(Tensor: float32)\033[0m = [0.25, 0.5, 0.75, ...]\033[95m 3, 224, 224\033[0m \033[92m({strike('req-grad')})\033[0m"
+    return "\n".join([line] * n_lines)
+
+
+@case("str_without_colors_debug_output")
+def str_without_colors_debug_output(tmp_dir: str):
+    text = _debug_output(10_000)
+    return (lambda: str_without_colors(text)), len(text), "char"
+
+
+@case("str_display_width_debug_output")
+def str_display_width_debug_output(tmp_dir: str):
+    text = _debug_output(10_000)
+    return (lambda: str_display_width(text)), len(text), "char"
+
+
+def run(filter: Optional[str], min_time: float, repeats: int) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, setup in CASES.items():
+            if filter is not None and filter not in name:
+                continue
+            prepared = setup(tmp_dir)
+            if prepared is None:
+                print(f"{name:<32} skipped (missing optional dependency)")
+                continue
+            fn, n_items, unit = prepared
+            times = time_case(fn, min_time, repeats)
+            while LOGGERS:
+                LOGGERS.pop().close()
+            median = statistics.median(times)
+            results[name] = {"median_s": median, "min_s": min(times), "items_per_s": n_items / median, "unit": unit}
+            print(f"{name:<32} {median * 1e6:12.2f} us/call {n_items / median:14.1f} {unit}/s")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filter", default=None)
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", default=None, help="path of the JSON file to write the results to")
+    parser.add_argument("--compare", default=None, help="path of a JSON file of previous results")
+    parser.add_argument("--threshold", type=float, default=1.2)
+    args = parser.parse_args()
+
+    print_color(f"Python {platform.python_version()}, numpy {np.__version__}, {platform.machine()}", "bold")
+    results = run(args.filter, args.min_time, args.repeats)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump({"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+                       "time": time.time(), "results": results}, f, indent=2)
+    failed = False
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)["results"]
+        print_color(f"\nCompared to {args.compare}", "bold")
+        for name, result in results.items():
+            if name not in baseline:
+                continue
+            ratio = result["median_s"] / baseline[name]["median_s"]
+            regression = ratio > args.threshold
+            failed = failed or regression
+            print_color(f"{name:<32} {ratio:6.2f}x" + (" REGRESSION" if regression else ""), "red" if regression else None)
+    sys.exit(1 if failed else 0)
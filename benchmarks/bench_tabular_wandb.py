@@ -0,0 +1,58 @@
+"""
+Counts the wandb.log calls made by TabularModified.record with a fake wandb module (nothing is sent),
+and compares the unbatched behaviour (one call per key, wandb_max_keys=1) with the batched one (one call per step).
+Usage: python benchmarks/bench_tabular_wandb.py [--keys 50] [--steps 1000]
+"""
+import argparse
+import os
+import sys
+import time
+import types
+# The repository root is not on the path when the script is run as python benchmarks/bench_tabular_wandb.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from toolbox.printing import print_color
+
+
+class FakeWandb(types.ModuleType):
+    """Stands for the wandb module: counts the calls to log and the rows of the history."""
+
+    def __init__(self):
+        super().__init__("wandb")
+        self.run = None
+        self.calls = 0
+        self.rows = set()
+
+    def log(self, values, step=None):
+        self.calls += 1
+        self.rows.add(step if step is not None else ("row", self.calls))
+
+
+def bench(keys: int, steps: int, max_keys: int, with_step: bool) -> None:
+    from toolbox.log import TabularModified
+    fake = FakeWandb()
+    tabular = TabularModified(use_wandb=False, wandb_max_keys=max_keys)
+    tabular.wandb = fake # set_wandb only imports wandb if tabular.wandb is None
+    tabular.set_wandb(True)
+    names = [f"metric_{i}" for i in range(keys)]
+    start = time.perf_counter()
+    for step in range(steps):
+        for name in names:
+            tabular.record(name, 0.5, step=step if with_step else None)
+        tabular.mark_all() # Done by the dowel outputs when the tabular is dumped
+        tabular.clear()
+    duration = time.perf_counter() - start
+    mode = "unbatched" if max_keys == 1 else "batched"
+    print(f"{mode:<10} step={str(with_step):<5} {fake.calls:8d} wandb.log calls {len(fake.rows):8d} history rows "
+          f"{duration / (keys * steps) * 1e6:6.2f} us/record")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--keys", type=int, default=50)
+    parser.add_argument("--steps", type=int, default=1000)
+    args = parser.parse_args()
+
+    print_color(f"{args.keys} keys per step, {args.steps} steps", "bold")
+    for with_step in [True, False]:
+        bench(args.keys, args.steps, max_keys=1, with_step=with_step)
+        bench(args.keys, args.steps, max_keys=1000, with_step=with_step)
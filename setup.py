@@ -21,5 +21,6 @@ setuptools.setup(
                       'boto3',
                       'configparser',
                       'dowel',
-                      'wandb'],
+                      'wandb',
+                      'numpy'],
 )
@@ -0,0 +1,20 @@
+import numpy as np
+from toolbox.log.checkpoint import CheckpointEngine
+
+
+def test_sync_save_writes_the_live_state_dict(tmp_path, monkeypatch):
+    engine = CheckpointEngine(str(tmp_path), async_mode=False, file_format="tensors")
+    monkeypatch.setattr(engine, "_snapshot", lambda state_dict: (_ for _ in ()).throw(AssertionError("snapshot in sync mode")))
+    engine.save({"weight": np.arange(4, dtype=np.float32)}, index=1)
+    assert engine.load(1, framework="numpy")["weight"].tolist() == [0, 1, 2, 3]
+    engine.close()
+
+
+def test_async_save_snapshots_the_state_dict(tmp_path):
+    engine = CheckpointEngine(str(tmp_path), async_mode=True, file_format="tensors")
+    weight = np.arange(4, dtype=np.float32)
+    engine.save({"weight": weight}, index=1)
+    weight[:] = -1 # Modified right after save returns
+    engine.wait()
+    assert engine.load(1, framework="numpy")["weight"].tolist() == [0, 1, 2, 3]
+    engine.close()
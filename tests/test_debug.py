@@ -0,0 +1,21 @@
+import sys
+from collections import Counter, OrderedDict, defaultdict, namedtuple
+import numpy as np
+import toolbox.printing.debug # noqa: F401 (the debug function shadows the module in toolbox.printing)
+
+debug_module = sys.modules["toolbox.printing.debug"]
+
+
+def test_matrix_value():
+    assert debug_module.return_str_value(np.matrix([[1, 2], [3, 4]]), 80) == "[[1, 2], [3, 4]]"
+
+
+def test_container_subclasses_keep_their_name():
+    Point = namedtuple("Point", ["x", "y"])
+    assert debug_module.str_type(Point(1, 2)) == "Point: int"
+    assert debug_module.return_str_value(Point(1, 2), 80) == "Point(x=1, y=2)"
+    assert debug_module.str_type(OrderedDict(a=1)) == "OrderedDict: str -> int"
+    assert debug_module.str_type(Counter("aab")) == "Counter: str -> int"
+    assert debug_module.str_type(defaultdict(list)) == "defaultdict: empty"
+    assert debug_module.str_type((1, 2)) == "tuple: int"
+    assert debug_module.return_str_value((1, 2), 80) == "[1, 2]"
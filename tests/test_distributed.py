@@ -0,0 +1,31 @@
+import pytest
+from toolbox.log.distributed import RankAggregatorSink, get_authkey
+from toolbox.log.sinks import Sink
+
+
+class ListSink(Sink):
+    def __init__(self):
+        self.records = []
+
+    def scalars(self, records, wall_time):
+        self.records += records
+
+
+def test_authkey_is_required(monkeypatch):
+    monkeypatch.delenv("TOOLBOX_LOG_AUTHKEY", raising=False)
+    with pytest.raises(RuntimeError):
+        get_authkey(0)
+    monkeypatch.setenv("TOOLBOX_LOG_AUTHKEY", "secret")
+    assert get_authkey(1) == b"secret"
+
+
+def test_incomplete_and_rank_local_scalars_are_written():
+    sink = ListSink()
+    aggregator = RankAggregatorSink([sink], world_size=2, address=("127.0.0.1", 0), authkey=b"test", close_timeout=0.)
+    aggregator._add_scalars(0, [("loss", 0, 1.), ("loss", 1, 2.)])
+    aggregator._add_scalars(1, [("loss", 1, 4.)]) # Index 0 is never logged by rank 1
+    assert [(name, index, float(value)) for name, index, value in sink.records] == [("loss", 0, 1.), ("loss", 1, 3.)]
+    aggregator.set_rank_local("lr")
+    aggregator.scalars([("lr", 0, 0.1)], 0.)
+    assert sink.records[-1] == ("lr", 0, 0.1)
+    aggregator.close()
@@ -0,0 +1,14 @@
+import os
+import numpy as np
+from toolbox.log import Logger
+from toolbox.log import sinks
+
+
+def test_image_skipped_without_pil_is_reported(tmp_path, monkeypatch):
+    monkeypatch.setattr(sinks, "optional_import", lambda name: None) # PIL is not installed
+    logger = Logger(save_path=str(tmp_path), verbose=False)
+    logger.log_image("sample", np.zeros((4, 4, 3)))
+    log_path = os.path.join(logger.save_path, "log.txt")
+    logger.close()
+    text = open(log_path).read()
+    assert "Not saved as PIL is not installed" in text and "Saved in" not in text
@@ -0,0 +1,33 @@
+import json
+import numpy as np
+from toolbox.log.text_sink import json_default
+from toolbox.log.wandb_spool import WandbSpool, read_spool
+
+
+class FakeTensor:
+    """Minimal tensor-like value (item/tolist, like torch.Tensor)."""
+
+    def __init__(self, values):
+        self.values = values
+
+    def tolist(self):
+        return self.values
+
+    def item(self):
+        return self.values
+
+
+def test_json_default_keeps_numbers():
+    record = {"scalar": np.float32(0.5), "int": np.int64(3), "array": np.arange(3), "tensor": FakeTensor([1., 2.]), "other": object}
+    values = json.loads(json.dumps(record, default=json_default))
+    assert values["scalar"] == 0.5 and values["int"] == 3
+    assert values["array"] == [0, 1, 2] and values["tensor"] == [1., 2.]
+    assert values["other"] == str(object)
+
+
+def test_spool_writes_numbers(tmp_path):
+    path = str(tmp_path / "spool.jsonl")
+    spool = WandbSpool(path)
+    spool.log({"loss": np.float64(0.25), "acc": FakeTensor(0.75)}, step=np.int64(2))
+    spool.close()
+    assert read_spool(path) == [(2, {"loss": 0.25, "acc": 0.75})]
@@ -0,0 +1,70 @@
+import gc
+import os
+import threading
+import time
+import weakref
+import numpy as np
+import pytest
+from toolbox.log import Logger
+from toolbox.log.text_sink import BufferedTextSink
+
+
+def test_logger_without_close_is_collected(tmp_path):
+    logger = Logger(save_path=str(tmp_path), async_mode=True)
+    logger.log_value("loss", 1.0)
+    log_path = os.path.join(logger.save_path, "log.txt")
+    ref = weakref.ref(logger)
+    del logger
+    gc.collect()
+    assert ref() is None
+    assert "loss" in open(log_path).read() # Written when the logger was collected
+
+
+def test_text_sink_flushes_on_timer(tmp_path):
+    path = str(tmp_path / "log.txt")
+    with BufferedTextSink(path, flush_interval=0.05) as sink:
+        sink.write("hello\n")
+        deadline = time.monotonic() + 5.
+        while open(path).read() != "hello\n" and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert open(path).read() == "hello\n"
+
+
+def test_rotation_requires_backups(tmp_path):
+    with pytest.raises(ValueError):
+        BufferedTextSink(str(tmp_path / "log.txt"), max_bytes=100, backup_count=0)
+
+
+def test_dropped_records_kept_after_close(tmp_path):
+    logger = Logger(save_path=str(tmp_path), async_mode=True, max_queue_size=2, backpressure="drop_oldest")
+    release = threading.Event()
+    started = threading.Event()
+    logger.async_writer.submit(lambda: (started.set(), release.wait())) # Blocks the writer thread
+    started.wait()
+    for i in range(10):
+        logger.log_value("loss", float(i), verbose=False)
+    release.set()
+    logger.close()
+    assert logger.dropped_records == 8 # The queue only kept the 2 newest records
+
+
+def test_cpu_image_tensor_copied_in_async_mode(tmp_path):
+    torch = pytest.importorskip("torch")
+    logger = Logger(save_path=str(tmp_path), async_mode=True)
+    image = torch.zeros((4, 4, 3), dtype=torch.uint8)
+    array, _ = logger._tensor_to_host(image)
+    image += 1 # Modified in place before the writer thread runs
+    assert array.max() == 0
+    logger.close()
+
+
+def test_close_writes_the_log_when_a_background_job_failed(tmp_path):
+    logger = Logger(save_path=str(tmp_path), async_mode=True)
+    log_path = os.path.join(logger.save_path, "log.txt")
+    logger.log("before")
+    logger.log_image("bad", np.zeros((2, 2, 2, 2, 2))) # Raises in the writer thread
+    logger.log("after")
+    with pytest.raises(Exception):
+        logger.close()
+    text = open(log_path).read()
+    assert "before" in text and "after" in text
@@ -0,0 +1,15 @@
+from toolbox.log import Logger
+
+
+def test_call_policies_do_not_apply_to_metrics_with_the_same_name(tmp_path):
+    logger = Logger(save_path=str(tmp_path), verbose=False, scalar_store=True)
+    logger.set_call_policy("log", every=2)
+    logger.set_policy("debug", every=3) # A metric named debug
+    for i in range(6):
+        logger.log_value("log", float(i))
+        logger.log_value("debug", float(i))
+        logger.log(f"message {i}")
+    assert logger.read_scalars("log")[2].tolist() == [0., 1., 2., 3., 4., 5.]
+    assert logger.read_scalars("debug")[2].tolist() == [0., 3.]
+    assert logger.skipped_records == {"debug": 4, "log()": 3}
+    logger.close()
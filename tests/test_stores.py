@@ -0,0 +1,54 @@
+import os
+import numpy as np
+from toolbox.log.scalar_store import ScalarStore
+from toolbox.log.histogram_sketch import HistogramSketch, SketchStore, read_sketches
+
+
+def test_scalar_store_more_metrics_than_open_files(tmp_path):
+    store = ScalarStore(str(tmp_path), flush_records=10, max_open_files=8)
+    for step in range(3):
+        for i in range(200):
+            store.append(f"metric_{i}", step, 0., float(i + step))
+        assert len(store._files) <= 8
+    store.close()
+    assert len(ScalarStore.list_metrics(str(tmp_path))) == 200
+    for i in (0, 57, 199):
+        indexes, _, values = ScalarStore.read(str(tmp_path), f"metric_{i}")
+        assert indexes.tolist() == [0, 1, 2]
+        assert values.tolist() == [i, i + 1, i + 2]
+
+
+def test_sketch_store_more_metrics_than_open_files(tmp_path):
+    store = SketchStore(str(tmp_path), max_open_files=4)
+    for step in range(2):
+        for i in range(50):
+            store.append(f"weights_{i}", step, 0., np.random.randn(100))
+        assert len(store._files) <= 4
+    store.close()
+    assert len(os.listdir(str(tmp_path))) == 50
+    assert [index for index, _, _ in read_sketches(store.path("weights_7"))] == [0, 1]
+
+
+def test_scalar_store_append_many_readable_after_flush(tmp_path):
+    store = ScalarStore(str(tmp_path))
+    store.append_many("loss", np.arange(3), 0., [1., 2., 3.])
+    store.flush()
+    indexes, _, values = ScalarStore.read(str(tmp_path), "loss")
+    assert indexes.tolist() == [0, 1, 2]
+    assert values.tolist() == [1., 2., 3.]
+    store.close()
+
+
+def test_sketch_store_recover_truncates_torn_record(tmp_path):
+    store = SketchStore(str(tmp_path))
+    store.append("weights", 0, 0., np.arange(10.))
+    store.append("weights", 1, 0., np.arange(20.))
+    store.close()
+    path = store.path("weights")
+    with open(path, "ab") as f:
+        f.write(HistogramSketch.from_values(np.arange(5.)).to_bytes(2, 0.)[:-3]) # Crash in the middle of a write
+    assert SketchStore.recover(str(tmp_path)) == {"weights": 1}
+    store = SketchStore(str(tmp_path))
+    store.append("weights", 2, 0., np.arange(30.))
+    store.close()
+    assert [(index, sketch.count) for index, _, sketch in read_sketches(path)] == [(0, 10), (1, 20), (2, 30)]
@@ -0,0 +1,26 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+
+def test_last_step_sent_to_wandb_at_exit(tmp_path):
+    # Fake wandb module that writes the logged values to a file
+    (tmp_path / "wandb.py").write_text(textwrap.dedent(f"""
+        import json
+        def log(values, step=None):
+            with open({str(tmp_path / "calls.jsonl")!r}, "a") as f:
+                f.write(json.dumps([values, step]) + "\\n")
+    """))
+    script = textwrap.dedent("""
+        from toolbox.log import TabularModified
+        tabular = TabularModified(use_wandb=True)
+        tabular.record("loss", 1., step=0)
+        tabular.record("loss", 2., step=1)
+    """)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(tmp_path), os.getcwd()]))
+    subprocess.run([sys.executable, "-c", script], env=env, check=True)
+    with open(tmp_path / "calls.jsonl") as f:
+        calls = [json.loads(line) for line in f]
+    assert calls == [[{"loss": 1.}, 0], [{"loss": 2.}, 1]]
@@ -0,0 +1,21 @@
+import signal
+import pytest
+import toolbox.printing.utils as utils
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGWINCH"), reason="no SIGWINCH on this platform")
+def test_width_cache_expires_when_the_handler_is_replaced(monkeypatch):
+    previous = signal.getsignal(signal.SIGWINCH)
+    monkeypatch.setattr(utils, "_terminal_width", None)
+    monkeypatch.setattr(utils, "_resize_handler", None)
+    monkeypatch.setattr(utils, "_resize_handler_tried", False)
+    monkeypatch.setenv("COLUMNS", "100")
+    try:
+        assert utils.get_terminal_width() == 100
+        assert signal.getsignal(signal.SIGWINCH) is utils._resize_handler
+        signal.signal(signal.SIGWINCH, signal.SIG_DFL) # The application installs its own handler
+        monkeypatch.setenv("COLUMNS", "120")
+        monkeypatch.setattr(utils, "_terminal_width_time", utils._terminal_width_time - 2 * utils._WIDTH_CACHE_DURATION)
+        assert utils.get_terminal_width() == 120
+    finally:
+        signal.signal(signal.SIGWINCH, previous)
@@ -0,0 +1,34 @@
+import sys
+import types
+import numpy as np
+from toolbox.log import Logger
+from toolbox.log import optional
+
+
+def make_fake_wandb():
+    fake = types.ModuleType("wandb")
+    fake.run = object()
+    fake.calls = []
+    fake.metrics = []
+    fake.log = lambda values, step=None: fake.calls.append((step, dict(values)))
+    fake.define_metric = lambda name, step_metric=None: fake.metrics.append((name, step_metric))
+    fake.Histogram = lambda values: ("histogram", len(values))
+    fake.Image = lambda image: ("image",)
+    return fake
+
+
+def test_wandb_sink_logs_index_as_step_metric(tmp_path, monkeypatch):
+    fake = make_fake_wandb()
+    monkeypatch.setitem(sys.modules, "wandb", fake)
+    monkeypatch.setitem(optional._modules, "wandb", fake)
+    logger = Logger(save_path=str(tmp_path), save=False, wandb=True)
+    logger.log_value("loss", 1.0, index=500)
+    logger.log_values({"acc": 0.9, "f1": 0.8}, index=30)
+    logger.log_value_array("lr", np.array([0.1, 0.2]), start_index=40)
+    logger.log_histogram("weights", np.arange(10.), index=3) # Lower index than the loss
+    logger.close()
+    assert ("*", "log_index") in fake.metrics
+    # The wandb step is never given (it increases by itself), the indexes are values
+    assert fake.calls == [(None, {"loss": 1.0, "log_index": 500}), (None, {"acc": 0.9, "f1": 0.8, "log_index": 30}),
+                          (None, {"lr": 0.1, "log_index": 40}), (None, {"lr": 0.2, "log_index": 41}),
+                          (None, {"weights": ("histogram", 10), "log_index": 3})]
@@ -1,4 +1,23 @@
+from typing import Any, List
 from .logger import *
-from .tabular_modified import TabularModified
 
-tabular = TabularModified()
\ No newline at end of file
+
+# TabularModified depends on dowel (and wandb if enabled), which are slow to import.
+# They are only imported the first time toolbox.log.TabularModified or toolbox.log.tabular is accessed (PEP 562).
+_LAZY_ATTRIBUTES = ["TabularModified", "tabular"]
+
+
+def __getattr__(name: str) -> Any:
+    if name == "TabularModified":
+        from .tabular_modified import TabularModified
+        globals()["TabularModified"] = TabularModified
+        return TabularModified
+    if name == "tabular":
+        tabular = __getattr__("TabularModified")()
+        globals()["tabular"] = tabular
+        return tabular
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> List[str]:
+    return sorted(list(globals().keys()) + _LAZY_ATTRIBUTES)
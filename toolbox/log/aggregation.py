@@ -0,0 +1,90 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+
+AGGREGATION_STATS = ("mean", "min", "max", "std", "sum", "last", "ema")
+
+
+class WindowAggregator:
+    """
+    Accumulates the values of a metric in a preallocated ring buffer of window values,
+    and returns the summary statistics (stats, among AGGREGATION_STATS) every time the window is full.
+    The "ema" (exponential moving average, with weight ema_alpha = 2 / (window + 1) by default) is carried over the windows,
+    the other statistics are computed over the values of the window.
+    Usage:
+    >>> aggregator = WindowAggregator(window=100, stats=("mean", "max"))
+    >>> summary = aggregator.add(0.5) # None until 100 values have been added
+    """
+
+    def __init__(self, window: int = 100, stats: Sequence[str] = ("mean", "max", "ema"), ema_alpha: Optional[float] = None):
+        assert window > 0, "window should be positive"
+        for stat in stats:
+            if stat not in AGGREGATION_STATS:
+                raise ValueError(f"Unknown stat {stat}, should be one of {list(AGGREGATION_STATS)}")
+        self.window: int = window
+        self.stats: Tuple[str, ...] = tuple(stats)
+        self.ema_alpha: float = 2. / (window + 1) if ema_alpha is None else ema_alpha
+        self.ema: Optional[float] = None
+        self.n_windows: int = 0
+        self._buffer: np.ndarray = np.empty(window, dtype=np.float64)
+        self._size: int = 0
+        if "ema" in self.stats:
+            # Weight of each value of a full window in the EMA, the oldest first
+            self._ema_weights: np.ndarray = self.ema_alpha * (1. - self.ema_alpha) ** np.arange(window - 1, -1, -1)
+
+    def __len__(self) -> int:
+        """Number of values in the current window."""
+        return self._size
+
+    def add(self, value: float) -> Optional[Dict[str, float]]:
+        """
+        Adds a value. Returns the summary if the window is full, None otherwise.
+        """
+        self._buffer[self._size] = value
+        self._size += 1
+        if self._size == self.window:
+            return self.summary()
+        return None
+
+    def add_many(self, values: np.ndarray) -> List[Tuple[int, Dict[str, float]]]:
+        """
+        Adds a 1D array of values. Returns the list of (position in values of the last value of the window, summary)
+        of the windows completed.
+        """
+        summaries = []
+        start = 0
+        while start < len(values):
+            n = min(self.window - self._size, len(values) - start)
+            self._buffer[self._size:self._size + n] = values[start:start + n]
+            self._size += n
+            start += n
+            if self._size == self.window:
+                summaries.append((start - 1, self.summary()))
+        return summaries
+
+    def summary(self) -> Dict[str, float]:
+        """
+        Returns the summary of the values of the current window (even if it is not full) and starts a new window.
+        """
+        values = self._buffer[:self._size]
+        summary: Dict[str, float] = {}
+        if self._size > 0:
+            for stat in self.stats:
+                if stat == "mean": summary[stat] = float(values.mean())
+                elif stat == "min": summary[stat] = float(values.min())
+                elif stat == "max": summary[stat] = float(values.max())
+                elif stat == "std": summary[stat] = float(values.std())
+                elif stat == "sum": summary[stat] = float(values.sum())
+                elif stat == "last": summary[stat] = float(values[-1])
+                elif stat == "ema": summary[stat] = self._update_ema(values)
+            self.n_windows += 1
+        self._size = 0
+        return summary
+
+    def _update_ema(self, values: np.ndarray) -> float:
+        # ema_n = (1 - a)^n * ema_0 + sum_i a * (1 - a)^(n - 1 - i) * x_i, computed without a python loop
+        weights = self._ema_weights[self.window - len(values):]
+        if self.ema is None: # The first value initializes the EMA
+            self.ema = float(values[0])
+        self.ema = float((1. - self.ema_alpha) ** len(values) * self.ema + np.dot(weights, values))
+        return self.ema
@@ -0,0 +1,120 @@
+from typing import Any, Callable, Optional
+import queue
+import threading
+from ..printing import warn
+
+
+class AsyncWriter:
+    """
+    Executes write jobs (file writes, np.save, image encoding, tensorboard calls, ...) on a dedicated background thread.
+    Jobs are pushed on a bounded queue, the backpressure policy decides what happens when the queue is full:
+    - "block": the caller waits until there is some room in the queue.
+    - "drop_oldest": the oldest pending job is discarded to make room for the new one.
+    - "sample": only one job out of sample_every is kept (the caller waits for it), the others are discarded.
+    """
+
+    BACKPRESSURE_POLICIES = ("block", "drop_oldest", "sample")
+
+    def __init__(self, max_queue_size: int = 1000, backpressure: str = "block", sample_every: int = 10, name: str = "toolbox-log-writer"):
+        if backpressure not in AsyncWriter.BACKPRESSURE_POLICIES:
+            raise ValueError(f"Unknown backpressure policy {backpressure}, should be one of {AsyncWriter.BACKPRESSURE_POLICIES}")
+        assert max_queue_size > 0, "max_queue_size should be positive"
+        assert sample_every > 0, "sample_every should be positive"
+        self.max_queue_size: int = max_queue_size
+        self.backpressure: str = backpressure
+        self.sample_every: int = sample_every
+        self.dropped: int = 0 # Number of jobs discarded by the backpressure policy
+        self.processed: int = 0 # Number of jobs executed by the writer thread
+        self.max_queue_depth: int = 0 # Highest number of pending jobs observed
+        self.errors: int = 0 # Number of jobs that raised an exception
+        self._last_error: Optional[BaseException] = None
+        self._sample_counter: int = 0
+        self._closed: bool = False
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue_size)
+        self._submit_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of jobs waiting to be executed."""
+        return self._queue.qsize()
+
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> bool:
+        """
+        Pushes fn(*args, **kwargs) on the queue.
+        Returns False if the job was discarded by the backpressure policy.
+        """
+        if self._closed:
+            raise RuntimeError("Cannot submit a job to a closed AsyncWriter")
+        job = (fn, args, kwargs)
+        with self._submit_lock:
+            if self._queue.full():
+                if self.backpressure == "drop_oldest":
+                    while True:
+                        try:
+                            self._queue.get_nowait()
+                            self._queue.task_done()
+                            self.dropped += 1
+                        except queue.Empty:
+                            pass
+                        try:
+                            self._queue.put_nowait(job)
+                            break
+                        except queue.Full:
+                            continue
+                    self._update_depth()
+                    return True
+                elif self.backpressure == "sample":
+                    self._sample_counter += 1
+                    if self._sample_counter % self.sample_every != 0:
+                        self.dropped += 1
+                        return False
+            else:
+                self._sample_counter = 0
+            self._queue.put(job)
+            self._update_depth()
+        return True
+
+    def flush(self) -> None:
+        """
+        Blocks until every job submitted so far has been executed.
+        Re-raises the last exception raised by a job, if any.
+        """
+        self._queue.join()
+        if self._last_error is not None:
+            error, self._last_error = self._last_error, None
+            raise error
+
+    def close(self) -> None:
+        """Executes the remaining jobs and stops the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        if self._last_error is not None:
+            error, self._last_error = self._last_error, None
+            raise error
+
+    def _update_depth(self) -> None:
+        depth = self._queue.qsize()
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                fn, args, kwargs = job
+                try:
+                    fn(*args, **kwargs)
+                except BaseException as e:
+                    self.errors += 1
+                    self._last_error = e
+                    warn(f"(AsyncWriter) {type(e).__name__} in background job: {e}")
+                self.processed += 1
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,275 @@
+from typing import Any, Dict, Iterable, List, Optional
+import copy
+import json
+import os
+import shutil
+import threading
+import time
+import numpy as np
+from ..printing import warn
+from .async_writer import AsyncWriter
+from .optional import optional_import, loaded_module
+from .tensor_file import TENSOR_EXTENSION, save_tensors, load_tensors
+
+
+CHECKPOINT_FORMATS = {"torch": ".pt", "tensors": TENSOR_EXTENSION}
+
+
+def _nbytes(value: Any) -> int:
+    """Size in bytes of a tensor or an array (0 for other values)."""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    torch = loaded_module("torch")
+    if torch is not None and isinstance(value, torch.Tensor):
+        return value.element_size() * value.nelement()
+    return 0
+
+
+class CheckpointEngine:
+    """
+    Saves state dicts in directory as model_{index}.pt, or as a directory model_{index} of shard_XXXXX.pt files of about
+    shard_bytes bytes each (plus index.json, mapping each key to its shard) if shard_bytes is not None.
+    If file_format is "tensors", the files are flat tensor files (.tensors, see toolbox.log.tensor_file) instead of torch.save files:
+    load() then memory-maps them, so that only the tensors used are read from the disk.
+    - If async_mode is True, save() snapshots the state dict right away (cuda tensors are copied without blocking to pinned buffers,
+      reused by the next saves), then serializes it in a background thread (at most max_pending checkpoints wait to be written).
+      Otherwise the state dict is serialized directly, without any copy.
+    - Each checkpoint is written to a temporary path, fsynced and renamed, so that a crash never leaves a partial checkpoint.
+    - Retention: the keep_last most recent checkpoints and the keep_best best ones according to their metric
+      (the lowest if mode is "min", the highest if mode is "max") are kept, the others are deleted (all are kept if both are None).
+    The list of checkpoints is saved in directory/checkpoints.json, so that the retention continues when a run is resumed.
+    Usage:
+    >>> engine = CheckpointEngine("logs/models", keep_last=2, keep_best=1)
+    >>> engine.save(model.state_dict(), index=10, metric=0.5)
+    """
+
+    def __init__(self, directory: str, async_mode: bool = True, max_pending: int = 2, shard_bytes: Optional[int] = None,
+                 keep_last: Optional[int] = None, keep_best: Optional[int] = None, mode: str = "min", file_format: str = "torch"):
+        if mode not in ("min", "max"):
+            raise ValueError(f"Unknown mode {mode}, should be min or max")
+        if file_format not in CHECKPOINT_FORMATS:
+            raise ValueError(f"Unknown file_format {file_format}, should be one of {list(CHECKPOINT_FORMATS.keys())}")
+        assert keep_last is None or keep_last > 0, "keep_last should be positive"
+        assert keep_best is None or keep_best > 0, "keep_best should be positive"
+        self.directory: str = directory
+        self.shard_bytes: Optional[int] = shard_bytes
+        self.keep_last: Optional[int] = keep_last
+        self.keep_best: Optional[int] = keep_best
+        self.mode: str = mode
+        self.file_format: str = file_format
+        self.extension: str = CHECKPOINT_FORMATS[file_format]
+        self.checkpoints: List[Dict[str, Any]] = [] # {"index", "path", "metric", "time"} of the checkpoints kept, oldest first
+        self._writer: Optional[AsyncWriter] = AsyncWriter(max_queue_size=max_pending, name="toolbox-checkpoint-writer") if async_mode else None
+        # Pinned host buffers of the cuda tensors that are not used by a pending write, by key in the state dict
+        self._free_pinned: Dict[str, List[Any]] = {}
+        self._pinned_lock = threading.Lock()
+        self._metadata_path: str = os.path.join(directory, "checkpoints.json")
+        if os.path.exists(self._metadata_path):
+            with open(self._metadata_path, "r") as f:
+                self.checkpoints = json.load(f)
+
+    def path(self, index: Any) -> str:
+        """Path of the checkpoint index."""
+        name = f"model_{index}"
+        return os.path.join(self.directory, name if self.shard_bytes is not None else name + self.extension)
+
+    def save(self, state_dict: Dict[str, Any], index: Any, metric: Optional[float] = None) -> str:
+        """
+        Saves the state dict as the checkpoint index (with its metric, used by keep_best) and returns its path.
+        The state dict can be modified as soon as save returns.
+        """
+        if self._writer is None:
+            self._write(state_dict, None, index, metric)
+            return self.path(index)
+        snapshot, ready, pinned = self._snapshot(state_dict)
+        self._writer.submit(self._write_snapshot, snapshot, ready, pinned, index, metric)
+        return self.path(index)
+
+    def find(self, index: Any) -> str:
+        """
+        Returns the path of the checkpoint index, whatever the format and sharding it was saved with.
+        """
+        name = os.path.join(self.directory, f"model_{index}")
+        for path in [name + extension for extension in CHECKPOINT_FORMATS.values()] + [name]:
+            if os.path.exists(path):
+                return path
+        raise FileNotFoundError(f"No checkpoint {index} in {self.directory}")
+
+    @staticmethod
+    def load_file(path: str, keys: Optional[Iterable[str]] = None, framework: str = "torch") -> Dict[str, Any]:
+        """
+        Loads the tensors of a checkpoint file (only those in keys if it is not None).
+        .tensors files are memory-mapped, torch files are memory-mapped too if the torch version supports it.
+        """
+        if path.endswith(TENSOR_EXTENSION):
+            return load_tensors(path, keys=keys, framework=framework)
+        torch = optional_import("torch")
+        if torch is None:
+            raise ImportError("Please install torch to load models")
+        try:
+            state_dict = torch.load(path, map_location="cpu", mmap=True)
+        except (TypeError, RuntimeError): # Older torch, or file saved with the legacy format
+            state_dict = torch.load(path, map_location="cpu")
+        if keys is not None:
+            state_dict = {key: state_dict[key] for key in keys if key in state_dict}
+        return state_dict
+
+    def load(self, index: Any, keys: Optional[Iterable[str]] = None, framework: str = "torch") -> Dict[str, Any]:
+        """
+        Returns the state dict of the checkpoint index (only the keys in keys if it is not None).
+        The shards of a sharded checkpoint that contain none of the keys are not opened.
+        """
+        self.wait() # The checkpoint may still be written
+        path = self.find(index)
+        if not os.path.isdir(path):
+            return CheckpointEngine.load_file(path, keys, framework)
+        with open(os.path.join(path, "index.json"), "r") as f:
+            key_to_shard: Dict[str, str] = json.load(f)
+        wanted = list(key_to_shard.keys()) if keys is None else [key for key in keys if key in key_to_shard]
+        shard_to_keys: Dict[str, List[str]] = {}
+        for key in wanted:
+            shard_to_keys.setdefault(key_to_shard[key], []).append(key)
+        state_dict: Dict[str, Any] = {}
+        for shard_name, shard_keys in shard_to_keys.items():
+            state_dict.update(CheckpointEngine.load_file(os.path.join(path, shard_name), shard_keys, framework))
+        # Keeps the order of the saved state dict
+        return {key: state_dict[key] for key in wanted}
+
+    def wait(self) -> None:
+        """Blocks until all the checkpoints are written."""
+        if self._writer is not None:
+            self._writer.flush()
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _pinned_buffer(self, key: str, value: Any) -> Any:
+        """Returns a free pinned host buffer with the shape and dtype of the cuda tensor value (allocated if there is none)."""
+        with self._pinned_lock:
+            buffers = self._free_pinned.get(key, [])
+            for i, buffer in enumerate(buffers):
+                if buffer.shape == value.shape and buffer.dtype == value.dtype:
+                    return buffers.pop(i)
+        torch = loaded_module("torch")
+        return torch.empty(value.shape, dtype=value.dtype, pin_memory=True)
+
+    def _snapshot(self, state_dict: Dict[str, Any]) -> Any:
+        """
+        Returns (copy of the state dict on the host, cuda event recorded after the copies or None,
+        {key: pinned buffer} used by the copy, to give back once the snapshot is written).
+        """
+        torch = loaded_module("torch")
+        pinned: Dict[str, Any] = {}
+
+        def copy_value(key: str, value: Any) -> Any:
+            if torch is not None and isinstance(value, torch.Tensor):
+                value = value.detach()
+                if value.is_cuda:
+                    host = pinned[key] = self._pinned_buffer(key, value)
+                    host.copy_(value, non_blocking=True)
+                    return host
+                return value.clone()
+            if isinstance(value, np.ndarray):
+                return value.copy()
+            if isinstance(value, dict):
+                return type(value)((item_key, copy_value(f"{key}/{item_key}", item)) for item_key, item in value.items())
+            if isinstance(value, (list, tuple)):
+                return type(value)(copy_value(f"{key}/{i}", item) for i, item in enumerate(value))
+            return copy.deepcopy(value)
+
+        snapshot = copy_value("", state_dict)
+        ready = None
+        if pinned:
+            ready = torch.cuda.Event()
+            ready.record()
+        return snapshot, ready, pinned
+
+    def _write_snapshot(self, snapshot: Dict[str, Any], ready: Optional[Any], pinned: Dict[str, Any], index: Any, metric: Optional[float]) -> None:
+        try:
+            self._write(snapshot, ready, index, metric)
+        finally:
+            # The pinned buffers can be reused by the next saves
+            with self._pinned_lock:
+                for key, buffer in pinned.items():
+                    self._free_pinned.setdefault(key, []).append(buffer)
+
+    def _save_file(self, obj: Any, path: str) -> None:
+        if self.file_format == "tensors":
+            save_tensors(obj, path)
+            return
+        torch = optional_import("torch")
+        if torch is None:
+            raise ImportError("Please install torch to save models")
+        with open(path, "wb") as f:
+            torch.save(obj, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _shards(self, state_dict: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Splits the state dict in shards of about shard_bytes bytes (a tensor is never split)."""
+        shards: List[Dict[str, Any]] = [{}]
+        size = 0
+        for key, value in state_dict.items():
+            nbytes = _nbytes(value)
+            if shards[-1] and size + nbytes > self.shard_bytes:
+                shards.append({})
+                size = 0
+            shards[-1][key] = value
+            size += nbytes
+        return shards
+
+    def _write(self, snapshot: Dict[str, Any], ready: Optional[Any], index: Any, metric: Optional[float]) -> None:
+        if ready is not None:
+            ready.synchronize()
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(index)
+        tmp_path = path + ".tmp"
+        if self.shard_bytes is None:
+            self._save_file(snapshot, tmp_path)
+            os.replace(tmp_path, path)
+        else:
+            if os.path.exists(tmp_path):
+                shutil.rmtree(tmp_path)
+            os.makedirs(tmp_path)
+            key_to_shard = {}
+            for i, shard in enumerate(self._shards(snapshot)):
+                shard_name = f"shard_{i:05d}" + self.extension
+                self._save_file(shard, os.path.join(tmp_path, shard_name))
+                key_to_shard.update({key: shard_name for key in shard})
+            with open(os.path.join(tmp_path, "index.json"), "w") as f:
+                json.dump(key_to_shard, f)
+            if os.path.exists(path):
+                shutil.rmtree(path)
+            os.replace(tmp_path, path)
+        self.checkpoints = [checkpoint for checkpoint in self.checkpoints if checkpoint["path"] != path]
+        self.checkpoints.append({"index": index, "path": path, "metric": metric, "time": time.time()})
+        self._apply_retention()
+
+    def _apply_retention(self) -> None:
+        if self.keep_last is None and self.keep_best is None:
+            kept = self.checkpoints
+        else:
+            kept_paths = set()
+            if self.keep_last is not None:
+                kept_paths.update(checkpoint["path"] for checkpoint in self.checkpoints[-self.keep_last:])
+            if self.keep_best is not None:
+                with_metric = [checkpoint for checkpoint in self.checkpoints if checkpoint["metric"] is not None]
+                with_metric.sort(key=lambda checkpoint: checkpoint["metric"], reverse=self.mode == "max")
+                kept_paths.update(checkpoint["path"] for checkpoint in with_metric[:self.keep_best])
+            kept = [checkpoint for checkpoint in self.checkpoints if checkpoint["path"] in kept_paths]
+            for checkpoint in self.checkpoints:
+                if checkpoint["path"] not in kept_paths:
+                    try:
+                        if os.path.isdir(checkpoint["path"]):
+                            shutil.rmtree(checkpoint["path"])
+                        else:
+                            os.remove(checkpoint["path"])
+                    except FileNotFoundError:
+                        warn(f"(Model) Checkpoint {checkpoint['path']} was already deleted")
+        self.checkpoints = kept
+        tmp_path = self._metadata_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.checkpoints, f)
+        os.replace(tmp_path, self._metadata_path)
@@ -0,0 +1,387 @@
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from collections import OrderedDict
+from multiprocessing.connection import Client, Connection, Listener
+import os
+import secrets
+import threading
+import time
+import numpy as np
+from ..printing import warn
+from .optional import loaded_module
+from .sinks import Sink, ScalarRecord, ImageRecord, ImageBatchRecord
+
+
+REDUCE_OPS: Dict[str, Callable[[np.ndarray], Any]] = {"mean": np.mean, "sum": np.sum, "max": np.max, "min": np.min}
+
+
+def get_rank_and_world_size(rank: Optional[int] = None, world_size: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Returns (rank, world_size) of the current process.
+    The values given are used first, then torch.distributed if it is initialized, then the RANK and WORLD_SIZE
+    environment variables (set by torchrun), and finally (0, 1).
+    """
+    if rank is None or world_size is None:
+        dist = loaded_module("torch.distributed")
+        if dist is not None and dist.is_available() and dist.is_initialized():
+            rank = dist.get_rank() if rank is None else rank
+            world_size = dist.get_world_size() if world_size is None else world_size
+    if rank is None:
+        rank = int(os.environ.get("RANK", 0))
+    if world_size is None:
+        world_size = int(os.environ.get("WORLD_SIZE", 1))
+    assert 0 <= rank < world_size, f"rank ({rank}) should be in [0, world_size ({world_size})["
+    return rank, world_size
+
+
+def default_aggregator_address() -> Tuple[str, int]:
+    """
+    Address of the rank 0 aggregator: TOOLBOX_LOG_ADDR (127.0.0.1 by default, so the aggregator is only reachable from its machine:
+    set it, or give aggregator_address, to an address of rank 0 for multi-node runs)
+    and TOOLBOX_LOG_PORT (MASTER_PORT + 1 by default, MASTER_PORT being 29500 by default).
+    """
+    host = os.environ.get("TOOLBOX_LOG_ADDR", "127.0.0.1")
+    port = int(os.environ.get("TOOLBOX_LOG_PORT", int(os.environ.get("MASTER_PORT", 29500)) + 1))
+    return host, port
+
+
+def get_authkey(rank: int) -> bytes:
+    """
+    Returns the key authenticating the connections between the ranks (the records are pickled, so only the processes
+    knowing the key may connect): TOOLBOX_LOG_AUTHKEY if it is set (by the launcher), otherwise a random key generated by rank 0
+    and broadcast with torch.distributed, which must then be initialized. Must be called by all the ranks.
+    """
+    key = os.environ.get("TOOLBOX_LOG_AUTHKEY")
+    if key:
+        return key.encode()
+    dist = loaded_module("torch.distributed")
+    if dist is None or not dist.is_available() or not dist.is_initialized():
+        raise RuntimeError("A distributed Logger needs an authentication key: set TOOLBOX_LOG_AUTHKEY to the same secret on all the ranks, "
+                           "or initialize torch.distributed first so that rank 0 can share a random key")
+    keys = [secrets.token_hex(32) if rank == 0 else None]
+    dist.broadcast_object_list(keys, src=0)
+    return keys[0].encode()
+
+
+class RankForwardSink(Sink):
+    """
+    Sink used by the ranks other than 0: the text, scalars and histograms are sent to the aggregator of rank 0
+    (see RankAggregatorSink) instead of being written. Images and graphs are not forwarded, log them from rank 0.
+    The records are sent by batches of send_every records, or every flush_interval seconds.
+    Connecting is retried for connect_timeout seconds, so that the ranks can start before rank 0.
+    authkey is the key shared with rank 0 (see get_authkey, called if it is None).
+    """
+
+    def __init__(self, rank: int, address: Optional[Tuple[str, int]] = None, send_every: int = 64, flush_interval: float = 1.0,
+                 connect_timeout: float = 60., authkey: Optional[bytes] = None):
+        if authkey is None:
+            authkey = get_authkey(rank)
+        self.rank: int = rank
+        self.address: Tuple[str, int] = address if address is not None else default_aggregator_address()
+        self.send_every: int = send_every
+        self.flush_interval: float = flush_interval
+        self.n_sent: int = 0
+        self._buffer: List[Tuple[str, Tuple[Any, ...]]] = []
+        self._last_send: float = time.monotonic()
+        self._lock = threading.Lock()
+        self._connection: Optional[Connection] = None
+        deadline = time.monotonic() + connect_timeout
+        while self._connection is None:
+            try:
+                self._connection = Client(self.address, authkey=authkey)
+            except (ConnectionRefusedError, FileNotFoundError):
+                if time.monotonic() > deadline:
+                    raise ConnectionError(f"Rank {rank} could not connect to the rank 0 logger at {self.address}")
+                time.sleep(0.1)
+        self._connection.send(("hello", (rank,)))
+
+    def set_rank_local(self, name: str, local: bool = True) -> None:
+        """The values of name are written by rank 0 as they are received, without waiting for the other ranks."""
+        self._add("rank_local", (name, local))
+
+    def _add(self, record: str, args: Tuple[Any, ...]) -> None:
+        with self._lock:
+            self._buffer.append((record, args))
+            if len(self._buffer) >= self.send_every or time.monotonic() - self._last_send > self.flush_interval:
+                self._send()
+
+    def _send(self) -> None:
+        if self._buffer and self._connection is not None:
+            self._connection.send(("records", (self._buffer,)))
+            self.n_sent += len(self._buffer)
+        self._buffer = []
+        self._last_send = time.monotonic()
+
+    def text(self, tag: str, text: str, step: int) -> None:
+        self._add("text", (tag, text, step))
+
+    def message(self, text: str) -> None:
+        self._add("message", (text,))
+
+    def scalars(self, records: List[ScalarRecord], wall_time: float) -> None:
+        self._add("scalars", (records, wall_time))
+
+    def scalar_array(self, name: str, start_index: int, values: np.ndarray, wall_time: float) -> None:
+        self._add("scalar_array", (name, start_index, values, wall_time))
+
+    def histogram(self, name: str, index: int, values: Any, wall_time: float, raw: bool) -> None:
+        self._add("histogram", (name, index, np.asarray(values), wall_time, raw))
+
+    def flush(self) -> None:
+        with self._lock:
+            self._send()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is None:
+                return
+            self._send()
+            self._connection.send(("close", ()))
+            self._connection.close()
+            self._connection = None
+
+
+class RankAggregatorSink(Sink):
+    """
+    Sink used by rank 0: it receives the records of the other ranks (see RankForwardSink) and writes them,
+    with its own records, to the sinks given.
+    - The scalars logged by all the ranks with the same (name, index) are reduced (reduce is "mean", "sum", "max" or "min")
+      and written once. The histograms are merged by concatenating the values of all the ranks.
+    - A (name, index) that some ranks never log is written (reduced over the ranks that logged it) as soon as a later index
+      of name is complete, when it is evicted after max_pending other keys are waiting, or when the sink is closed.
+    - The values of the names marked with set_rank_local (e.g. a learning rate only logged by rank 0) are written as they
+      are received, without reduction.
+    - The text and messages of rank r are written with the prefix "[rank r] ".
+    close() waits at most close_timeout seconds for the other ranks to close their logger.
+    authkey is the key shared with the other ranks (see get_authkey, called if it is None).
+    """
+
+    def __init__(self, sinks: List[Sink], world_size: int, reduce: str = "mean", address: Optional[Tuple[str, int]] = None,
+                 max_pending: int = 100000, close_timeout: float = 30., authkey: Optional[bytes] = None):
+        if reduce not in REDUCE_OPS:
+            raise ValueError(f"Unknown reduce {reduce}, should be one of {list(REDUCE_OPS.keys())}")
+        self.sinks: List[Sink] = sinks
+        self.world_size: int = world_size
+        self.reduce: str = reduce
+        self.address: Tuple[str, int] = address if address is not None else default_aggregator_address()
+        self.max_pending: int = max_pending
+        self.close_timeout: float = close_timeout
+        self.n_received: int = 0
+        self.rank_local_names: Set[str] = set()
+        self._authkey: bytes = authkey if authkey is not None else get_authkey(0)
+        self._reduce_op: Callable[[np.ndarray], Any] = REDUCE_OPS[reduce]
+        self._routes: Dict[str, List[Callable[..., None]]] = {
+            record: [getattr(sink, record) for sink in sinks if sink.handles(record)] for record in Sink.RECORDS
+        }
+        # (name, index) -> {rank: value}
+        self._pending_scalars: "OrderedDict[Tuple[str, int], Dict[int, float]]" = OrderedDict()
+        self._pending_indexes: Dict[str, Set[int]] = {} # name -> indexes of name in _pending_scalars
+        self._pending_histograms: "OrderedDict[Tuple[str, int], Dict[int, Tuple[np.ndarray, float, bool]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._receivers: List[threading.Thread] = []
+        self._closed: bool = False
+        self._listener = Listener(self.address, authkey=self._authkey)
+        self._accept_thread = threading.Thread(target=self._accept, name="toolbox-log-aggregator", daemon=True)
+        self._accept_thread.start()
+
+    def handles(self, record: str) -> bool:
+        return len(self._routes[record]) > 0
+
+    @property
+    def bytes_written(self) -> Optional[int]:
+        known = [sink.bytes_written for sink in self.sinks if sink.bytes_written is not None]
+        return sum(known) if known else None
+
+    def set_rank_local(self, name: str, local: bool = True) -> None:
+        """The values of name are written as they are received, without waiting for the other ranks."""
+        with self._lock:
+            self._set_rank_local(name, local)
+
+    def _set_rank_local(self, name: str, local: bool) -> None:
+        if local:
+            self.rank_local_names.add(name)
+        else:
+            self.rank_local_names.discard(name)
+
+    def _accept(self) -> None:
+        for _ in range(self.world_size - 1):
+            try:
+                connection = self._listener.accept()
+            except OSError:
+                return
+            if self._closed:
+                connection.close()
+                return
+            receiver = threading.Thread(target=self._receive, args=(connection,), name="toolbox-log-receiver", daemon=True)
+            receiver.start()
+            self._receivers.append(receiver)
+
+    def _receive(self, connection: Connection) -> None:
+        rank = -1
+        try:
+            while True:
+                kind, args = connection.recv()
+                if kind == "hello":
+                    rank = args[0]
+                elif kind == "records":
+                    with self._lock:
+                        if self._closed:
+                            return
+                        for record, record_args in args[0]:
+                            self._process(rank, record, record_args)
+                        self.n_received += len(args[0])
+                elif kind == "close":
+                    return
+        except (EOFError, OSError):
+            warn(f"(Logger) Lost the connection to rank {rank}")
+        finally:
+            connection.close()
+
+    def _process(self, rank: int, record: str, args: Tuple[Any, ...]) -> None:
+        """Handles a record of rank (called with the lock held)."""
+        if record == "text":
+            tag, text, step = args
+            if rank != 0: text = f"[rank {rank}] " + text
+            for handler in self._routes["text"]:
+                handler(tag, text, step)
+        elif record == "message":
+            text = args[0] if rank == 0 else f"[rank {rank}] " + args[0]
+            for handler in self._routes["message"]:
+                handler(text)
+        elif record == "scalars":
+            self._add_scalars(rank, args[0])
+        elif record == "scalar_array":
+            name, start_index, values, _ = args
+            self._add_scalars(rank, [(name, start_index + i, value) for i, value in enumerate(np.asarray(values).tolist())])
+        elif record == "histogram":
+            self._add_histogram(rank, *args)
+        elif record == "rank_local":
+            self._set_rank_local(*args)
+
+    def _pop_scalar(self, name: str, index: int) -> ScalarRecord:
+        """Removes the pending (name, index) and returns it reduced over the ranks that logged it."""
+        values = self._pending_scalars.pop((name, index))
+        indexes = self._pending_indexes[name]
+        indexes.discard(index)
+        if not indexes:
+            del self._pending_indexes[name]
+        return name, index, self._reduce_op(np.array(list(values.values())))
+
+    def _add_scalars(self, rank: int, records: List[ScalarRecord]) -> None:
+        done: List[ScalarRecord] = []
+        pending = self._pending_scalars
+        for name, index, value in records:
+            if name in self.rank_local_names:
+                done.append((name, index, value))
+                continue
+            key = (name, index)
+            values = pending.get(key)
+            if values is None:
+                values = pending[key] = {}
+                self._pending_indexes.setdefault(name, set()).add(index)
+            values[rank] = value
+            if len(values) == self.world_size:
+                # The earlier indexes of name that are still incomplete will not be completed
+                earlier = sorted(i for i in self._pending_indexes[name] if i < index)
+                done.extend(self._pop_scalar(name, i) for i in earlier)
+                done.append(self._pop_scalar(name, index))
+        while len(pending) > self.max_pending:
+            name, index = next(iter(pending))
+            done.append(self._pop_scalar(name, index))
+        if done:
+            wall_time = time.time()
+            for handler in self._routes["scalars"]:
+                handler(done, wall_time)
+
+    def _write_histogram(self, name: str, index: int, histograms: Dict[int, Tuple[np.ndarray, float, bool]]) -> None:
+        values = np.concatenate([np.ravel(values) for values, _, _ in histograms.values()])
+        wall_time = max(wall_time for _, wall_time, _ in histograms.values())
+        raw = any(raw for _, _, raw in histograms.values())
+        for handler in self._routes["histogram"]:
+            handler(name, index, values, wall_time, raw)
+
+    def _add_histogram(self, rank: int, name: str, index: int, values: Any, wall_time: float, raw: bool) -> None:
+        if name in self.rank_local_names:
+            self._write_histogram(name, index, {rank: (np.asarray(values), wall_time, raw)})
+            return
+        pending = self._pending_histograms
+        key = (name, index)
+        histograms = pending.get(key)
+        if histograms is None:
+            histograms = pending[key] = {}
+        histograms[rank] = (np.asarray(values), wall_time, raw)
+        if len(histograms) == self.world_size:
+            del pending[key]
+            self._write_histogram(name, index, histograms)
+        while len(pending) > self.max_pending:
+            (name, index), histograms = pending.popitem(last=False)
+            self._write_histogram(name, index, histograms)
+
+    # Records of rank 0
+
+    def text(self, tag: str, text: str, step: int) -> None:
+        with self._lock:
+            self._process(0, "text", (tag, text, step))
+
+    def message(self, text: str) -> None:
+        with self._lock:
+            self._process(0, "message", (text,))
+
+    def scalars(self, records: List[ScalarRecord], wall_time: float) -> None:
+        with self._lock:
+            self._add_scalars(0, records)
+
+    def scalar_array(self, name: str, start_index: int, values: np.ndarray, wall_time: float) -> None:
+        with self._lock:
+            self._process(0, "scalar_array", (name, start_index, values, wall_time))
+
+    def histogram(self, name: str, index: int, values: Any, wall_time: float, raw: bool) -> None:
+        with self._lock:
+            self._add_histogram(0, name, index, values, wall_time, raw)
+
+    def image(self, record: ImageRecord) -> None:
+        with self._lock:
+            for handler in self._routes["image"]:
+                handler(record)
+
+    def images(self, record: ImageBatchRecord) -> None:
+        with self._lock:
+            for handler in self._routes["images"]:
+                handler(record)
+
+    def graph(self, model: Any, input_size: Tuple[int, ...]) -> None:
+        with self._lock:
+            for handler in self._routes["graph"]:
+                handler(model, input_size)
+
+    def flush(self) -> None:
+        with self._lock:
+            for sink in self.sinks:
+                sink.flush()
+
+    def close(self) -> None:
+        """
+        Waits for the other ranks to close their logger, writes the incomplete reductions and closes the sinks.
+        """
+        if self._closed:
+            return
+        deadline = time.monotonic() + self.close_timeout
+        self._accept_thread.join(max(0., deadline - time.monotonic()))
+        for receiver in list(self._receivers):
+            receiver.join(max(0., deadline - time.monotonic()))
+        self._closed = True
+        if self._accept_thread.is_alive():
+            warn(f"(Logger) Only {len(self._receivers)} of the {self.world_size - 1} other ranks connected before close")
+            # Wakes up the accept thread so that it stops
+            try:
+                Client(self._listener.address, authkey=self._authkey).close()
+            except OSError:
+                pass
+        self._listener.close()
+        with self._lock:
+            self.max_pending = 0
+            self._add_scalars(0, [])
+            while self._pending_histograms:
+                (name, index), histograms = self._pending_histograms.popitem(last=False)
+                self._write_histogram(name, index, histograms)
+            for sink in self.sinks:
+                sink.close()
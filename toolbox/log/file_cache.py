@@ -0,0 +1,44 @@
+from typing import BinaryIO
+from collections import OrderedDict
+import os
+
+
+class FileHandleCache:
+    """
+    Keeps at most max_open files open in append mode, the least recently used one is closed when another one is needed.
+    A store with thousands of metrics (one file each) thus never runs out of file descriptors.
+    Not thread-safe, the stores using it hold their own lock.
+    Usage:
+    >>> files = FileHandleCache(max_open=64)
+    >>> files.get("logs/scalars/loss.scalars").write(data)
+    """
+
+    def __init__(self, max_open: int = 64):
+        assert max_open > 0, "max_open should be positive"
+        self.max_open: int = max_open
+        self._files: "OrderedDict[str, BinaryIO]" = OrderedDict()
+
+    def __len__(self) -> int:
+        """Number of files currently open."""
+        return len(self._files)
+
+    def get(self, path: str) -> BinaryIO:
+        """Returns the file path opened in append mode (opened again if it was closed)."""
+        f = self._files.get(path)
+        if f is not None:
+            self._files.move_to_end(path)
+            return f
+        while len(self._files) >= self.max_open:
+            _, oldest = self._files.popitem(last=False)
+            oldest.close()
+        f = self._files[path] = open(path, "ab")
+        return f
+
+    def flush(self) -> None:
+        for f in self._files.values():
+            f.flush()
+
+    def close(self) -> None:
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
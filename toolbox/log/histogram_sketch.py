@@ -0,0 +1,320 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import os
+import threading
+from urllib.parse import quote, unquote
+import numpy as np
+from .file_cache import FileHandleCache
+
+
+SKETCH_EXTENSION = ".sketches"
+KIND_DDSKETCH = 0
+KIND_FIXED = 1
+# Header of each record of a sketch file, followed by n_pos int32 keys, n_pos int64 counts, n_neg int32 keys and n_neg int64 counts
+SKETCH_HEADER_DTYPE = np.dtype([
+    ("index", "<i8"), ("time", "<f8"), ("kind", "<i8"), ("param0", "<f8"), ("param1", "<f8"),
+    ("count", "<i8"), ("sum", "<f8"), ("min", "<f8"), ("max", "<f8"), ("zero_count", "<i8"), ("non_finite", "<i8"),
+    ("n_pos", "<i8"), ("n_neg", "<i8"),
+])
+
+
+def _sparse_counts(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the sorted unique keys and their counts."""
+    if len(keys) == 0:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64)
+    offset = keys.min()
+    counts = np.bincount(keys - offset)
+    nonzero = np.flatnonzero(counts)
+    return (nonzero + offset).astype(np.int32), counts[nonzero].astype(np.int64)
+
+
+def _merge_sparse(keys1: np.ndarray, counts1: np.ndarray, keys2: np.ndarray, counts2: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Adds two sparse (keys, counts) histograms."""
+    keys = np.concatenate([keys1, keys2])
+    if len(keys) == 0:
+        return keys.astype(np.int32), np.empty(0, dtype=np.int64)
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    counts = np.zeros(len(unique_keys), dtype=np.int64)
+    np.add.at(counts, inverse, np.concatenate([counts1, counts2]))
+    return unique_keys.astype(np.int32), counts
+
+
+class HistogramSketch:
+    """
+    Compact and mergeable summary of the distribution of an array of values.
+    Two kinds of sketches are supported:
+    - "ddsketch": logarithmic buckets, every quantile is estimated with a relative error of at most alpha
+      (see DDSketch, Masson et al. 2019). Only the non-empty buckets are stored.
+    - "fixed": n_bins bins of the same width between low and high, values outside are counted in the first/last bin.
+    Two sketches with the same kind and parameters can be merged (e.g. across workers or runs).
+    Usage:
+    >>> sketch = HistogramSketch.from_values(np.random.randn(10**6), kind="ddsketch", alpha=0.01)
+    >>> sketch.quantile(0.5)
+    """
+
+    def __init__(self, kind: str = "ddsketch", alpha: float = 0.01, low: float = 0., high: float = 1., n_bins: int = 64):
+        if kind not in ("ddsketch", "fixed"):
+            raise ValueError(f"Unknown sketch kind {kind}, should be ddsketch or fixed")
+        self.kind: str = kind
+        if kind == "ddsketch":
+            assert 0 < alpha < 1, "alpha should be in ]0, 1["
+            self.param0, self.param1 = float(alpha), 0.
+        else:
+            assert high > low and n_bins > 0, "high should be greater than low and n_bins should be positive"
+            self.param0, self.param1 = float(low), float(high)
+        self.n_bins: int = n_bins
+        self.count: int = 0
+        self.sum: float = 0.
+        self.min: float = np.inf
+        self.max: float = -np.inf
+        self.zero_count: int = 0
+        self.non_finite: int = 0 # NaNs and infinities are counted but not added to the buckets
+        self.pos_keys: np.ndarray = np.empty(0, dtype=np.int32)
+        self.pos_counts: np.ndarray = np.empty(0, dtype=np.int64)
+        self.neg_keys: np.ndarray = np.empty(0, dtype=np.int32)
+        self.neg_counts: np.ndarray = np.empty(0, dtype=np.int64)
+
+    @property
+    def gamma(self) -> float:
+        return (1 + self.param0) / (1 - self.param0)
+
+    @classmethod
+    def from_values(cls, values: Any, **kwargs: Any) -> "HistogramSketch":
+        """
+        Builds a sketch of values in one vectorized pass.
+        """
+        sketch = cls(**kwargs)
+        sketch.add(values)
+        return sketch
+
+    def add(self, values: Any) -> None:
+        """
+        Adds the values to the sketch.
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        finite = np.isfinite(values)
+        n_finite = int(np.count_nonzero(finite))
+        if n_finite != len(values):
+            self.non_finite += len(values) - n_finite
+            values = values[finite]
+        if len(values) == 0:
+            return
+        self.count += len(values)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        if self.kind == "fixed":
+            low, high = self.param0, self.param1
+            keys = np.floor((values - low) * (self.n_bins / (high - low))).astype(np.int64)
+            np.clip(keys, 0, self.n_bins - 1, out=keys)
+            keys, counts = _sparse_counts(keys)
+            self.pos_keys, self.pos_counts = _merge_sparse(self.pos_keys, self.pos_counts, keys, counts)
+        else:
+            log_gamma = np.log(self.gamma)
+            abs_values = np.abs(values)
+            nonzero = abs_values > 1e-300
+            self.zero_count += len(values) - int(np.count_nonzero(nonzero))
+            keys = np.ceil(np.log(abs_values[nonzero]) / log_gamma).astype(np.int64)
+            positive = values[nonzero] > 0
+            pos_keys, pos_counts = _sparse_counts(keys[positive])
+            neg_keys, neg_counts = _sparse_counts(keys[~positive])
+            self.pos_keys, self.pos_counts = _merge_sparse(self.pos_keys, self.pos_counts, pos_keys, pos_counts)
+            self.neg_keys, self.neg_counts = _merge_sparse(self.neg_keys, self.neg_counts, neg_keys, neg_counts)
+
+    def merge(self, other: "HistogramSketch") -> "HistogramSketch":
+        """
+        Merges other into this sketch (in place) and returns it. Both sketches must have the same kind and parameters.
+        """
+        if (self.kind, self.param0, self.param1, self.n_bins) != (other.kind, other.param0, other.param1, other.n_bins):
+            raise ValueError("Cannot merge sketches with different kinds or parameters")
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.zero_count += other.zero_count
+        self.non_finite += other.non_finite
+        self.pos_keys, self.pos_counts = _merge_sparse(self.pos_keys, self.pos_counts, other.pos_keys, other.pos_counts)
+        self.neg_keys, self.neg_counts = _merge_sparse(self.neg_keys, self.neg_counts, other.neg_keys, other.neg_counts)
+        return self
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count > 0 else np.nan
+
+    def buckets(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the (representative values, counts) of the non-empty buckets sorted by increasing value.
+        """
+        if self.kind == "fixed":
+            width = (self.param1 - self.param0) / self.n_bins
+            return self.param0 + (self.pos_keys + 0.5) * width, self.pos_counts
+        gamma = self.gamma
+        neg_values = -2 * gamma ** self.neg_keys[::-1].astype(np.float64) / (gamma + 1)
+        pos_values = 2 * gamma ** self.pos_keys.astype(np.float64) / (gamma + 1)
+        values = np.concatenate([neg_values, [0.] if self.zero_count > 0 else [], pos_values])
+        counts = np.concatenate([self.neg_counts[::-1], [self.zero_count] if self.zero_count > 0 else [], self.pos_counts]).astype(np.int64)
+        return values, counts
+
+    def quantile(self, q: Any) -> Any:
+        """
+        Returns the estimated quantile(s) q (in [0, 1]) of the values added to the sketch.
+        """
+        if self.count == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) > 0 else np.nan
+        values, counts = self.buckets()
+        ranks = np.asarray(q, dtype=np.float64) * (self.count - 1)
+        positions = np.searchsorted(np.cumsum(counts), ranks, side="right")
+        result = np.clip(values[np.minimum(positions, len(values) - 1)], self.min, self.max)
+        return result if np.ndim(q) > 0 else float(result)
+
+    def to_bytes(self, index: int, time: float) -> bytes:
+        """
+        Serializes the sketch as one record of a sketch file.
+        """
+        header = np.zeros(1, dtype=SKETCH_HEADER_DTYPE)
+        header["index"], header["time"] = index, time
+        header["kind"] = KIND_DDSKETCH if self.kind == "ddsketch" else KIND_FIXED
+        header["param0"], header["param1"] = self.param0, self.param1
+        header["count"], header["sum"], header["min"], header["max"] = self.count, self.sum, self.min, self.max
+        header["zero_count"], header["non_finite"] = self.zero_count, self.non_finite
+        header["n_pos"], header["n_neg"] = len(self.pos_keys), len(self.neg_keys)
+        if self.kind == "fixed":
+            # The number of bins is stored instead of the (always empty) negative buckets
+            header["n_neg"] = -self.n_bins
+        return b"".join([header.tobytes(), self.pos_keys.astype("<i4").tobytes(), self.pos_counts.astype("<i8").tobytes(),
+                         self.neg_keys.astype("<i4").tobytes(), self.neg_counts.astype("<i8").tobytes()])
+
+    @classmethod
+    def from_buffer(cls, buffer: bytes, offset: int = 0) -> Tuple[int, float, "HistogramSketch", int]:
+        """
+        Deserializes the record starting at offset in buffer.
+        Returns (index, time, sketch, offset of the next record).
+        """
+        header = np.frombuffer(buffer, dtype=SKETCH_HEADER_DTYPE, count=1, offset=offset)[0]
+        offset += SKETCH_HEADER_DTYPE.itemsize
+        if header["kind"] == KIND_DDSKETCH:
+            sketch = cls(kind="ddsketch", alpha=float(header["param0"]))
+            n_neg = int(header["n_neg"])
+        else:
+            sketch = cls(kind="fixed", low=float(header["param0"]), high=float(header["param1"]), n_bins=-int(header["n_neg"]))
+            n_neg = 0
+        n_pos = int(header["n_pos"])
+        sketch.count, sketch.sum = int(header["count"]), float(header["sum"])
+        sketch.min, sketch.max = float(header["min"]), float(header["max"])
+        sketch.zero_count, sketch.non_finite = int(header["zero_count"]), int(header["non_finite"])
+        sketch.pos_keys = np.frombuffer(buffer, dtype="<i4", count=n_pos, offset=offset).astype(np.int32)
+        offset += 4 * n_pos
+        sketch.pos_counts = np.frombuffer(buffer, dtype="<i8", count=n_pos, offset=offset).astype(np.int64)
+        offset += 8 * n_pos
+        sketch.neg_keys = np.frombuffer(buffer, dtype="<i4", count=n_neg, offset=offset).astype(np.int32)
+        offset += 4 * n_neg
+        sketch.neg_counts = np.frombuffer(buffer, dtype="<i8", count=n_neg, offset=offset).astype(np.int64)
+        offset += 8 * n_neg
+        return int(header["index"]), float(header["time"]), sketch, offset
+
+
+def sketch_file_name(name: str) -> str:
+    """
+    Returns the file name storing the sketches of the metric name (names such as "layer/weights" are escaped).
+    """
+    return quote(name, safe="") + SKETCH_EXTENSION
+
+
+def read_sketches(path: str) -> List[Tuple[int, float, HistogramSketch]]:
+    """
+    Returns the list of (index, time, sketch) stored in the sketch file path.
+    A truncated last record (e.g. after a crash) is ignored.
+    """
+    with open(path, "rb") as f:
+        buffer = f.read()
+    records = []
+    offset = 0
+    while offset + SKETCH_HEADER_DTYPE.itemsize <= len(buffer):
+        try:
+            index, time, sketch, offset = HistogramSketch.from_buffer(buffer, offset)
+        except ValueError:
+            break
+        records.append((index, time, sketch))
+    return records
+
+
+def merge_sketch_files(paths: Iterable[str]) -> Dict[int, HistogramSketch]:
+    """
+    Merges the sketches stored in several files (e.g. one per worker or per run) by index.
+    Usage:
+    >>> merged = merge_sketch_files(glob.glob("logs/*/histograms/weights.sketches"))
+    >>> merged[10].quantile([0.01, 0.5, 0.99])
+    """
+    merged: Dict[int, HistogramSketch] = {}
+    for path in paths:
+        for index, _, sketch in read_sketches(path):
+            if index in merged:
+                merged[index].merge(sketch)
+            else:
+                merged[index] = sketch
+    return merged
+
+
+class SketchStore:
+    """
+    Appends the sketches of each metric to one file per metric in the directory
+    (at most max_open_files files are kept open, the least recently used is closed).
+    """
+
+    def __init__(self, directory: str, kind: str = "ddsketch", alpha: float = 0.01, low: float = 0., high: float = 1., n_bins: int = 64,
+                 max_open_files: int = 64):
+        self.directory: str = directory
+        self.sketch_kwargs: Dict[str, Any] = dict(kind=kind, alpha=alpha, low=low, high=high, n_bins=n_bins)
+        HistogramSketch(**self.sketch_kwargs) # Checks the parameters
+        self._files: FileHandleCache = FileHandleCache(max_open_files)
+        self._lock = threading.Lock()
+        self.bytes_written: int = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, sketch_file_name(name))
+
+    def append(self, name: str, index: int, time: float, values: Any, sketch: Optional[HistogramSketch] = None) -> HistogramSketch:
+        """
+        Computes the sketch of values (unless it is given) and appends it to the file of the metric name.
+        """
+        if sketch is None:
+            sketch = HistogramSketch.from_values(values, **self.sketch_kwargs)
+        data = sketch.to_bytes(index, time)
+        with self._lock:
+            self._files.get(self.path(name)).write(data)
+            self.bytes_written += len(data)
+        return sketch
+
+    def flush(self) -> None:
+        with self._lock:
+            self._files.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._files.close()
+
+    @staticmethod
+    def recover(directory: str) -> Dict[str, int]:
+        """
+        Prepares the store of an interrupted run to be appended to: truncates the incomplete last record of each metric (if any)
+        and returns the index of the last record of each metric.
+        """
+        last_indexes: Dict[str, int] = {}
+        if not os.path.isdir(directory):
+            return last_indexes
+        for file_name in os.listdir(directory):
+            if not file_name.endswith(SKETCH_EXTENSION):
+                continue
+            path = os.path.join(directory, file_name)
+            with open(path, "rb") as f:
+                buffer = f.read()
+            offset = 0
+            while offset + SKETCH_HEADER_DTYPE.itemsize <= len(buffer):
+                try:
+                    index, _, _, offset = HistogramSketch.from_buffer(buffer, offset)
+                except ValueError: # Incomplete record
+                    break
+                last_indexes[unquote(file_name[:-len(SKETCH_EXTENSION)])] = index
+            if offset != len(buffer):
+                os.truncate(path, offset)
+        return last_indexes
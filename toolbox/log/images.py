@@ -0,0 +1,236 @@
+from typing import Any, Callable, Optional, Set
+import concurrent.futures
+import threading
+import numpy as np
+from ..printing import warn
+from .optional import optional_import
+
+
+IMAGE_FORMATS = {"png": ".png", "webp": ".webp", "npz": ".npz"}
+
+
+def image_to_hwc(image: np.ndarray, name: str = "", index: Any = "") -> np.ndarray:
+    """
+    Converts an image (HW, HWC or CHW, with any number of channels) to an HWC image with 3 channels.
+    If image is a batch of images, only the first one is kept.
+    """
+    if len(image.shape) == 4: # Batch of images
+        image = image[0]
+        warn(f"(Image) {name} - {index}: Image is a batch of images, only the first one will be saved (use log_images to save the whole batch)")
+    if len(image.shape) == 3: # Image with channels
+        # First figure out if we are in HWC or CHW
+        # We don't know the dim of C, it could be 1 (grayscale) or 3 (RGB) or more (RGBA, RGBD, etc.)
+        # We always output HWC with shape (H, W, 3) (so we convert grayscales, and RGBA to RGB)
+        min_dim = np.argmin(image.shape) # We assume this is the channel dim
+        if min_dim == 0: # CHW -> HWC
+            image = np.transpose(image, (1, 2, 0))
+        C = image.shape[2]
+        if C == 1: # Grayscale
+            image = np.repeat(image, 3, axis=2)
+        elif C == 4: # RGBA, RGBD
+            image = image[:, :, :3]
+        elif C > 4: # Too many channels
+            image = image[:, :, :3]
+            warn(f"(Image) {name} - {index}: Image has {C} channels, only the first 3 will be saved")
+    elif len(image.shape) == 2: # Grayscale image
+        image = np.repeat(image[:, :, np.newaxis], 3, axis=2)
+    else:
+        raise ValueError(f"Image has {len(image.shape)} dimensions, only 2 or 3 are supported")
+    return image
+
+
+def batch_to_nhwc(batch: np.ndarray) -> np.ndarray:
+    """
+    Converts a batch of images (NHW, NHWC or NCHW, with any number of channels) to NHWC with 3 channels.
+    The channel dim is guessed as in image_to_hwc (the smallest of the three last dims).
+    """
+    if len(batch.shape) == 3: # Batch of grayscale images
+        return np.repeat(batch[:, :, :, np.newaxis], 3, axis=3)
+    if len(batch.shape) != 4:
+        raise ValueError(f"Batch of images has {len(batch.shape)} dimensions, only 3 or 4 are supported")
+    if np.argmin(batch.shape[1:]) == 0: # NCHW -> NHWC
+        batch = np.transpose(batch, (0, 2, 3, 1))
+    C = batch.shape[3]
+    if C == 1: # Grayscale
+        batch = np.repeat(batch, 3, axis=3)
+    elif C > 3: # RGBA, RGBD, ...
+        batch = batch[:, :, :, :3]
+    return batch
+
+
+def make_grid(batch: np.ndarray, n_cols: Optional[int] = None, padding: int = 2, pad_value: float = 0.) -> np.ndarray:
+    """
+    Tiles a NHWC batch of images into one HWC mosaic of n_cols columns (about sqrt(N) by default),
+    with padding pixels between the images. The mosaic is allocated once and filled without any python loop.
+    """
+    N, H, W, C = batch.shape
+    if n_cols is None:
+        n_cols = int(np.ceil(np.sqrt(N)))
+    n_cols = max(1, min(n_cols, N))
+    n_rows = (N + n_cols - 1) // n_cols
+    cell_h, cell_w = H + padding, W + padding
+    grid = np.full((n_rows * cell_h, n_cols * cell_w, C), pad_value, dtype=batch.dtype)
+    # View the grid as (rows, cell_h, cols, cell_w, C) to assign all the images at once
+    cells = grid.reshape(n_rows, cell_h, n_cols, cell_w, C)
+    n_full_rows = N // n_cols
+    if n_full_rows > 0:
+        cells[:n_full_rows, :H, :, :W] = batch[:n_full_rows * n_cols].reshape(n_full_rows, n_cols, H, W, C).transpose(0, 2, 1, 3, 4)
+    n_remaining = N - n_full_rows * n_cols
+    if n_remaining > 0:
+        cells[n_full_rows, :H, :n_remaining, :W] = batch[n_full_rows * n_cols:].transpose(1, 0, 2, 3)
+    # Removes the padding after the last row and column (this is a view, not a copy)
+    return grid[:grid.shape[0] - padding, :grid.shape[1] - padding]
+
+
+def _PIL_Image() -> Any:
+    Image = optional_import("PIL.Image")
+    if Image is None:
+        raise ImportError("Please install PIL to save images")
+    return Image
+
+
+def encode_image(image: np.ndarray, path: str, image_format: str = "png", compression: Optional[int] = None) -> None:
+    """
+    Saves an HWC image with values in [0, 1] to path.
+    - "png": compression is the zlib level (0-9, default 6).
+    - "webp": compression is the quality (0-100, default 80).
+    - "npz": the raw uint8 array is saved with np.savez (compression is ignored).
+    """
+    image_uint8 = (255 * image).astype(np.uint8)
+    if image_format == "npz":
+        np.savez(path, image=image_uint8)
+        return
+    Image = _PIL_Image()
+    image_PIL = Image.fromarray(image_uint8)
+    if image_format == "png":
+        image_PIL.save(path, format="PNG", compress_level=6 if compression is None else compression)
+    elif image_format == "webp":
+        image_PIL.save(path, format="WEBP", quality=80 if compression is None else compression)
+    else:
+        raise ValueError(f"Unknown image format {image_format}, should be one of {list(IMAGE_FORMATS.keys())}")
+
+
+def save_image(image: Any, path: str, image_format: str = "png", compression: Optional[int] = None,
+               name: str = "", index: Any = "", ready: Optional[Any] = None) -> None:
+    """
+    Converts image to HWC and encodes it to path (this is the job executed by the ImageEncoderPool workers).
+    If ready is not None (a torch.cuda.Event recorded after a non blocking copy of image to the host),
+    waits for it before reading image.
+    """
+    if ready is not None:
+        ready.synchronize()
+    if not isinstance(image, np.ndarray):
+        image = image.numpy()
+    encode_image(image_to_hwc(image, name, index), path, image_format, compression)
+
+
+def encode_frames(frames: np.ndarray, path: str, image_format: str = "png", compression: Optional[int] = None) -> None:
+    """
+    Saves a NHWC batch of images with values in [0, 1] as a single multi-frame file:
+    an animated PNG, an animated WebP or a npz holding the (N, H, W, 3) uint8 array.
+    """
+    frames_uint8 = (255 * frames).astype(np.uint8)
+    if image_format == "npz":
+        np.savez(path, images=frames_uint8)
+        return
+    Image = _PIL_Image()
+    images_PIL = [Image.fromarray(frame) for frame in frames_uint8]
+    if image_format == "png":
+        images_PIL[0].save(path, format="PNG", save_all=True, append_images=images_PIL[1:], compress_level=6 if compression is None else compression)
+    elif image_format == "webp":
+        images_PIL[0].save(path, format="WEBP", save_all=True, append_images=images_PIL[1:], quality=80 if compression is None else compression)
+    else:
+        raise ValueError(f"Unknown image format {image_format}, should be one of {list(IMAGE_FORMATS.keys())}")
+
+
+def save_image_batch(batch: Any, path: str, image_format: str = "png", compression: Optional[int] = None,
+                     layout: str = "grid", n_cols: Optional[int] = None, ready: Optional[Any] = None) -> None:
+    """
+    Converts a batch of images to NHWC and encodes it to path, either as one mosaic (layout="grid")
+    or as one multi-frame file (layout="separate").
+    If ready is not None, waits for it before reading batch (see save_image).
+    """
+    if ready is not None:
+        ready.synchronize()
+    if not isinstance(batch, np.ndarray):
+        batch = batch.numpy()
+    batch = batch_to_nhwc(batch)
+    if layout == "grid":
+        encode_image(make_grid(batch, n_cols), path, image_format, compression)
+    else:
+        encode_frames(batch, path, image_format, compression)
+
+
+class ImageEncoderPool:
+    """
+    Pool of threads (or processes) encoding images in the background.
+    At most max_in_flight images are pending at the same time, submit blocks when the limit is reached
+    so that the memory used by the images waiting to be encoded stays bounded.
+    """
+
+    def __init__(self, n_workers: int = 2, use_processes: bool = False, max_in_flight: int = 16):
+        assert n_workers > 0, "n_workers should be positive"
+        assert max_in_flight > 0, "max_in_flight should be positive"
+        self.use_processes: bool = use_processes
+        self.max_in_flight: int = max_in_flight
+        self.encoded: int = 0
+        self.errors: int = 0
+        if use_processes:
+            self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=n_workers)
+        else:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=n_workers, thread_name_prefix="toolbox-image-encoder")
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._pending: Set[concurrent.futures.Future] = set()
+        self._lock = threading.Lock()
+        self._last_error: Optional[BaseException] = None
+
+    @property
+    def in_flight(self) -> int:
+        """Number of images submitted and not encoded yet."""
+        return len(self._pending)
+
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> concurrent.futures.Future:
+        """
+        Runs fn(*args, **kwargs) in a worker (fn must be picklable if use_processes is True).
+        """
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def wait(self) -> None:
+        """
+        Blocks until all the submitted images are encoded.
+        Re-raises the last exception raised by a worker, if any.
+        """
+        with self._lock:
+            pending = list(self._pending)
+        concurrent.futures.wait(pending)
+        if self._last_error is not None:
+            error, self._last_error = self._last_error, None
+            raise error
+
+    def close(self) -> None:
+        """Waits for the pending images and stops the workers."""
+        try:
+            self.wait()
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def _on_done(self, future: concurrent.futures.Future) -> None:
+        with self._lock:
+            self._pending.discard(future)
+        self._slots.release()
+        error = future.exception()
+        if error is not None:
+            self.errors += 1
+            self._last_error = error
+            warn(f"(Image) {type(error).__name__} while encoding an image: {error}")
+        else:
+            self.encoded += 1
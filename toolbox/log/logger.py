@@ -1,8 +1,36 @@
-from typing import Optional, Any, Dict, Tuple, Union
+from typing import Optional, Any, Callable, Dict, Iterable, List, Sequence, Tuple, Union
 import os
 import numpy as np
 import datetime
+import atexit
+import json
+import time
+import weakref
 from ..printing import print_color, debug, sdebug, ldebug, warn
+from ..printing.profiling import Profiler
+from .async_writer import AsyncWriter
+from .text_sink import BufferedTextSink
+from .scalar_store import ScalarStore
+from .histogram_sketch import SketchStore
+from .optional import optional_import, loaded_module
+from .images import ImageEncoderPool
+from .policies import LogPolicy
+from .aggregation import WindowAggregator
+from .checkpoint import CheckpointEngine
+from .distributed import get_authkey, get_rank_and_world_size, RankAggregatorSink, RankForwardSink
+from .sinks import Sink, NullSink, FileSink, TensorboardSink, WandbSink, JSONLSink, ImageRecord, ImageBatchRecord
+
+# Name of the file saving the indexes of a run, to resume it
+INDEX_SIDECAR = "indexes.json"
+# Loggers not closed yet, closed at exit
+_open_loggers: "weakref.WeakSet[Logger]" = weakref.WeakSet()
+
+
+@atexit.register
+def _close_open_loggers() -> None:
+    for logger in list(_open_loggers):
+        logger.close()
+
 
 class Logger:
     """
@@ -10,71 +38,485 @@ class Logger:
     - If verbose is True, then the logger will print all the infos given to it.
     - If save is True, then the logger will save all the infos given to it in a file (save_path).
     - if tensorboard is True, then the logger will save all the infos given to it in a tensorboard file (tensorboard_path).
+    - If wandb is True, then the values, histograms and images are sent to wandb.
+    - If jsonl is True, then every record is also written as one JSON object per line in save_path/records.jsonl.
+    - sinks is a list of additional sinks (see toolbox.log.sinks), e.g. [NullSink()] to benchmark the logger itself.
+      Each record is built once and dispatched to the sinks handling it (add_sink adds a sink later on).
+    - If async_mode is True, then all the writes (files, images, histograms, tensorboard) are done by a background thread.
+      The queue holds at most max_queue_size records, backpressure decides what happens when it is full ("block", "drop_oldest" or "sample").
+      Call flush() to wait for all the pending records to be written and close() when you are done.
+    - The log file is written by batches: the buffer is flushed every flush_interval seconds or flush_bytes bytes,
+      fsynced every fsync_interval seconds (never if None) and rotated after max_log_bytes bytes or rotate_interval seconds.
+    - If scalar_store is True, then the values are saved in a binary columnar store (save_path/scalars) instead of log.txt,
+      use read_scalars(name) to get them back as numpy arrays.
+    - histogram_mode decides how histograms are saved: "raw" saves the values in one .npy file per call,
+      "ddsketch" (relative accuracy histogram_alpha) and "fixed" (histogram_bins bins in histogram_range) append a compact
+      mergeable sketch to one file per metric (save_path/histograms/name.sketches), see toolbox.log.histogram_sketch.
+    - If image_workers > 0, then the images are converted and encoded by a pool of image_workers threads (processes if image_processes is True),
+      with at most max_images_in_flight images pending. Cuda tensors are copied to the host without blocking.
+      image_format is "png", "webp" or "npz" (raw uint8), image_compression is the PNG level or the WebP quality.
+    - If distributed is True, then the logger is rank aware (rank and world_size are read from torch.distributed or
+      the RANK and WORLD_SIZE environment variables if not given): only rank 0 creates the save directory and writes,
+      the other ranks send their text, values and histograms to it over a socket (aggregator_address, see toolbox.log.distributed).
+      The values logged by all the ranks with the same (name, index) are reduced with reduce ("mean", "sum", "max" or "min") before being written,
+      except the ones of the names marked with set_rank_local. The connections are authenticated with TOOLBOX_LOG_AUTHKEY,
+      or with a random key shared through torch.distributed (see get_authkey).
+    - set_policy(name, ...) decides which calls of the metric name are logged (every N calls, at most X Hz,
+      K random calls out of N, or only when the value changes by more than epsilon), skipped_records counts the calls discarded.
+      set_call_policy("log" or "debug", ...) does the same for the calls of log/log_dict or of debug/sdebug/ldebug.
+    - aggregate(name, window, stats) accumulates the values of name in memory and only logs the statistics of each window
+      of values (as name/mean, name/max, ...).
+    - If resume is the save directory of a previous run (e.g. "logs/2023-01-01_12-00-00"), then the logger appends to its files
+      and the indexes, log_counter and debug_counter continue from where they were. They are read from the small sidecar
+      save_path/indexes.json, written atomically every index_checkpoint_interval seconds, by flush() and by close().
+    - save_model writes checkpoints atomically in save_path/models. If async_checkpoints is True, then the model is copied
+      to (pinned) host memory and serialized by a background thread. Checkpoints are split in shards of checkpoint_shard_bytes bytes
+      if it is not None, and only the keep_last_checkpoints last and keep_best_checkpoints best (by metric, see checkpoint_mode)
+      checkpoints are kept (see toolbox.log.checkpoint). With checkpoint_format="tensors", the checkpoints are flat tensor files
+      that load_model memory-maps, so that only the parameters loaded are read from the disk.
+    - If profile is True (or after enable_profiling()), then the latency of each logging method is recorded,
+      stats() returns (and prints) the call counts, the p50/p99 latencies and the bytes written by each sink.
+    The logger can be used as a context manager, and is closed automatically at exit otherwise.
+    Usage:
+    >>> with Logger(save_path="logs") as logger:
+    >>>     logger.log_value("loss", 0.5)
     """
 
-    def __init__(self, verbose: bool = False, save: bool = True, save_path: str = "logs", tensorboard: bool = False):
+    def __init__(self, verbose: bool = False, save: bool = True, save_path: str = "logs", tensorboard: bool = False,
+                 wandb: bool = False, jsonl: bool = False, sinks: Optional[List[Sink]] = None,
+                 async_mode: bool = False, max_queue_size: int = 1000, backpressure: str = "block", sample_every: int = 10,
+                 flush_interval: float = 1.0, flush_bytes: int = 1 << 16, fsync_interval: Optional[float] = None,
+                 max_log_bytes: Optional[int] = None, rotate_interval: Optional[float] = None, backup_count: int = 5,
+                 scalar_store: bool = False, histogram_mode: str = "raw", histogram_alpha: float = 0.01,
+                 histogram_range: Tuple[float, float] = (0., 1.), histogram_bins: int = 64,
+                 image_workers: int = 0, image_processes: bool = False, image_format: str = "png", image_compression: Optional[int] = None,
+                 max_images_in_flight: int = 16, distributed: bool = False, rank: Optional[int] = None, world_size: Optional[int] = None,
+                 reduce: str = "mean", aggregator_address: Optional[Tuple[str, int]] = None,
+                 resume: Optional[str] = None, index_checkpoint_interval: float = 30.,
+                 async_checkpoints: bool = False, checkpoint_shard_bytes: Optional[int] = None, keep_last_checkpoints: Optional[int] = None,
+                 keep_best_checkpoints: Optional[int] = None, checkpoint_mode: str = "min", checkpoint_format: str = "torch",
+                 profile: bool = False):
+        self.rank, self.world_size = get_rank_and_world_size(rank, world_size) if distributed else (0, 1)
+        if self.rank != 0:
+            # Only rank 0 writes, the other ranks send their records to it
+            save = tensorboard = wandb = jsonl = False
         self.verbose: bool = verbose
         self.save: bool = save
         self.save_path: str = save_path
         self.tensorboard: bool = tensorboard
-        self.writer: Optional[Any] = None
-        self.log_file: Optional[Any] = None
         self.log_counter: int = 0
         self.debug_counter: int = 0
         self.indexes: Dict[Tuple[str, str], int] = {} # Associates (log_type, log_name) to an index
-        # Add current datetime to the save path
-        self.save_path = os.path.join(self.save_path, datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S"))
-
-        if self.save or self.tensorboard:
-            assert self.save_path is not None, "save_path cannot be None if save is True or tensorboard is True"
-            # Creates the directory if it does not exist
-            if not os.path.exists(self.save_path):
-                os.makedirs(self.save_path)
-                if verbose: print_color("Created directory " + os.path.dirname(self.save_path), "green")
-            # Creates a log file (overwrites it if it already exists)
-            log_file_path = os.path.join(self.save_path, "log.txt")
-            self.log_file = open(log_file_path, "w")
-            self.log_file.write("")
-            if verbose: print_color("Created log file " + log_file_path, "green")
+        self.async_mode: bool = async_mode
+        self.async_writer: Optional[AsyncWriter] = None
+        self._dropped_records: int = 0 # Number of records dropped by async_writer, kept when it is closed
+        self.sinks: List[Sink] = []
+        self.file_sink: Optional[FileSink] = None
+        self.tensorboard_sink: Optional[TensorboardSink] = None
+        self.checkpoints: Optional[CheckpointEngine] = None
+        self.profiler: Profiler = Profiler()
+        self._routes: Dict[str, List[Callable[..., None]]] = {record: [] for record in Sink.RECORDS}
+        self.policies: Dict[str, LogPolicy] = {} # Associates a name to the policy deciding which of its calls are logged
+        self.call_policies: Dict[str, LogPolicy] = {} # Same for the calls of log ("log") and of the debug methods ("debug")
+        self.aggregators: Dict[str, WindowAggregator] = {} # Associates a value name to its window aggregator
+        self.index_checkpoint_interval: float = index_checkpoint_interval
+        self._index_sidecar: Optional[str] = None
+        self._next_index_checkpoint: float = float("inf")
+        if resume is not None:
+            # Continues the run saved in resume
+            if not os.path.isdir(resume):
+                raise FileNotFoundError(f"Cannot resume {resume}: the directory does not exist")
+            self.save_path = resume
+            self._load_indexes(os.path.join(resume, INDEX_SIDECAR))
+        else:
+            # Add current datetime to the save path
+            self.save_path = os.path.join(self.save_path, datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S"))
 
+        if self.save or self.tensorboard or jsonl:
+            assert self.save_path is not None, "save_path cannot be None if save, tensorboard or jsonl is True"
+            if resume is None:
+                self.save_path = Logger._make_run_dir(self.save_path)
+                if verbose: print_color("Created directory " + self.save_path, "green")
+            elif verbose:
+                print_color("Resuming " + self.save_path, "green")
+            self._index_sidecar = os.path.join(self.save_path, INDEX_SIDECAR)
+            self._next_index_checkpoint = time.monotonic() + index_checkpoint_interval
+
+        if self.save:
+            image_pool = None
+            if image_workers > 0:
+                image_pool = ImageEncoderPool(n_workers=image_workers, use_processes=image_processes, max_in_flight=max_images_in_flight)
+            self.file_sink = FileSink(self.save_path, verbose=verbose, flush_interval=flush_interval, flush_bytes=flush_bytes,
+                                      fsync_interval=fsync_interval, max_log_bytes=max_log_bytes, rotate_interval=rotate_interval,
+                                      backup_count=backup_count, scalar_store=scalar_store, histogram_mode=histogram_mode,
+                                      histogram_alpha=histogram_alpha, histogram_range=histogram_range, histogram_bins=histogram_bins,
+                                      image_pool=image_pool, image_format=image_format, image_compression=image_compression,
+                                      append=resume is not None)
+            if resume is not None and self.file_sink.scalar_store is not None:
+                # The sidecar may be older than the last values written
+                for name, last_index in ScalarStore.recover(self.file_sink.scalar_store.directory).items():
+                    key = ("value", name)
+                    self.indexes[key] = max(self.indexes.get(key, -1), last_index)
+            if resume is not None and self.file_sink.sketch_store is not None:
+                for name, last_index in SketchStore.recover(self.file_sink.sketch_store.directory).items():
+                    key = ("histogram", name)
+                    self.indexes[key] = max(self.indexes.get(key, -1), last_index)
+            self.add_sink(self.file_sink)
+            self.checkpoints = CheckpointEngine(os.path.join(self.save_path, "models"), async_mode=async_checkpoints,
+                                                shard_bytes=checkpoint_shard_bytes, keep_last=keep_last_checkpoints,
+                                                keep_best=keep_best_checkpoints, mode=checkpoint_mode, file_format=checkpoint_format)
         if self.tensorboard:
+            self.tensorboard_sink = TensorboardSink(self.save_path, verbose=verbose)
+            self.add_sink(self.tensorboard_sink)
+        if wandb:
+            self.add_sink(WandbSink())
+        if jsonl:
+            self.add_sink(JSONLSink(os.path.join(self.save_path, "records.jsonl"), flush_interval=flush_interval,
+                                    flush_bytes=flush_bytes, fsync_interval=fsync_interval, append=resume is not None))
+        if self.world_size > 1:
+            authkey = get_authkey(self.rank)
+            if self.rank == 0:
+                # The sinks above now receive the records of all the ranks, reduced by the aggregator
+                aggregator = RankAggregatorSink(self.sinks, self.world_size, reduce=reduce, address=aggregator_address, authkey=authkey)
+                self.sinks = []
+                self._routes = {record: [] for record in Sink.RECORDS}
+                self.add_sink(aggregator)
+            else:
+                self.add_sink(RankForwardSink(self.rank, address=aggregator_address, flush_interval=flush_interval, authkey=authkey))
+        for sink in sinks or []:
+            self.add_sink(sink)
+
+        if self.async_mode:
+            self.async_writer = AsyncWriter(max_queue_size=max_queue_size, backpressure=backpressure, sample_every=sample_every)
+
+        if profile:
+            self.enable_profiling()
+
+        # Makes sure that nothing is lost if the user forgets to call close(): close() is called at exit if the logger is alive,
+        # and its background thread, checkpoints and sinks are closed if it is garbage collected before (the registry and
+        # the finalizer only hold weak references to the logger, so that it can be collected)
+        _open_loggers.add(self)
+        self._finalizer = weakref.finalize(self, Logger._release, self.async_writer, self.checkpoints, self.sinks)
+        self._finalizer.atexit = False
+
+    @staticmethod
+    def _make_run_dir(path: str) -> str:
+        """
+        Creates the directory path, or path_1, path_2, ... if it already exists (several runs started in the same second),
+        and returns it. The creation is atomic, so two processes never get the same directory.
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        run_dir, i = path, 0
+        while True:
             try:
-                from torch.utils.tensorboard import SummaryWriter
-                self.writer = SummaryWriter(log_dir=self.save_path)
-                if verbose: print_color("Created tensorboard writer", "green")
-                # Gives instruction on how to use tensorboard
-                print_color("To use tensorboard, run the following command in a terminal:", "bold")
-                print_color("tensorboard --logdir=" + save_path, "bold")
-                print_color("Then open the following link in a browser:", "bold")
-                print_color("http://localhost:6006/", "bold")
-            except ImportError:
-                raise ImportError("Please install tensorboard to use it")
-        
+                os.mkdir(run_dir)
+                return run_dir
+            except FileExistsError:
+                i += 1
+                run_dir = f"{path}_{i}"
+
+    def _load_indexes(self, path: str) -> None:
+        """Restores the indexes and counters saved by save_indexes (nothing is restored if the sidecar does not exist)."""
+        if not os.path.exists(path):
+            warn(f"(Logger) No index sidecar in {os.path.dirname(path)}, the indexes restart from 0")
+            return
+        with open(path, "r") as f:
+            state = json.load(f)
+        self.indexes = {(log_type, name): index for log_type, name, index in state["indexes"]}
+        self.log_counter = state["log_counter"]
+        self.debug_counter = state["debug_counter"]
+
+    def save_indexes(self) -> None:
+        """
+        Writes the indexes and counters in the sidecar save_path/indexes.json (used by resume).
+        The file is replaced atomically, so that a crash never leaves a partial sidecar.
+        """
+        self._next_index_checkpoint = time.monotonic() + self.index_checkpoint_interval
+        if self._index_sidecar is None:
+            return
+        state = {"indexes": [[log_type, name, index] for (log_type, name), index in self.indexes.items()],
+                 "log_counter": self.log_counter, "debug_counter": self.debug_counter}
+        tmp_path = self._index_sidecar + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self._index_sidecar)
+
+    def add_sink(self, sink: Sink) -> None:
+        """
+        Adds a sink: all the records logged from now on that the sink handles are dispatched to it.
+        """
+        self.sinks.append(sink)
+        for record in Sink.RECORDS:
+            if sink.handles(record):
+                self._routes[record].append(getattr(sink, record))
+
+    # Methods timed by the profiler (debug, sdebug and ldebug time themselves, as wrapping them would change the names they print)
+    PROFILED_METHODS = ("log", "log_dict", "log_value", "log_values", "log_value_array", "log_image", "log_images",
+                        "log_histogram", "log_graph", "save_model", "load_model", "flush")
+
+    def enable_profiling(self, enabled: bool = True) -> None:
+        """
+        Starts (or stops) recording the latency of the logging methods.
+        The methods are only wrapped while profiling is enabled, so profiling costs nothing when it is disabled.
+        """
+        self.profiler.enabled = enabled
+        for name in Logger.PROFILED_METHODS:
+            if enabled and name not in self.__dict__:
+                setattr(self, name, self.profiler.wrap(name, getattr(self, name)))
+            elif not enabled and name in self.__dict__:
+                delattr(self, name)
+
+    def stats(self, display: bool = False) -> Dict[str, Any]:
+        """
+        Returns the report of the profiler: {"calls": {method: {"count", "total_ms", "mean_us", "p50_us", "p99_us", "max_us"}},
+        "bytes_written": {sink: bytes}}, plus the queue depth and the number of records dropped and skipped.
+        If display is True, the report is also printed.
+        Usage:
+        >>> logger = Logger(profile=True)
+        >>> ...
+        >>> logger.stats(display=True)
+        """
+        self.profiler.bytes_written = {type(sink).__name__: sink.bytes_written for sink in self.sinks if sink.bytes_written is not None}
+        if display:
+            report = self.profiler.print_report("Logger stats")
+        else:
+            report = self.profiler.report()
+        report.update(queue_depth=self.queue_depth, dropped_records=self.dropped_records, skipped_records=sum(self.skipped_records.values()))
+        return report
+
+    def set_policy(self, name: str, every: Optional[int] = None, max_hz: Optional[float] = None, sample: Optional[Tuple[int, int]] = None,
+                   epsilon: Optional[float] = None) -> LogPolicy:
+        """
+        Sets the policy deciding which calls of name (a value, histogram or image) are logged (see LogPolicy), replacing the previous one.
+        The policy is checked before anything is formatted, the calls skipped only cost a dict lookup and the check.
+        Skipped calls still increment the automatic index, so that the index keeps counting the calls.
+        If no condition is given, the policy of name is removed.
+        Usage:
+        >>> logger.set_policy("loss", every=100)
+        """
+        return Logger._set_policy(self.policies, name, LogPolicy(every=every, max_hz=max_hz, sample=sample, epsilon=epsilon))
+
+    def set_call_policy(self, call: str, every: Optional[int] = None, max_hz: Optional[float] = None, sample: Optional[Tuple[int, int]] = None,
+                        epsilon: Optional[float] = None) -> LogPolicy:
+        """
+        Same as set_policy for the calls of log and log_dict (call="log") or of debug, sdebug and ldebug (call="debug"),
+        kept apart from the policies of the metrics (a metric can be named "log").
+        Usage:
+        >>> logger.set_call_policy("debug", max_hz=1.)
+        """
+        if call not in ("log", "debug"):
+            raise ValueError(f"Unknown call {call}, should be log or debug")
+        return Logger._set_policy(self.call_policies, call, LogPolicy(every=every, max_hz=max_hz, sample=sample, epsilon=epsilon))
+
+    @staticmethod
+    def _set_policy(policies: Dict[str, LogPolicy], name: str, policy: LogPolicy) -> LogPolicy:
+        if policy.every is None and policy.max_hz is None and policy.sample is None and policy.epsilon is None:
+            policies.pop(name, None)
+        else:
+            policies[name] = policy
+        return policy
+
+    def set_rank_local(self, name: str, local: bool = True) -> None:
+        """
+        Marks the values and histograms of name as logged by a single rank (e.g. the learning rate logged by rank 0 only):
+        in a distributed logger, they are written as soon as they are received instead of waiting for the other ranks.
+        Usage:
+        >>> logger.set_rank_local("lr")
+        """
+        for sink in self.sinks:
+            if isinstance(sink, (RankAggregatorSink, RankForwardSink)):
+                sink.set_rank_local(name, local)
+
+    def aggregate(self, name: str, window: Optional[int] = 100, stats: Sequence[str] = ("mean", "max", "ema"),
+                  ema_alpha: Optional[float] = None) -> Optional[WindowAggregator]:
+        """
+        Accumulates the values logged with name in a ring buffer of window values instead of logging them.
+        Every window values, the statistics stats (among "mean", "min", "max", "std", "sum", "last" and "ema") are logged
+        as name/stat, with the index of the last value of the window. The last window is logged by close() even if it is not full.
+        If window is None, the values of name are logged again as they come.
+        Usage:
+        >>> logger.aggregate("loss", window=100, stats=("mean", "max", "ema"))
+        """
+        if window is None:
+            self.aggregators.pop(name, None)
+            return None
+        aggregator = WindowAggregator(window=window, stats=stats, ema_alpha=ema_alpha)
+        self.aggregators[name] = aggregator
+        return aggregator
+
+    def _aggregate(self, name: str, index: int, value: float) -> List[Tuple[str, int, float]]:
+        """Adds value to the aggregator of name and returns the records to log (none until the window is full)."""
+        summary = self.aggregators[name].add(value)
+        if summary is None:
+            return []
+        return [(name + "/" + stat, index, stat_value) for stat, stat_value in summary.items()]
+
+    @property
+    def skipped_records(self) -> Dict[str, int]:
+        """Number of calls discarded by the policy of each name (and of each call type, as "log()" or "debug()")."""
+        skipped = {name: policy.skipped for name, policy in self.policies.items()}
+        skipped.update({call + "()": policy.skipped for call, policy in self.call_policies.items()})
+        return skipped
+
+    @property
+    def writer(self) -> Optional[Any]:
+        """The tensorboard SummaryWriter (None if tensorboard is False)."""
+        return self.tensorboard_sink.writer if self.tensorboard_sink is not None else None
+
+    @property
+    def log_file(self) -> Optional[BufferedTextSink]:
+        """The log.txt file (None if save is False)."""
+        return self.file_sink.log_file if self.file_sink is not None else None
+
+    @property
+    def scalar_store(self) -> Optional[ScalarStore]:
+        return self.file_sink.scalar_store if self.file_sink is not None else None
+
+    @property
+    def sketch_store(self) -> Optional[SketchStore]:
+        return self.file_sink.sketch_store if self.file_sink is not None else None
+
+    @property
+    def image_pool(self) -> Optional[ImageEncoderPool]:
+        return self.file_sink.image_pool if self.file_sink is not None else None
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of records waiting to be written by the background thread (always 0 if async_mode is False)."""
+        return self.async_writer.queue_depth if self.async_writer is not None else 0
+
+    @property
+    def dropped_records(self) -> int:
+        """Number of records discarded by the backpressure policy (always 0 if async_mode is False), still available after close()."""
+        return self.async_writer.dropped if self.async_writer is not None else self._dropped_records
+
+    @staticmethod
+    def _fan_out(handlers: List[Callable[..., None]], *args: Any) -> None:
+        for handler in handlers:
+            handler(*args)
+
+    def _dispatch(self, handlers: List[Callable[..., None]], *args: Any) -> None:
+        """
+        Sends a record to all its handlers, in one job of the background thread if async_mode is True.
+        """
+        if time.monotonic() > self._next_index_checkpoint:
+            self.save_indexes()
+        if self.async_writer is not None:
+            self.async_writer.submit(Logger._fan_out, handlers, *args)
+        else:
+            for handler in handlers:
+                handler(*args)
+
+    def _snapshot(self, array: Any, force: bool = False) -> Any:
+        """
+        Returns a copy of the numpy array (or a numpy copy of the torch tensor) if it is going to be written later
+        by the background thread (or if force is True), so that the caller can safely modify it in place.
+        """
+        if not force and self.async_writer is None:
+            return array
+        if isinstance(array, np.ndarray):
+            return np.array(array, copy=True)
+        torch = loaded_module("torch")
+        if torch is not None and isinstance(array, torch.Tensor):
+            return np.array(array.detach().cpu().numpy(), copy=True)
+        return array
+
+    def flush(self) -> None:
+        """
+        Waits for all the pending records to be written and flushes all the sinks.
+        """
+        self.save_indexes()
+        if self.async_writer is not None:
+            self.async_writer.flush()
+        if self.checkpoints is not None:
+            self.checkpoints.wait()
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self) -> None:
+        """
+        Writes all the pending records then closes the background thread and the sinks.
+        Calling close several times is allowed.
+        """
+        _open_loggers.discard(self)
+        self._finalizer.detach()
+        # Logs the windows that are not full
+        for name, aggregator in self.aggregators.items():
+            if len(aggregator) > 0:
+                index = self.indexes[("value", name)]
+                self._log_records([(name + "/" + stat, index, stat_value) for stat, stat_value in aggregator.summary().items()], verbose=False)
+        async_writer, sinks = self.async_writer, self.sinks
+        self.async_writer = None
+        self.sinks = []
+        self._routes = {record: [] for record in Sink.RECORDS}
+        try:
+            Logger._release(async_writer, self.checkpoints, sinks)
+        finally:
+            if async_writer is not None:
+                self._dropped_records = async_writer.dropped
+            if sinks:
+                self.save_indexes()
+
+    @staticmethod
+    def _release(async_writer: Optional[AsyncWriter], checkpoints: Optional[CheckpointEngine], sinks: List[Sink]) -> None:
+        """
+        Closes the resources of a logger (also used when it is garbage collected without close(), so takes no reference to it).
+        Every resource is closed even if another one fails (e.g. a background job raised), then the first error is raised.
+        """
+        closers = ([async_writer.close] if async_writer is not None else []) + \
+                  ([checkpoints.close] if checkpoints is not None else []) + [sink.close for sink in sinks]
+        error = None
+        for close in closers:
+            try:
+                close()
+            except Exception as e:
+                if error is None:
+                    error = e
+        if error is not None:
+            raise error
+
+    def __enter__(self) -> "Logger":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def _log_text(self, tag: str, text: str) -> None:
+        handlers = self._routes["text"]
+        if handlers:
+            if tag == "log":
+                self._dispatch(handlers, tag, text, self.log_counter)
+                self.log_counter += 1
+            else:
+                self._dispatch(handlers, tag, text, self.debug_counter)
+                self.debug_counter += 1
+
+    def _message(self, text: str) -> None:
+        handlers = self._routes["message"]
+        if handlers:
+            self._dispatch(handlers, text)
+
     def log(self, message: str, verbose: Optional[bool] = None, color: Optional[str] = None) -> None:
         """
         Logs a message depending on the parameters given to the function.
         """
+        policy = self.call_policies.get("log")
+        if policy is not None and not policy.allow(): return
         _verbose = (verbose is not None and verbose) or (verbose is None and self.verbose)
         if _verbose:
             print_color("(Log) " + message, color)
-        if self.save:
-            self.log_file.write("(Log) " + message + "\n")
-        if self.tensorboard:
-            self.writer.add_text("log", message, self.log_counter)
-            self.log_counter += 1
+        self._log_text("log", message)
 
     def log_dict(self, dictionary: dict, verbose: Optional[bool] = None, color: Optional[str] = None) -> None:
         """
         Logs a dictionary depending on the parameters given to the function.
         """
+        policy = self.call_policies.get("log")
+        if policy is not None and not policy.allow(): return
         _verbose = (verbose is not None and verbose) or (verbose is None and self.verbose)
         if _verbose:
             print_color("(Log) " + str(dictionary), color)
-        if self.save:
-            self.log_file.write("(Log) " + str(dictionary) + "\n")
-        if self.tensorboard:
-            self.writer.add_text("log", str(dictionary), self.log_counter)
-            self.log_counter += 1
+        self._log_text("log", str(dictionary))
 
     def log_value(self, name: str, value: float, index: Optional[int] = None, verbose: Optional[bool] = None, color: Optional[str] = None) -> None:
         """
@@ -88,74 +530,122 @@ class Logger:
         if index is None:
             index = self.indexes[key] + 1
         self.indexes[key] = index
+        policy = self.policies.get(name)
+        if policy is not None and not policy.allow(value): return
+        if self.aggregators and name in self.aggregators:
+            records = self._aggregate(name, index, value)
+            if records:
+                self._log_records(records, verbose, color)
+            return
 
         _verbose = (verbose is not None and verbose) or (verbose is None and self.verbose)
         if _verbose:
             print_color(f"(Value) {name} - {index}: {value}", color)
-        if self.save:
-            self.log_file.write(f"(Value) {name} - {index}: {value}\n")
-        if self.tensorboard:
-            self.writer.add_scalar(name, value, index)
+        handlers = self._routes["scalars"]
+        if handlers:
+            self._dispatch(handlers, [(name, index, value)], time.time())
+
+    def _log_records(self, records: List[Tuple[str, int, float]], verbose: Optional[bool] = None, color: Optional[str] = None) -> None:
+        """Prints (if verbose) and logs a batch of (name, index, value) records."""
+        _verbose = (verbose is not None and verbose) or (verbose is None and self.verbose)
+        if _verbose:
+            print_color("\n".join([f"(Value) {name} - {i}: {value}" for name, i, value in records]), color)
+        handlers = self._routes["scalars"]
+        if handlers:
+            self._dispatch(handlers, records, time.time())
 
-    def _log_image_torch(self, name: str, image: Any, images_path: str, index: int) -> None:
-        return self._log_image_numpy(name, image.cpu().detach().numpy(), images_path, index)
-    
-    def _log_image_numpy(self, name: str, image: Any, images_path: str, index: int) -> None:
+    def log_values(self, values: Dict[str, float], index: Optional[int] = None, verbose: Optional[bool] = None, color: Optional[str] = None) -> None:
         """
-        Logs an image depending on the parameters given to the function.
+        Logs several numerical values at once, equivalent to calling log_value for each (name, value) but much cheaper:
+        the values are written as one batched record and sent to tensorboard in one pass.
+        If index is None, each metric uses its own automatically incremented index.
+        Usage:
+        >>> logger.log_values({"loss": 0.5, "accuracy": 0.9}, index=10)
         """
-        # Reshape image if needed
-        if len(image.shape) == 4: # Batch of images
-            image = image[0]
-            warn(f"(Image) {name} - {index}: Image is a batch of images, only the first one will be saved")
-        if len(image.shape) == 3: # Image with channels
-            # First figure out if we are in HWC or CHW
-            # We don't know the dim of C, it could be 1 (grayscale) or 3 (RGB) or more (RGBA, RGBD, etc.)
-            # We always output HWC with shape (H, W, 3) (so we convert grayscales, and RGBA to RGB)
-            min_dim = np.argmin(image.shape) # We assume this is the channel dim
-            if min_dim == 0: # CHW -> HWC
-                image = np.transpose(image, (1, 2, 0))
-            C = image.shape[2]
-            if C == 1: # Grayscale
-                image = np.repeat(image, 3, axis=2)
-            elif C == 4: # RGBA, RGBD
-                image = image[:, :, :3]
-            elif C > 4: # Too many channels
-                image = image[:, :, :3]
-                warn(f"(Image) {name} - {index}: Image has {C} channels, only the first 3 will be saved")
-        elif len(image.shape) == 2: # Grayscale image
-            image = np.repeat(image[:, :, np.newaxis], 3, axis=2)
-        else:
-            raise ValueError(f"Image has {len(image.shape)} dimensions, only 2 or 3 are supported")
+        indexes = self.indexes
+        policies = self.policies
+        aggregators = self.aggregators
+        records = []
+        for name, value in values.items():
+            key = ("value", name)
+            if index is None:
+                i = indexes.get(key, -1) + 1
+            else:
+                i = index
+            indexes[key] = i
+            if policies:
+                policy = policies.get(name)
+                if policy is not None and not policy.allow(value): continue
+            if aggregators and name in aggregators:
+                records.extend(self._aggregate(name, i, value))
+                continue
+            records.append((name, i, value))
+        if records:
+            self._log_records(records, verbose, color)
 
-        if self.save:
-            try:
-                from PIL import Image
-                # Saves the image
-                image_path = os.path.join(images_path, name + "_" + str(index) + ".png")
-                image_PIL = Image.fromarray((255 *image).astype(np.uint8))
-                image_PIL.save(image_path)
-            except ImportError:
-                warn("Please install PIL to save images")
-        if self.tensorboard:
-            self.writer.add_image(name, image, index, dataformats="HWC")
+    def log_value_array(self, name: str, values: Any, start_index: Optional[int] = None, verbose: Optional[bool] = None, color: Optional[str] = None) -> None:
+        """
+        Logs a 1D array of values of the metric name, with indexes start_index, start_index + 1, ...
+        If start_index is None, the array starts right after the last index logged for this metric.
+        Usage:
+        >>> logger.log_value_array("loss", np.array([0.5, 0.4, 0.3]), start_index=0)
+        """
+        values = np.asarray(values).ravel()
+        key = ("value", name)
+        if start_index is None:
+            start_index = self.indexes.get(key, -1) + 1
+        if len(values) == 0:
+            return
+        self.indexes[key] = start_index + len(values) - 1
+        # The policy decides for the whole array
+        policy = self.policies.get(name)
+        if policy is not None and not policy.allow(): return
+        if self.aggregators and name in self.aggregators:
+            # Only the summaries of the windows completed by the array are logged
+            records = [(name + "/" + stat, start_index + position, stat_value)
+                       for position, summary in self.aggregators[name].add_many(values) for stat, stat_value in summary.items()]
+            if records:
+                self._log_records(records, verbose, color)
+            return
+
+        _verbose = (verbose is not None and verbose) or (verbose is None and self.verbose)
+        if _verbose:
+            print_color("\n".join([f"(Value) {name} - {start_index + i}: {value}" for i, value in enumerate(values.tolist())]), color)
+        handlers = self._routes["scalar_array"]
+        if handlers:
+            self._dispatch(handlers, name, start_index, self._snapshot(values), time.time())
 
-    def _log_image_PIL(self, name: str, image: Any, images_path: str, index: int) -> None:
+    def read_scalars(self, name: str, mmap: bool = False) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """
-        Logs an image depending on the parameters given to the function.
+        Returns the arrays (indexes, times, values) logged with log_value(name, ...) when scalar_store is True.
+        The pending records are flushed first. If mmap is True, the arrays are memory-mapped instead of loaded.
+        Use ScalarStore.read(os.path.join(save_path, "scalars"), name) to read the scalars of another run.
         """
-        if self.save:
-            image_path = os.path.join(images_path, name + "_" + str(index) + ".png")
-            image.save(image_path)
-        if self.tensorboard:
-            # Convert PIL image to numpy array
-            image_np = np.array(image)
-            # Shape must be (H, W, C)
-            if len(image_np.shape) == 2: # Grayscale image
-                image_np = np.repeat(image_np[:, :, np.newaxis], 3, axis=2)
-            # Go from 0-255 int to 0-1 float
-            image_np = image_np.astype(np.float32) / 255
-            self.writer.add_image(name, image_np, index, dataformats="HWC")
+        assert self.scalar_store is not None, "read_scalars requires save=True and scalar_store=True"
+        if self.async_writer is not None:
+            self.async_writer.flush()
+        self.scalar_store.flush()
+        return ScalarStore.read(self.scalar_store.directory, name, mmap=mmap)
+
+    def _tensor_to_host(self, tensor: Any) -> Tuple[Any, Optional[Any]]:
+        """
+        Copies a torch tensor to the host.
+        If the copy can be done by the image workers, the copy is non blocking and (pinned tensor, cuda event to wait for) is returned.
+        Otherwise, returns (numpy array, None).
+        """
+        tensor = tensor.detach()
+        if self.image_pool is not None and not self.image_pool.use_processes and tensor.is_cuda:
+            torch = loaded_module("torch")
+            # Non blocking copy to pinned memory, the worker waits for the copy to be done before encoding the image
+            tensor_host = torch.empty(tensor.shape, dtype=tensor.dtype, pin_memory=True)
+            tensor_host.copy_(tensor, non_blocking=True)
+            ready = torch.cuda.Event()
+            ready.record()
+            return tensor_host, ready
+        array = tensor.cpu().numpy()
+        if not tensor.is_cuda: # numpy() shares the memory of a cpu tensor
+            array = self._snapshot(array, force=self.image_pool is not None)
+        return array, None
 
     def log_image(self, name: str, image: Any, index: Optional[int] = None, verbose: Optional[bool] = None, color: Optional[str] = None) -> None:
         """
@@ -167,54 +657,99 @@ class Logger:
         if index is None:
             index = self.indexes[key] + 1
         self.indexes[key] = index
+        policy = self.policies.get(name)
+        if policy is not None and not policy.allow(): return
 
         _verbose = (verbose is not None and verbose) or (verbose is None and self.verbose)
-        if _verbose and not self.save and not self.tensorboard:
-            warn(f"(Image) {name} - {index}: Not saved as save and tensorboard are False")
-        images_path = os.path.join(self.save_path, "images")
-        if self.save:
-            # Save the image in the save_path/images folder
-            # First, creates the directory if it does not exist
-            if not os.path.exists(images_path):
-                os.makedirs(images_path)
-                if _verbose: print_color("(Image) Created directory " + os.path.dirname(images_path), ["green", "bold"])
-
-        # Call the correct function depending on the type of image
-        logged = False
+        handlers = self._routes["image"]
+        if not handlers:
+            if _verbose: warn(f"(Image) {name} - {index}: Not saved as no sink handles images")
+            return
+
+        # Build the record depending on the type of image
+        # PIL and torch are never imported here: if they are not loaded yet, image cannot be a PIL image or a tensor
+        record = None
         if isinstance(image, np.ndarray):
-            self._log_image_numpy(name, image, images_path, index)
-            logged = True
+            # The image pool encodes the image later, so the image is copied
+            record = ImageRecord(name, index, self._snapshot(image, force=self.image_pool is not None))
         else:
-            try:
-                from PIL import Image
-                if isinstance(image, Image.Image):
-                    self._log_image_PIL(name, image, images_path, index)
-                    logged = True
-            except ImportError:
-                pass
-            if not logged:
-                try:
-                    import torch
-                    if isinstance(image, torch.Tensor):
-                        self._log_image_torch(name, image, images_path, index)
-                        logged = True
-                except ImportError:
-                    pass
-        if not logged:
+            PIL_Image = loaded_module("PIL.Image")
+            if PIL_Image is not None and isinstance(image, PIL_Image.Image):
+                record = ImageRecord(name, index, image.copy() if self.async_writer is not None or self.image_pool is not None else image, is_PIL=True)
+            else:
+                torch = loaded_module("torch")
+                if torch is not None and isinstance(image, torch.Tensor):
+                    image, ready = self._tensor_to_host(image)
+                    record = ImageRecord(name, index, image, ready=ready)
+        if record is None:
             raise ValueError(f"Image type {type(image)} not supported or the library is not installed")
+        self._dispatch(handlers, record)
 
         # Log confirmation
         if _verbose:
-            if self.save:
-                print_color(f"(Image) {name} - {index}: Saved in {images_path}", color)
-            if self.tensorboard:
+            if self.file_sink is not None:
+                print_color(f"(Image) {name} - {index}: Saved in {self.file_sink.images_dir}", color)
+            if self.tensorboard_sink is not None:
                 print_color(f"(Image) {name} - {index}: Logged in tensorboard", color)
-        if self.save:
-            self.log_file.write(f"(Image) {name} - {index}: Saved in {images_path}\n")
 
-    def log_histogram(self, name: str, values: np.ndarray, index: Optional[int] = None, verbose: Optional[bool] = None, color: Optional[str] = None) -> None:
+    def log_images(self, name: str, images: Any, index: Optional[int] = None, layout: str = "grid", max_images: Optional[int] = None,
+                   n_cols: Optional[int] = None, verbose: Optional[bool] = None, color: Optional[str] = None) -> None:
+        """
+        Logs a batch of images (numpy array or torch tensor of shape NHW, NHWC or NCHW, or a list of images of the same shape).
+        - layout="grid": the images are tiled in one mosaic of n_cols columns (about sqrt(N) by default).
+        - layout="separate": the images are saved in one multi-frame file (animated PNG/WebP, or one npz).
+        Only the first max_images images are logged if max_images is not None.
+        Usage:
+        >>> logger.log_images("samples", batch, layout="grid", max_images=16)
+        """
+        if layout not in ("grid", "separate"):
+            raise ValueError(f"Unknown layout {layout}, should be grid or separate")
+        # Saves the index
+        key = ("image", name)
+        if key not in self.indexes: self.indexes[key] = -1
+        if index is None:
+            index = self.indexes[key] + 1
+        self.indexes[key] = index
+        policy = self.policies.get(name)
+        if policy is not None and not policy.allow(): return
+
+        _verbose = (verbose is not None and verbose) or (verbose is None and self.verbose)
+        handlers = self._routes["images"]
+        if not handlers:
+            if _verbose: warn(f"(Images) {name} - {index}: Not saved as no sink handles images")
+            return
+
+        copy = False
+        if isinstance(images, (list, tuple)):
+            images = np.stack([np.asarray(image) for image in images])
+        elif not isinstance(images, np.ndarray):
+            torch = loaded_module("torch")
+            if torch is None or not isinstance(images, torch.Tensor):
+                raise ValueError(f"Images type {type(images)} not supported or the library is not installed")
+        else:
+            copy = True
+        if max_images is not None:
+            images = images[:max_images]
+        ready = None
+        if not isinstance(images, np.ndarray):
+            images, ready = self._tensor_to_host(images)
+        elif copy:
+            images = self._snapshot(images, force=self.image_pool is not None)
+        self._dispatch(handlers, ImageBatchRecord(name, index, images, layout=layout, n_cols=n_cols, ready=ready))
+
+        # Log confirmation
+        if _verbose:
+            if self.file_sink is not None:
+                print_color(f"(Images) {name} - {index}: {len(images)} images saved in {self.file_sink.image_path(name, index)}", color)
+            if self.tensorboard_sink is not None:
+                print_color(f"(Images) {name} - {index}: {len(images)} images logged in tensorboard", color)
+
+    def log_histogram(self, name: str, values: np.ndarray, index: Optional[int] = None, verbose: Optional[bool] = None, color: Optional[str] = None,
+                      raw: bool = False) -> None:
         """
         Logs an histogram depending on the parameters given to the function.
+        If histogram_mode is not "raw", a sketch of the values is appended to the file of the metric,
+        the values themselves are only saved if raw is True.
         """
         # Saves the index
         key = ("histogram", name)
@@ -222,105 +757,107 @@ class Logger:
         if index is None:
             index = self.indexes[key] + 1
         self.indexes[key] = index
+        policy = self.policies.get(name)
+        if policy is not None and not policy.allow(): return
 
         _verbose = (verbose is not None and verbose) or (verbose is None and self.verbose)
-        if _verbose and not self.save and not self.tensorboard:
-            warn(f"(Histogram) {name} - {index}: Not saved as save and tensorboard are False")
-        if self.save:
-            # Save the histogram in the save_path/histograms folder
-            # First, creates the directory if it does not exist
-            histograms_dir = os.path.join(self.save_path, "histograms")
-            if not os.path.exists(histograms_dir):
-                os.makedirs(histograms_dir)
-                if _verbose: print_color("(Histogram) Created directory " + histograms_dir, ["green", "bold"])
-            # Then, saves the histogram
-            histogram_path = os.path.join(histograms_dir, f"{name}_{index}.npy")
-            np.save(histogram_path, values)
-            if _verbose: print_color(f"(Histogram) Saved at {histogram_path}", color)
-            # Finally, logs the histogram path
-            self.log_file.write(f"(Histogram) {name} - {index}: Saved at {histogram_path}\n")
-        if self.tensorboard:
-            self.writer.add_histogram(name, values, index)
-            if _verbose: print_color(f"(Histogram) Logged {name} - {index}", color)
+        handlers = self._routes["histogram"]
+        if not handlers:
+            if _verbose: warn(f"(Histogram) {name} - {index}: Not saved as no sink handles histograms")
+            return
+        self._dispatch(handlers, name, index, self._snapshot(values), time.time(), raw)
+        if _verbose:
+            if self.file_sink is not None:
+                print_color(f"(Histogram) {name} - {index}: Saved in {self.file_sink.histograms_dir}", color)
+            if self.tensorboard_sink is not None:
+                print_color(f"(Histogram) Logged {name} - {index}", color)
 
     def log_graph(self, model: Any, input_size: Tuple[int, ...], verbose: bool = False, color: Optional[str] = None) -> None:
         """
         Logs a graph depending on the parameters given to the function.
         """
         _verbose = (verbose is not None and verbose) or (verbose is None and self.verbose)
-        if _verbose and not self.tensorboard:
-            warn("(Graph) Graphs can only be displayed in tensorboard.")
-        elif self.tensorboard:
-            try:
-                import torch
-                self.writer.add_graph(model, torch.zeros(input_size))
-                if _verbose: print_color("(Graph) Logged graph to tensorboard", color)
-                if self.save: self.log_file.write("(Graph) Logged graph to tensorboard\n")
-            except ImportError:
-                raise ImportError("Please install torch to log graphs")
-        elif self.save:
-            self.log_file.write("(Graph) Graphs can only be displayed in tensorboard.\n")
+        handlers = self._routes["graph"]
+        if not handlers:
+            if _verbose: warn("(Graph) Graphs can only be displayed in tensorboard.")
+            self._message("(Graph) Graphs can only be displayed in tensorboard.")
+            return
+        # The model is traced right away (not in the background thread) as it may be modified by the caller
+        for handler in handlers:
+            handler(model, input_size)
+        if _verbose: print_color("(Graph) Logged graph to tensorboard", color)
+        self._message("(Graph) Logged graph to tensorboard")
 
-    def save_model(self, model: Any, index: Union[str,int], verbose: Optional[bool] = None, color: Optional[str] = None) -> None:
+    def save_model(self, model: Any, index: Union[str,int], verbose: Optional[bool] = None, color: Optional[str] = None,
+                   metric: Optional[float] = None) -> None:
         """
-        Saves a model
+        Saves a model (its state dict) in save_path/models.
+        metric is used to keep the best checkpoints (see keep_best_checkpoints).
+        If async_checkpoints is True, the model is written in the background and can be modified as soon as save_model returns.
         """
         _verbose = (verbose is not None and verbose) or (verbose is None and self.verbose)
         if _verbose and not self.save:
             warn("(Model) Models can only be saved if save is True.")
         elif self.save:
-            try:
-                import torch
-                # Save the model in the save_path/models folder
-                # First, creates the directory if it does not exist
-                models_dir = os.path.join(self.save_path, "models")
-                if not os.path.exists(models_dir):
-                    os.makedirs(models_dir)
-                    if _verbose: print_color("(Model) Created directory " + models_dir, ["green", "bold"])
-                # Then, saves the model
-                model_path = os.path.join(models_dir, f"model_{index}.pt")
-                torch.save(model.state_dict(), model_path)
-                if _verbose: print_color(f"(Model) Saved at {model_path}", color)
-                # Finally, logs the model path
-                self.log_file.write(f"(Model) {index}: Saved at {model_path}\n")
-            except ImportError:
+            if optional_import("torch") is None:
                 raise ImportError("Please install torch to save models")
+            model_path = self.checkpoints.save(model.state_dict(), index, metric=metric)
+            if _verbose: print_color(f"(Model) Saved at {model_path}", color)
+            # Finally, logs the model path
+            self._message(f"(Model) {index}: Saved at {model_path}")
             
+    def load_model(self, model: Any, index: Union[str,int], keys: Optional[Iterable[str]] = None, strict: Optional[bool] = None,
+                   verbose: Optional[bool] = None, color: Optional[str] = None) -> Any:
+        """
+        Loads the checkpoint index saved by save_model (in this run, or in the run resumed) into model and returns model.
+        If keys is not None, only these parameters are loaded (and read from the disk), strict is then False by default.
+        Usage:
+        >>> logger.load_model(model, index=10)
+        >>> logger.load_model(model, index=10, keys=["head.weight", "head.bias"])
+        """
+        _verbose = (verbose is not None and verbose) or (verbose is None and self.verbose)
+        if self.checkpoints is None:
+            raise RuntimeError("Models can only be loaded if save is True")
+        state_dict = self.checkpoints.load(index, keys=keys)
+        model.load_state_dict(state_dict, strict=keys is None if strict is None else strict)
+        if _verbose: print_color(f"(Model) Loaded {len(state_dict)} tensors from {self.checkpoints.find(index)}", color)
+        return model
+
     def debug(self, var: Any, verbose: bool = False, visible: bool = False) -> None:
         """
         Nested call to debug, to handle saving and tensorboard
         """
+        start = time.perf_counter_ns() if self.profiler.enabled else 0
+        policy = self.call_policies.get("debug")
+        if policy is not None and not policy.allow(): return
         _verbose = (verbose is not None and verbose) or (verbose is None and self.verbose)
         debug_str = debug(var, visible=visible, return_str=True, display=_verbose, nested_calls=1)
-        if self.save:
-            self.log_file.write(debug_str + "\n")
-        if self.tensorboard:
-            self.writer.add_text("debug", debug_str.replace("DEBUG: ", ""), self.debug_counter)
-            self.debug_counter += 1
+        self._log_text("debug", debug_str)
+        if start: self.profiler.record("debug", time.perf_counter_ns() - start)
 
     def sdebug(self, var: Any, verbose: bool = False, visible: bool = False) -> None:
         """
         Nested call to sdebug to handle saving and tensorboard
         """
+        start = time.perf_counter_ns() if self.profiler.enabled else 0
+        policy = self.call_policies.get("debug")
+        if policy is not None and not policy.allow(): return
         _verbose = (verbose is not None and verbose) or (verbose is None and self.verbose)
         debug_str = sdebug(var, visible=visible, return_str=True, display=_verbose, nested_calls=1)
-        if self.save:
-            self.log_file.write(debug_str + "\n")
-        if self.tensorboard:
-            self.writer.add_text("debug", debug_str.replace("DEBUG: ", ""), self.debug_counter)
-            self.debug_counter += 1
+        self._log_text("debug", debug_str)
+        if start: self.profiler.record("sdebug", time.perf_counter_ns() - start)
 
     def ldebug(self, var: Any, verbose: bool = False, visible: bool = False) -> None:
         """
         Nested call to ldebug to handle saving and tensorboard
         """
+        start = time.perf_counter_ns() if self.profiler.enabled else 0
+        policy = self.call_policies.get("debug")
+        if policy is not None and not policy.allow(): return
         _verbose = (verbose is not None and verbose) or (verbose is None and self.verbose)
         debug_str = ldebug(var, visible=visible, return_str=True, display=_verbose, nested_calls=1)
-        if self.save:
-            self.log_file.write(debug_str + "\n")
-        if self.tensorboard:
-            self.writer.add_text("debug", debug_str.replace("DEBUG: ", ""), self.debug_counter)
-            self.debug_counter += 1
+        self._log_text("debug", debug_str)
+        if start: self.profiler.record("ldebug", time.perf_counter_ns() - start)
                           
         
 
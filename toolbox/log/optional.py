@@ -0,0 +1,36 @@
+from typing import Dict, Optional
+from types import ModuleType
+import importlib
+import sys
+
+
+_modules: Dict[str, Optional[ModuleType]] = {}
+
+
+def optional_import(name: str) -> Optional[ModuleType]:
+    """
+    Imports the module name the first time it is needed and caches it.
+    Returns None if the module is not installed (the failed import is cached too, so it is not retried on every call).
+    Usage:
+    >>> torch = optional_import("torch")
+    >>> if torch is not None: ...
+    """
+    try:
+        return _modules[name]
+    except KeyError:
+        pass
+    try:
+        module: Optional[ModuleType] = importlib.import_module(name)
+    except ImportError:
+        module = None
+    _modules[name] = module
+    return module
+
+
+def loaded_module(name: str) -> Optional[ModuleType]:
+    """
+    Returns the module name if it has already been imported (by anyone), None otherwise. Never imports it.
+    This is enough to check if an object is an instance of a class of this module:
+    if the module is not imported, no such object can exist.
+    """
+    return sys.modules.get(name)
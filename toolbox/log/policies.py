@@ -0,0 +1,74 @@
+from typing import Any, Optional, Set, Tuple
+import random
+import time
+
+
+class LogPolicy:
+    """
+    Decides which calls of a metric are logged. All the conditions given must be met for a call to be logged:
+    - every: logs one call every `every` calls (the 1st, the (every+1)th, ...).
+    - max_hz: logs at most max_hz calls per second.
+    - sample: (k, n), logs k calls drawn uniformly at random in each window of n calls.
+    - epsilon: logs a value only if it differs by more than epsilon from the last value logged.
+    Each check is constant time. skipped and logged count the calls discarded and kept.
+    Usage:
+    >>> policy = LogPolicy(every=10)
+    >>> if policy.allow(value): ...
+    """
+
+    __slots__ = ("every", "max_hz", "sample", "epsilon", "skipped", "logged",
+                 "_calls", "_min_interval", "_next_time", "_last_value", "_sampled")
+
+    def __init__(self, every: Optional[int] = None, max_hz: Optional[float] = None, sample: Optional[Tuple[int, int]] = None,
+                 epsilon: Optional[float] = None):
+        assert every is None or every > 0, "every should be positive"
+        assert max_hz is None or max_hz > 0, "max_hz should be positive"
+        assert sample is None or 0 < sample[0] <= sample[1], "sample should be (k, n) with 0 < k <= n"
+        assert epsilon is None or epsilon >= 0, "epsilon should be non negative"
+        self.every: Optional[int] = every
+        self.max_hz: Optional[float] = max_hz
+        self.sample: Optional[Tuple[int, int]] = sample
+        self.epsilon: Optional[float] = epsilon
+        self.skipped: int = 0
+        self.logged: int = 0
+        self._calls: int = 0
+        self._min_interval: float = 1. / max_hz if max_hz is not None else 0.
+        self._next_time: float = 0.
+        self._last_value: Any = None
+        self._sampled: Set[int] = set()
+
+    def allow(self, value: Any = None) -> bool:
+        """
+        Returns True if the call (with the value logged, None if it is not a scalar) should be logged.
+        """
+        call = self._calls
+        self._calls += 1
+        if self.every is not None and call % self.every != 0:
+            self.skipped += 1
+            return False
+        if self.sample is not None:
+            k, n = self.sample
+            position = call % n
+            if position == 0: # New window, draws the positions to keep
+                self._sampled = set(random.sample(range(n), k)) if k < n else set(range(n))
+            if position not in self._sampled:
+                self.skipped += 1
+                return False
+        now = 0.
+        if self.max_hz is not None:
+            now = time.monotonic()
+            if now < self._next_time:
+                self.skipped += 1
+                return False
+        if self.epsilon is not None and value is not None:
+            if self._last_value is not None and abs(value - self._last_value) <= self.epsilon:
+                self.skipped += 1
+                return False
+            self._last_value = value
+        self._next_time = now + self._min_interval
+        self.logged += 1
+        return True
+
+    def __repr__(self) -> str:
+        conditions = [f"{key}={getattr(self, key)}" for key in ("every", "max_hz", "sample", "epsilon") if getattr(self, key) is not None]
+        return f"LogPolicy({', '.join(conditions)})"
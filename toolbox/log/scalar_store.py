@@ -0,0 +1,167 @@
+from typing import Any, BinaryIO, Dict, List, Tuple
+import os
+import threading
+from urllib.parse import quote, unquote
+import numpy as np
+from .file_cache import FileHandleCache
+
+
+# One record per logged value: (index, wall time in seconds since epoch, value)
+SCALAR_DTYPE = np.dtype([("index", "<i8"), ("time", "<f8"), ("value", "<f8")])
+SCALAR_EXTENSION = ".scalars"
+
+
+def metric_file_name(name: str) -> str:
+    """
+    Returns the file name storing the metric name (names such as "train/loss" are escaped).
+    """
+    return quote(name, safe="") + SCALAR_EXTENSION
+
+
+class ScalarStore:
+    """
+    Binary columnar store for scalars.
+    Each metric is an append-only file of fixed size records (SCALAR_DTYPE) in the directory.
+    Records are buffered in memory and appended with one write per metric when flush_records records are pending
+    (or when flush() is called). At most max_open_files files are kept open (the least recently used is closed).
+    Usage:
+    >>> store = ScalarStore("logs/scalars")
+    >>> store.append("loss", 0, time.time(), 1.5)
+    >>> store.flush()
+    >>> indexes, times, values = ScalarStore.read("logs/scalars", "loss")
+    """
+
+    def __init__(self, directory: str, flush_records: int = 4096, max_open_files: int = 64):
+        self.directory: str = directory
+        self.flush_records: int = flush_records
+        self._buffers: Dict[str, List[Tuple[int, float, float]]] = {}
+        self._n_pending: int = 0
+        self._files: FileHandleCache = FileHandleCache(max_open_files)
+        self._lock = threading.Lock()
+        self.bytes_written: int = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, name: str, index: int, time: float, value: float) -> None:
+        """
+        Buffers the record (index, time, value) of the metric name.
+        """
+        with self._lock:
+            buffer = self._buffers.get(name)
+            if buffer is None:
+                buffer = self._buffers[name] = []
+            buffer.append((index, time, value))
+            self._n_pending += 1
+            if self._n_pending >= self.flush_records:
+                self._flush()
+
+    def append_records(self, records: List[Tuple[str, int, float]], time: float) -> None:
+        """
+        Buffers several (name, index, value) records sharing the same wall time.
+        """
+        with self._lock:
+            buffers = self._buffers
+            for name, index, value in records:
+                buffer = buffers.get(name)
+                if buffer is None:
+                    buffer = buffers[name] = []
+                buffer.append((index, time, value))
+            self._n_pending += len(records)
+            if self._n_pending >= self.flush_records:
+                self._flush()
+
+    def append_many(self, name: str, indexes: Any, times: Any, values: Any) -> None:
+        """
+        Appends several records of the metric name at once (the three arguments are broadcast together).
+        The pending records of the metric are written first to keep the file ordered.
+        """
+        indexes, times, values = np.broadcast_arrays(np.asarray(indexes), np.asarray(times), np.asarray(values))
+        records = np.empty(indexes.shape[0] if indexes.ndim > 0 else 1, dtype=SCALAR_DTYPE)
+        records["index"] = indexes.ravel()
+        records["time"] = times.ravel()
+        records["value"] = values.ravel()
+        with self._lock:
+            self._flush_metric(name)
+            f = self._get_file(name)
+            f.write(records.tobytes())
+            f.flush()
+            self.bytes_written += records.nbytes
+
+    def flush(self) -> None:
+        """
+        Writes all the pending records to disk.
+        """
+        with self._lock:
+            self._flush()
+
+    def close(self) -> None:
+        """
+        Writes all the pending records and closes the files.
+        """
+        with self._lock:
+            self._flush()
+            self._files.close()
+
+    def _get_file(self, name: str) -> BinaryIO:
+        return self._files.get(os.path.join(self.directory, metric_file_name(name)))
+
+    def _flush_metric(self, name: str) -> None:
+        buffer = self._buffers.pop(name, None)
+        if buffer:
+            f = self._get_file(name)
+            data = np.array(buffer, dtype=SCALAR_DTYPE).tobytes()
+            f.write(data)
+            f.flush()
+            self.bytes_written += len(data)
+            self._n_pending -= len(buffer)
+
+    def _flush(self) -> None:
+        for name in list(self._buffers.keys()):
+            self._flush_metric(name)
+        self._n_pending = 0
+
+    @staticmethod
+    def list_metrics(directory: str) -> List[str]:
+        """
+        Returns the names of the metrics stored in the directory.
+        """
+        if not os.path.isdir(directory):
+            return []
+        return sorted(unquote(f[:-len(SCALAR_EXTENSION)]) for f in os.listdir(directory) if f.endswith(SCALAR_EXTENSION))
+
+    @staticmethod
+    def recover(directory: str) -> Dict[str, int]:
+        """
+        Prepares the store of an interrupted run to be appended to: truncates the incomplete last record of each metric (if any)
+        and returns the index of the last record of each metric. Only the last record of each file is read.
+        """
+        last_indexes: Dict[str, int] = {}
+        for name in ScalarStore.list_metrics(directory):
+            path = os.path.join(directory, metric_file_name(name))
+            size = os.path.getsize(path)
+            n_records = size // SCALAR_DTYPE.itemsize
+            if size != n_records * SCALAR_DTYPE.itemsize:
+                os.truncate(path, n_records * SCALAR_DTYPE.itemsize)
+            if n_records > 0:
+                with open(path, "rb") as f:
+                    f.seek((n_records - 1) * SCALAR_DTYPE.itemsize)
+                    last_indexes[name] = int(np.frombuffer(f.read(SCALAR_DTYPE.itemsize), dtype=SCALAR_DTYPE)["index"][0])
+        return last_indexes
+
+    @staticmethod
+    def read(directory: str, name: str, mmap: bool = False) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the arrays (indexes, times, values) of the metric name stored in the directory.
+        If mmap is True, the arrays are backed by a read-only memory map of the file instead of being loaded in memory.
+        A truncated last record (e.g. after a crash) is ignored.
+        """
+        path = os.path.join(directory, metric_file_name(name))
+        if not os.path.exists(path):
+            raise KeyError(f"No scalars logged for {name} in {directory}")
+        n_records = os.path.getsize(path) // SCALAR_DTYPE.itemsize
+        if n_records == 0:
+            records = np.empty(0, dtype=SCALAR_DTYPE)
+        elif mmap:
+            records = np.memmap(path, dtype=SCALAR_DTYPE, mode="r", shape=(n_records,))
+        else:
+            records = np.fromfile(path, dtype=SCALAR_DTYPE, count=n_records)
+        return records["index"], records["time"], records["value"]
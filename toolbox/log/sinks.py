@@ -0,0 +1,464 @@
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import os
+import time
+import numpy as np
+from ..printing import print_color, warn
+from .text_sink import BufferedTextSink, json_default
+from .scalar_store import ScalarStore
+from .histogram_sketch import SketchStore
+from .optional import optional_import
+from .images import IMAGE_FORMATS, ImageEncoderPool, image_to_hwc, encode_image, save_image, batch_to_nhwc, make_grid, encode_frames, save_image_batch
+
+
+# (name, index, value)
+ScalarRecord = Tuple[str, int, float]
+
+
+class ImageRecord:
+    """
+    An image to log. It is converted to HWC at most once, however many sinks use it.
+    If ready is not None, image is a pinned torch tensor being copied to the host and ready is the cuda event to wait for.
+    """
+
+    def __init__(self, name: str, index: int, image: Any, ready: Optional[Any] = None, is_PIL: bool = False):
+        self.name: str = name
+        self.index: int = index
+        self.image: Any = image
+        self.ready: Optional[Any] = ready
+        self.is_PIL: bool = is_PIL
+        self._hwc: Optional[np.ndarray] = None
+
+    @property
+    def hwc(self) -> np.ndarray:
+        """The image as a (H, W, 3) array with values in [0, 1]."""
+        if self._hwc is None:
+            if self.is_PIL:
+                image_np = np.array(self.image)
+                # Shape must be (H, W, C)
+                if len(image_np.shape) == 2: # Grayscale image
+                    image_np = np.repeat(image_np[:, :, np.newaxis], 3, axis=2)
+                # Go from 0-255 int to 0-1 float
+                self._hwc = image_np.astype(np.float32) / 255
+            else:
+                if self.ready is not None:
+                    self.ready.synchronize()
+                    self.image, self.ready = self.image.numpy(), None
+                self._hwc = image_to_hwc(self.image, self.name, self.index)
+        return self._hwc
+
+
+class ImageBatchRecord:
+    """
+    A batch of images to log, with the layout ("grid" or "separate") to use.
+    It is converted to NHWC (and tiled if needed) at most once, however many sinks use it.
+    """
+
+    def __init__(self, name: str, index: int, images: Any, layout: str = "grid", n_cols: Optional[int] = None, ready: Optional[Any] = None):
+        self.name: str = name
+        self.index: int = index
+        self.images: Any = images
+        self.layout: str = layout
+        self.n_cols: Optional[int] = n_cols
+        self.ready: Optional[Any] = ready
+        self._nhwc: Optional[np.ndarray] = None
+        self._grid: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.images)
+
+    @property
+    def nhwc(self) -> np.ndarray:
+        """The images as a (N, H, W, 3) array with values in [0, 1]."""
+        if self._nhwc is None:
+            if self.ready is not None:
+                self.ready.synchronize()
+                self.images, self.ready = self.images.numpy(), None
+            self._nhwc = batch_to_nhwc(self.images)
+        return self._nhwc
+
+    @property
+    def grid(self) -> np.ndarray:
+        """The images tiled in one (H, W, 3) mosaic."""
+        if self._grid is None:
+            self._grid = make_grid(self.nhwc, self.n_cols)
+        return self._grid
+
+
+class Sink:
+    """
+    Base class of the Logger sinks. A sink receives the records built by the Logger and writes them somewhere.
+    Every record method does nothing by default: a sink only overrides the records it handles,
+    and the Logger never dispatches a record to a sink that does not override the corresponding method,
+    so an unused record type costs nothing.
+    Records are built once and shared by all the sinks, sinks must not modify them.
+    """
+
+    # Record methods, and the methods that a sink can override to handle them
+    RECORDS: Dict[str, Tuple[str, ...]] = {
+        "text": ("text",),
+        "message": ("message",),
+        "scalars": ("scalars",),
+        "scalar_array": ("scalar_array", "scalars"),
+        "histogram": ("histogram",),
+        "image": ("image",),
+        "images": ("images",),
+        "graph": ("graph",),
+    }
+
+    def handles(self, record: str) -> bool:
+        """
+        Returns True if the sink overrides one of the methods handling record.
+        """
+        return any(getattr(type(self), method) is not getattr(Sink, method) for method in Sink.RECORDS[record])
+
+    def text(self, tag: str, text: str, step: int) -> None:
+        """A text message: tag is "log" for log/log_dict and "debug" for the debug functions."""
+        pass
+
+    def message(self, text: str) -> None:
+        """A status line (models saved, graphs logged, ...)."""
+        pass
+
+    def scalars(self, records: List[ScalarRecord], wall_time: float) -> None:
+        """Several (name, index, value) scalars logged at wall_time."""
+        pass
+
+    def scalar_array(self, name: str, start_index: int, values: np.ndarray, wall_time: float) -> None:
+        """The values of the metric name for the indexes start_index, start_index + 1, ..."""
+        self.scalars(list(zip([name] * len(values), range(start_index, start_index + len(values)), values.tolist())), wall_time)
+
+    def histogram(self, name: str, index: int, values: Any, wall_time: float, raw: bool) -> None:
+        """The values of an histogram. raw is True if the user asked for the values to be saved as is."""
+        pass
+
+    def image(self, record: ImageRecord) -> None:
+        pass
+
+    def images(self, record: ImageBatchRecord) -> None:
+        pass
+
+    def graph(self, model: Any, input_size: Tuple[int, ...]) -> None:
+        pass
+
+    @property
+    def bytes_written(self) -> Optional[int]:
+        """Number of bytes written by the sink (None if it is not known)."""
+        return None
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class NullSink(Sink):
+    """
+    Sink that accepts every record and does nothing with it.
+    Useful to measure the overhead of the Logger itself in benchmarks.
+    """
+
+    def text(self, tag: str, text: str, step: int) -> None:
+        pass
+
+    def message(self, text: str) -> None:
+        pass
+
+    def scalars(self, records: List[ScalarRecord], wall_time: float) -> None:
+        pass
+
+    def scalar_array(self, name: str, start_index: int, values: np.ndarray, wall_time: float) -> None:
+        pass
+
+    def histogram(self, name: str, index: int, values: Any, wall_time: float, raw: bool) -> None:
+        pass
+
+    def image(self, record: ImageRecord) -> None:
+        pass
+
+    def images(self, record: ImageBatchRecord) -> None:
+        pass
+
+    def graph(self, model: Any, input_size: Tuple[int, ...]) -> None:
+        pass
+
+
+class FileSink(Sink):
+    """
+    Writes the records in save_path: messages and values in log.txt (see BufferedTextSink),
+    values in save_path/scalars if scalar_store is True (see ScalarStore),
+    histograms in save_path/histograms (raw .npy files or sketches, see SketchStore),
+    images in save_path/images (encoded by image_pool if it is not None).
+    """
+
+    def __init__(self, save_path: str, verbose: bool = False, flush_interval: float = 1.0, flush_bytes: int = 1 << 16,
+                 fsync_interval: Optional[float] = None, max_log_bytes: Optional[int] = None, rotate_interval: Optional[float] = None,
+                 backup_count: int = 5, scalar_store: bool = False, histogram_mode: str = "raw", histogram_alpha: float = 0.01,
+                 histogram_range: Tuple[float, float] = (0., 1.), histogram_bins: int = 64, image_pool: Optional[ImageEncoderPool] = None,
+                 image_format: str = "png", image_compression: Optional[int] = None, append: bool = False):
+        if histogram_mode not in ("raw", "ddsketch", "fixed"):
+            raise ValueError(f"Unknown histogram_mode {histogram_mode}, should be raw, ddsketch or fixed")
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f"Unknown image_format {image_format}, should be one of {list(IMAGE_FORMATS.keys())}")
+        self.save_path: str = save_path
+        self.verbose: bool = verbose
+        self.images_dir: str = os.path.join(save_path, "images")
+        self.histograms_dir: str = os.path.join(save_path, "histograms")
+        self.image_pool: Optional[ImageEncoderPool] = image_pool
+        self.image_format: str = image_format
+        self.image_compression: Optional[int] = image_compression
+        self._created_dirs: set = set()
+        # Creates a log file (overwrites it if it already exists, unless append is True)
+        log_file_path = os.path.join(save_path, "log.txt")
+        self.log_file: BufferedTextSink = BufferedTextSink(log_file_path, flush_interval=flush_interval, flush_bytes=flush_bytes,
+                                                           fsync_interval=fsync_interval, max_bytes=max_log_bytes,
+                                                           rotate_interval=rotate_interval, backup_count=backup_count, append=append)
+        if verbose: print_color("Created log file " + log_file_path, "green")
+        self.scalar_store: Optional[ScalarStore] = ScalarStore(os.path.join(save_path, "scalars")) if scalar_store else None
+        self.sketch_store: Optional[SketchStore] = None
+        if histogram_mode != "raw":
+            self.sketch_store = SketchStore(self.histograms_dir, kind=histogram_mode, alpha=histogram_alpha,
+                                            low=histogram_range[0], high=histogram_range[1], n_bins=histogram_bins)
+
+    def _ensure_dir(self, path: str) -> None:
+        """Creates the directory path if needed (checked only once)."""
+        if path not in self._created_dirs:
+            if not os.path.exists(path):
+                os.makedirs(path)
+                if self.verbose: print_color("Created directory " + path, ["green", "bold"])
+            self._created_dirs.add(path)
+
+    @property
+    def bytes_written(self) -> Optional[int]:
+        """Bytes written to the log file, the scalar store and the sketch store (images and raw histograms are not counted)."""
+        return self.log_file.bytes_written + sum(store.bytes_written for store in (self.scalar_store, self.sketch_store) if store is not None)
+
+    def image_path(self, name: str, index: int) -> str:
+        return os.path.join(self.images_dir, name + "_" + str(index) + IMAGE_FORMATS[self.image_format])
+
+    def text(self, tag: str, text: str, step: int) -> None:
+        if tag == "log":
+            self.log_file.write("(Log) " + text + "\n")
+        else:
+            self.log_file.write(text + "\n")
+
+    def message(self, text: str) -> None:
+        self.log_file.write(text + "\n")
+
+    def scalars(self, records: List[ScalarRecord], wall_time: float) -> None:
+        if self.scalar_store is not None:
+            self.scalar_store.append_records(records, wall_time)
+        else:
+            self.log_file.write("".join([f"(Value) {name} - {index}: {value}\n" for name, index, value in records]))
+
+    def scalar_array(self, name: str, start_index: int, values: np.ndarray, wall_time: float) -> None:
+        if self.scalar_store is not None:
+            self.scalar_store.append_many(name, np.arange(start_index, start_index + len(values)), wall_time, values)
+        else:
+            self.log_file.write("".join([f"(Value) {name} - {start_index + i}: {value}\n" for i, value in enumerate(values.tolist())]))
+
+    def histogram(self, name: str, index: int, values: Any, wall_time: float, raw: bool) -> None:
+        # Save the histogram in the save_path/histograms folder
+        self._ensure_dir(self.histograms_dir)
+        if self.sketch_store is not None:
+            self.sketch_store.append(name, index, wall_time, values)
+            self.log_file.write(f"(Histogram) {name} - {index}: Sketch appended to {self.sketch_store.path(name)}\n")
+        if self.sketch_store is None or raw:
+            histogram_path = os.path.join(self.histograms_dir, f"{name}_{index}.npy")
+            np.save(histogram_path, values)
+            self.log_file.write(f"(Histogram) {name} - {index}: Saved at {histogram_path}\n")
+
+    def image(self, record: ImageRecord) -> None:
+        self._ensure_dir(self.images_dir)
+        if record.is_PIL:
+            image_path = os.path.join(self.images_dir, record.name + "_" + str(record.index) + ".png")
+            if self.image_pool is not None:
+                self.image_pool.submit(record.image.save, image_path)
+            else:
+                record.image.save(image_path)
+        elif self.image_pool is not None:
+            # The conversion to HWC and the encoding are done by the workers
+            self.image_pool.submit(save_image, record.image, self.image_path(record.name, record.index), self.image_format,
+                                   self.image_compression, record.name, record.index, record.ready)
+        elif self.image_format != "npz" and optional_import("PIL.Image") is None:
+            warn("Please install PIL to save images")
+            self.log_file.write(f"(Image) {record.name} - {record.index}: Not saved as PIL is not installed\n")
+            return
+        else:
+            encode_image(record.hwc, self.image_path(record.name, record.index), self.image_format, self.image_compression)
+        self.log_file.write(f"(Image) {record.name} - {record.index}: Saved in {self.images_dir}\n")
+
+    def images(self, record: ImageBatchRecord) -> None:
+        self._ensure_dir(self.images_dir)
+        image_path = self.image_path(record.name, record.index)
+        if self.image_pool is not None:
+            # The conversion and the encoding are done by the workers
+            self.image_pool.submit(save_image_batch, record.images, image_path, self.image_format, self.image_compression,
+                                   record.layout, record.n_cols, record.ready)
+        elif record.layout == "grid":
+            encode_image(record.grid, image_path, self.image_format, self.image_compression)
+        else:
+            encode_frames(record.nhwc, image_path, self.image_format, self.image_compression)
+        self.log_file.write(f"(Images) {record.name} - {record.index}: {len(record)} images saved in {image_path}\n")
+
+    def flush(self) -> None:
+        if self.image_pool is not None:
+            self.image_pool.wait()
+        self.log_file.flush()
+        if self.scalar_store is not None:
+            self.scalar_store.flush()
+        if self.sketch_store is not None:
+            self.sketch_store.flush()
+
+    def close(self) -> None:
+        if self.image_pool is not None:
+            self.image_pool.close()
+        self.log_file.close()
+        if self.scalar_store is not None:
+            self.scalar_store.close()
+        if self.sketch_store is not None:
+            self.sketch_store.close()
+
+
+class TensorboardSink(Sink):
+    """
+    Writes the records in a tensorboard file in log_dir.
+    """
+
+    def __init__(self, log_dir: str, verbose: bool = False):
+        try:
+            from torch.utils.tensorboard import SummaryWriter
+        except ImportError:
+            raise ImportError("Please install tensorboard to use it")
+        self.writer: Any = SummaryWriter(log_dir=log_dir)
+        if verbose: print_color("Created tensorboard writer", "green")
+        # Gives instruction on how to use tensorboard
+        print_color("To use tensorboard, run the following command in a terminal:", "bold")
+        print_color("tensorboard --logdir=" + os.path.dirname(log_dir), "bold")
+        print_color("Then open the following link in a browser:", "bold")
+        print_color("http://localhost:6006/", "bold")
+
+    def text(self, tag: str, text: str, step: int) -> None:
+        self.writer.add_text(tag, text.replace("DEBUG: ", "") if tag == "debug" else text, step)
+
+    def scalars(self, records: List[ScalarRecord], wall_time: float) -> None:
+        add_scalar = self.writer.add_scalar
+        for name, index, value in records:
+            add_scalar(name, value, index, walltime=wall_time)
+
+    def histogram(self, name: str, index: int, values: Any, wall_time: float, raw: bool) -> None:
+        self.writer.add_histogram(name, values, index, walltime=wall_time)
+
+    def image(self, record: ImageRecord) -> None:
+        self.writer.add_image(record.name, record.hwc, record.index, dataformats="HWC")
+
+    def images(self, record: ImageBatchRecord) -> None:
+        if record.layout == "grid":
+            self.writer.add_image(record.name, record.grid, record.index, dataformats="HWC")
+        else:
+            self.writer.add_images(record.name, record.nhwc, record.index, dataformats="NHWC")
+
+    def graph(self, model: Any, input_size: Tuple[int, ...]) -> None:
+        torch = optional_import("torch")
+        if torch is None:
+            raise ImportError("Please install torch to log graphs")
+        self.writer.add_graph(model, torch.zeros(input_size))
+
+    def flush(self) -> None:
+        self.writer.flush()
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class WandbSink(Sink):
+    """
+    Sends the records to wandb (the records sharing an index are sent in one call).
+    The index of a record is logged as the value step_metric, used as x axis of every metric: the wandb step must increase
+    over the whole run, while the indexes of the metrics are independent (an image at index 3 can come after a loss at index 500).
+    wandb.init(**init_kwargs) is called if no run is active.
+    """
+
+    def __init__(self, step_metric: str = "log_index", **init_kwargs: Any):
+        self.wandb: Any = optional_import("wandb")
+        if self.wandb is None:
+            raise ImportError("Please install wandb to use it")
+        if self.wandb.run is None:
+            self.wandb.init(**init_kwargs)
+        self.step_metric: str = step_metric
+        self.wandb.define_metric(step_metric)
+        self.wandb.define_metric("*", step_metric=step_metric)
+
+    def _log(self, values: Dict[str, Any], index: int) -> None:
+        values[self.step_metric] = index
+        self.wandb.log(values)
+
+    def scalars(self, records: List[ScalarRecord], wall_time: float) -> None:
+        steps: Dict[int, Dict[str, float]] = {}
+        for name, index, value in records:
+            steps.setdefault(index, {})[name] = value
+        for index, values in steps.items():
+            self._log(values, index)
+
+    def histogram(self, name: str, index: int, values: Any, wall_time: float, raw: bool) -> None:
+        self._log({name: self.wandb.Histogram(values)}, index)
+
+    def image(self, record: ImageRecord) -> None:
+        self._log({record.name: self.wandb.Image(record.hwc)}, record.index)
+
+    def images(self, record: ImageBatchRecord) -> None:
+        if record.layout == "grid":
+            self._log({record.name: self.wandb.Image(record.grid)}, record.index)
+        else:
+            self._log({record.name: [self.wandb.Image(image) for image in record.nhwc]}, record.index)
+
+
+class JSONLSink(Sink):
+    """
+    Writes one JSON object per record (per scalar for scalars) in path, for machine ingestion.
+    Histograms and images are summarized (statistics and shapes), the data itself is not written.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0, flush_bytes: int = 1 << 16, fsync_interval: Optional[float] = None,
+                 append: bool = False):
+        self.path: str = path
+        self.file: BufferedTextSink = BufferedTextSink(path, flush_interval=flush_interval, flush_bytes=flush_bytes, fsync_interval=fsync_interval,
+                                                       append=append)
+
+    @property
+    def bytes_written(self) -> Optional[int]:
+        return self.file.bytes_written
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        self.file.write(json.dumps(record, default=json_default) + "\n")
+
+    def text(self, tag: str, text: str, step: int) -> None:
+        self._write({"type": "text", "tag": tag, "step": step, "time": time.time(), "text": text})
+
+    def message(self, text: str) -> None:
+        self._write({"type": "message", "time": time.time(), "text": text})
+
+    def scalars(self, records: List[ScalarRecord], wall_time: float) -> None:
+        self.file.write("".join([json.dumps({"type": "scalar", "name": name, "index": index, "time": wall_time, "value": float(value)}, default=json_default) + "\n"
+                                 for name, index, value in records]))
+
+    def histogram(self, name: str, index: int, values: Any, wall_time: float, raw: bool) -> None:
+        values = np.asarray(values, dtype=np.float64)
+        record = {"type": "histogram", "name": name, "index": index, "time": wall_time, "count": int(values.size)}
+        if values.size > 0:
+            record.update(min=float(np.nanmin(values)), max=float(np.nanmax(values)), mean=float(np.nanmean(values)), std=float(np.nanstd(values)))
+        self._write(record)
+
+    def image(self, record: ImageRecord) -> None:
+        self._write({"type": "image", "name": record.name, "index": record.index, "time": time.time(), "shape": list(record.hwc.shape)})
+
+    def images(self, record: ImageBatchRecord) -> None:
+        self._write({"type": "images", "name": record.name, "index": record.index, "time": time.time(),
+                     "layout": record.layout, "shape": list(record.nhwc.shape)})
+
+    def flush(self) -> None:
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
@@ -1,21 +1,122 @@
+import atexit
+import time
 from dowel.tabular_input import TabularInput
-import wandb
+from .optional import optional_import
+from .aggregation import WindowAggregator
+from .wandb_spool import WandbSpool
 
 class TabularModified(TabularInput):
+    """
+    dowel TabularInput that also sends the values recorded to wandb.
+    The values are buffered and sent with one wandb.log call per step: when the step changes, when clear() is called
+    (after each dump), when wandb_max_keys values are buffered or wandb_flush_interval seconds after the first buffered value,
+    or when flush() is called.
+    If wandb_spool is a path, nothing is sent: the values are appended to this local file (fsynced every spool_fsync_interval
+    seconds, never if None) and uploaded later with `python -m toolbox.log.wandb_spool path --project ...`.
+    """
 
-    def __init__(self, use_wandb=False, wandb_step_factor=1):
+    def __init__(self, use_wandb=False, wandb_step_factor=1, wandb_max_keys=1000, wandb_flush_interval=10.,
+                 wandb_spool=None, spool_fsync_interval=None):
         super().__init__()
-        self.use_wandb = use_wandb
-        self.wandb_step_factor = wandb_step_factor
+        self.wandb = None
+        self.wandb_spool = wandb_spool
+        self.spool_fsync_interval = spool_fsync_interval
+        self.wandb_max_keys = wandb_max_keys
+        self.wandb_flush_interval = wandb_flush_interval
+        self.wandb_calls = 0 # Number of calls to wandb.log
+        self._wandb_buffer = {}
+        self._wandb_step = None
+        self._wandb_first_time = 0.
+        self.aggregators = {} # Associates a key to its window aggregator
+        self.summaries = {} # Associates a key to the summary of its last full window
+        self.set_wandb(use_wandb, wandb_step_factor)
 
     def set_wandb(self, use_wandb, wandb_step_factor=1):
         self.use_wandb = use_wandb
         self.wandb_step_factor = wandb_step_factor
+        if use_wandb and self.wandb is None and self.wandb_spool is not None:
+            # The spool has the same log method as wandb, wandb itself is never imported
+            self.wandb = WandbSpool(self.wandb_spool, fsync_interval=self.spool_fsync_interval)
+            # The values buffered for the last step are sent at exit if close() is not called
+            atexit.register(self.close)
+        elif use_wandb and self.wandb is None:
+            # wandb is only imported when it is enabled, and only once
+            self.wandb = optional_import("wandb")
+            if self.wandb is None:
+                raise ImportError("Please install wandb to use it")
+            # Registered after the import of wandb, so it runs before the exit hooks of wandb
+            atexit.register(self.close)
+
+    def aggregate(self, key, window=100, stats=("mean", "max", "ema"), ema_alpha=None):
+        """
+        Accumulates the values recorded with key and records the statistics of the last full window instead (as key/stat).
+        The statistics are recorded at each call (nan until the first window is full) so that the table keeps the same columns,
+        and are only sent to wandb when a window is full.
+        If window is None, the values of key are recorded again as they come.
+        Usage:
+        >>> tabular.aggregate("loss", window=100, stats=("mean", "max"))
+        """
+        if window is None:
+            self.aggregators.pop(key, None)
+            self.summaries.pop(key, None)
+            return None
+        aggregator = WindowAggregator(window=window, stats=stats, ema_alpha=ema_alpha)
+        self.aggregators[key] = aggregator
+        self.summaries[key] = {stat: float("nan") for stat in aggregator.stats}
+        return aggregator
 
     def record(self, key, val, step=None):
+        if key in self.aggregators:
+            summary = self.aggregators[key].add(val)
+            if summary is not None:
+                self.summaries[key] = summary
+            for stat, stat_val in self.summaries[key].items():
+                super().record(key + "/" + stat, stat_val)
+            if self.use_wandb and summary is not None:
+                self._wandb_record({self._prefix_str + key + "/" + stat: stat_val for stat, stat_val in summary.items()}, step)
+            return
         super().record(key, val)
         if self.use_wandb:
-            if step is None:
-                wandb.log({self._prefix_str + key: val})
-            else:
-                wandb.log({self._prefix_str + key: val}, step=step*self.wandb_step_factor)
\ No newline at end of file
+            self._wandb_record({self._prefix_str + key: val}, step)
+
+    def _wandb_record(self, values, step):
+        # A new step starts when the step changes, or when a key is recorded again without step
+        if step != self._wandb_step or (step is None and not self._wandb_buffer.keys().isdisjoint(values)):
+            self.flush()
+            self._wandb_step = step
+        if not self._wandb_buffer:
+            self._wandb_first_time = time.monotonic()
+        self._wandb_buffer.update(values)
+        if len(self._wandb_buffer) >= self.wandb_max_keys or \
+           (self.wandb_flush_interval is not None and time.monotonic() - self._wandb_first_time > self.wandb_flush_interval):
+            self.flush()
+
+    def flush(self):
+        """
+        Sends the buffered values to wandb in one call.
+        """
+        if not self._wandb_buffer:
+            return
+        if self._wandb_step is None:
+            self.wandb.log(self._wandb_buffer)
+        else:
+            self.wandb.log(self._wandb_buffer, step=self._wandb_step*self.wandb_step_factor)
+        self.wandb_calls += 1
+        self._wandb_buffer = {}
+
+    def close(self):
+        """
+        Sends the buffered values and closes the spool (if wandb_spool is set).
+        Called at exit if wandb is used.
+        """
+        atexit.unregister(self.close)
+        if self.wandb is None:
+            return
+        self.flush()
+        if isinstance(self.wandb, WandbSpool):
+            self.wandb.close()
+
+    def clear(self):
+        # clear is called after each dump: the values of the step are complete
+        self.flush()
+        super().clear()
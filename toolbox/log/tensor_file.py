@@ -0,0 +1,106 @@
+"""
+Flat tensor file format (same layout as safetensors), made to be memory-mapped:
+- 8 bytes: N, the size of the header (little endian unsigned integer)
+- N bytes: JSON header {name: {"dtype": "float32", "shape": [2, 3], "offsets": [begin, end]}, "__metadata__": {...}},
+  offsets being relative to the start of the data
+- the data: the raw bytes of each tensor (C order), one after the other, each aligned on ALIGNMENT bytes.
+Loading a tensor only reads its own pages, the other tensors of the file are never read.
+"""
+from typing import Any, Dict, Iterable, Optional
+import json
+import os
+import numpy as np
+from .optional import loaded_module, optional_import
+
+
+TENSOR_EXTENSION = ".tensors"
+ALIGNMENT = 64
+
+
+def _to_numpy(value: Any) -> Any:
+    """Returns (numpy array, dtype name) of a torch tensor or a numpy array."""
+    if isinstance(value, np.ndarray):
+        return np.require(value, requirements="C"), value.dtype.name
+    torch = loaded_module("torch")
+    if torch is not None and isinstance(value, torch.Tensor):
+        value = value.detach().cpu().contiguous()
+        if value.dtype == torch.bfloat16: # Not supported by numpy, the raw bits are stored
+            return value.view(torch.int16).numpy(), "bfloat16"
+        return value.numpy(), str(value.dtype).replace("torch.", "")
+    raise ValueError(f"Cannot save a value of type {type(value)} in a tensor file, only tensors and arrays are supported")
+
+
+def save_tensors(tensors: Dict[str, Any], path: str, metadata: Optional[Dict[str, str]] = None, fsync: bool = True) -> None:
+    """
+    Saves a flat dict of torch tensors or numpy arrays in path.
+    Usage:
+    >>> save_tensors(model.state_dict(), "model.tensors")
+    """
+    header: Dict[str, Any] = {}
+    arrays = []
+    offset = 0
+    for name, value in tensors.items():
+        array, dtype = _to_numpy(value)
+        offset = (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+        header[name] = {"dtype": dtype, "shape": list(array.shape), "offsets": [offset, offset + array.nbytes]}
+        arrays.append((offset, array))
+        offset += array.nbytes
+    if metadata is not None:
+        header["__metadata__"] = metadata
+    header_bytes = json.dumps(header).encode()
+    # Pads the header so that the data starts on an aligned offset
+    header_bytes += b" " * ((-len(header_bytes) - 8) % ALIGNMENT)
+    with open(path, "wb") as f:
+        f.write(len(header_bytes).to_bytes(8, "little"))
+        f.write(header_bytes)
+        data_start = f.tell()
+        for array_offset, array in arrays:
+            f.seek(data_start + array_offset)
+            f.write(array.tobytes() if array.ndim == 0 else memoryview(array).cast("B"))
+        f.truncate(data_start + offset)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def read_tensor_header(path: str) -> Dict[str, Any]:
+    """Returns the header of the tensor file (see the module docstring), with the start of the data under "__data_start__"."""
+    with open(path, "rb") as f:
+        header_size = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_size))
+    header["__data_start__"] = 8 + header_size
+    return header
+
+
+def load_tensors(path: str, keys: Optional[Iterable[str]] = None, framework: str = "torch") -> Dict[str, Any]:
+    """
+    Returns the tensors of the file (only those in keys if it is not None) without reading them:
+    they are backed by a copy-on-write memory map of the file, so a page is only read when it is accessed.
+    framework is "torch" (torch tensors) or "numpy" (numpy arrays).
+    """
+    if framework not in ("torch", "numpy"):
+        raise ValueError(f"Unknown framework {framework}, should be torch or numpy")
+    torch = None
+    if framework == "torch":
+        torch = optional_import("torch")
+        if torch is None:
+            raise ImportError("Please install torch to load torch tensors (or use framework=\"numpy\")")
+    header = read_tensor_header(path)
+    data_start = header.pop("__data_start__")
+    header.pop("__metadata__", None)
+    names = list(header.keys()) if keys is None else [key for key in keys if key in header]
+    tensors: Dict[str, Any] = {}
+    if not names:
+        return tensors
+    data = np.memmap(path, dtype=np.uint8, mode="c", offset=data_start) if os.path.getsize(path) > data_start else np.empty(0, dtype=np.uint8)
+    for name in names:
+        info = header[name]
+        begin, end = info["offsets"]
+        dtype = "int16" if info["dtype"] == "bfloat16" else info["dtype"]
+        array = data[begin:end].view(dtype).reshape(info["shape"])
+        if torch is not None:
+            tensor = torch.from_numpy(array)
+            tensors[name] = tensor.view(torch.bfloat16) if info["dtype"] == "bfloat16" else tensor
+        else:
+            tensors[name] = array
+    return tensors
@@ -0,0 +1,163 @@
+from typing import Any, List, Optional
+import os
+import time
+import threading
+import weakref
+
+
+def json_default(value: Any) -> Any:
+    """
+    default of json.dumps for the values that are not JSON types: numpy arrays and scalars, torch tensors, ...
+    are converted with tolist() (or item()), the other values are written as strings.
+    Usage: json.dumps(record, default=json_default)
+    """
+    if callable(getattr(value, "tolist", None)): # Also returns a number for the 0-d arrays/tensors and numpy scalars
+        return value.tolist()
+    if callable(getattr(value, "item", None)):
+        return value.item()
+    return str(value)
+
+
+class BufferedTextSink:
+    """
+    Append-only text file that batches small writes into large ones.
+    - The buffer is written to the file when it holds more than flush_bytes bytes,
+      or at most flush_interval seconds after the last flush (by a background timer, even if nothing else is written).
+    - If fsync_interval is not None, the file is also fsynced after a flush if the last fsync is older than fsync_interval seconds
+      (0 means fsync on every flush).
+    - If max_bytes is not None, the file is rotated when it grows over max_bytes bytes.
+      If rotate_interval is not None, the file is rotated every rotate_interval seconds.
+      Rotated files are renamed path.1, path.2, ... (path.1 being the most recent), at most backup_count (> 0) of them are kept.
+    Usage:
+    >>> with BufferedTextSink("log.txt", flush_interval=5.0) as sink:
+    >>>     sink.write("Hello world!\\n")
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0, flush_bytes: int = 1 << 16, fsync_interval: Optional[float] = None,
+                 max_bytes: Optional[int] = None, rotate_interval: Optional[float] = None, backup_count: int = 5, append: bool = False):
+        if (max_bytes is not None or rotate_interval is not None) and backup_count <= 0:
+            raise ValueError("backup_count should be positive when the file is rotated, otherwise the rotated logs would be lost")
+        self.path: str = path
+        self.flush_interval: float = flush_interval
+        self.flush_bytes: int = flush_bytes
+        self.fsync_interval: Optional[float] = fsync_interval
+        self.max_bytes: Optional[int] = max_bytes
+        self.rotate_interval: Optional[float] = rotate_interval
+        self.backup_count: int = backup_count
+        self.bytes_written: int = 0 # Total number of bytes written to disk (across rotations)
+        self.n_flushes: int = 0 # Number of write syscalls issued
+        self.n_rotations: int = 0
+        self._buffer: List[bytes] = []
+        self._buffer_size: int = 0
+        self._lock = threading.Lock()
+        self._file = open(path, "ab" if append else "wb", buffering=0)
+        self._file_size: int = os.path.getsize(path) if append else 0
+        now = time.monotonic()
+        self._last_flush: float = now
+        self._last_fsync: float = now
+        self._last_rotation: float = now
+        # Flushes the buffer every flush_interval seconds (the thread only holds a weak reference to the sink)
+        self._stop_flusher = threading.Event()
+        if 0 < flush_interval < float("inf"):
+            threading.Thread(target=BufferedTextSink._flush_periodically, args=(weakref.ref(self), self._stop_flusher, flush_interval),
+                             name="toolbox-text-flusher", daemon=True).start()
+
+    @staticmethod
+    def _flush_periodically(sink_ref: "weakref.ref[BufferedTextSink]", stop: threading.Event, interval: float) -> None:
+        while not stop.wait(interval):
+            sink = sink_ref()
+            if sink is None:
+                return
+            with sink._lock:
+                if sink._file is not None and time.monotonic() - sink._last_flush >= sink.flush_interval:
+                    sink._flush()
+            del sink
+
+    @property
+    def closed(self) -> bool:
+        return self._file is None
+
+    def write(self, text: str) -> int:
+        """
+        Buffers text, flushes the buffer if the size or time threshold is reached.
+        """
+        data = text.encode("utf-8")
+        with self._lock:
+            if self._file is None:
+                raise ValueError(f"I/O operation on closed sink {self.path}")
+            self._buffer.append(data)
+            self._buffer_size += len(data)
+            if self._buffer_size >= self.flush_bytes or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+        return len(text)
+
+    def flush(self) -> None:
+        """
+        Writes the buffer to the file (and fsyncs it if the fsync policy requires it).
+        """
+        with self._lock:
+            if self._file is not None:
+                self._flush()
+
+    def fsync(self) -> None:
+        """
+        Writes the buffer to the file and forces it to disk.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._flush()
+                os.fsync(self._file.fileno())
+                self._last_fsync = time.monotonic()
+
+    def close(self) -> None:
+        """
+        Flushes the buffer and closes the file. Calling close several times is allowed.
+        """
+        self._stop_flusher.set()
+        with self._lock:
+            if self._file is None:
+                return
+            self._flush()
+            if self.fsync_interval is not None:
+                os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+    def _flush(self) -> None:
+        now = time.monotonic()
+        self._last_flush = now
+        if self._buffer_size > 0:
+            data = b"".join(self._buffer)
+            self._buffer = []
+            self._buffer_size = 0
+            self._file.write(data)
+            self._file_size += len(data)
+            self.bytes_written += len(data)
+            self.n_flushes += 1
+            if self.fsync_interval is not None and now - self._last_fsync >= self.fsync_interval:
+                os.fsync(self._file.fileno())
+                self._last_fsync = now
+        if (self.max_bytes is not None and self._file_size >= self.max_bytes) \
+            or (self.rotate_interval is not None and now - self._last_rotation >= self.rotate_interval and self._file_size > 0):
+            self._rotate(now)
+
+    def _rotate(self, now: float) -> None:
+        if self.fsync_interval is not None:
+            os.fsync(self._file.fileno())
+        self._file.close()
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                src = f"{self.path}.{i}"
+                if os.path.exists(src):
+                    os.replace(src, f"{self.path}.{i + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        self._file = open(self.path, "wb", buffering=0)
+        self._file_size = 0
+        self._last_rotation = now
+        self.n_rotations += 1
+
+    def __enter__(self) -> "BufferedTextSink":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,108 @@
+"""
+Offline spool for wandb: the values are appended to a local JSONL file instead of being sent,
+and uploaded later with replay_spool (or `python -m toolbox.log.wandb_spool path --project ...`).
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import atexit
+import json
+from ..printing import print_color, warn
+from .text_sink import BufferedTextSink, json_default
+from .optional import optional_import
+
+
+class WandbSpool:
+    """
+    Drop-in replacement of the wandb module for wandb.log: each call appends one line {"step": step, "values": values}
+    to the spool file path (never truncated, so a spool can be continued after a restart).
+    The file is written by batches (flush_interval) and fsynced every fsync_interval seconds (never if None).
+    Usage:
+    >>> spool = WandbSpool("wandb_spool.jsonl")
+    >>> spool.log({"loss": 0.5}, step=10)
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0, fsync_interval: Optional[float] = None):
+        self.path: str = path
+        self.n_rows: int = 0
+        self.file: Optional[BufferedTextSink] = BufferedTextSink(path, flush_interval=flush_interval, fsync_interval=fsync_interval, append=True)
+        atexit.register(self.close)
+
+    def log(self, values: Dict[str, Any], step: Optional[int] = None) -> None:
+        assert self.file is not None, "The spool is closed"
+        self.file.write(json.dumps({"step": step, "values": values}, default=json_default) + "\n")
+        self.n_rows += 1
+
+    def flush(self) -> None:
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self) -> None:
+        atexit.unregister(self.close)
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def read_spool(path: str) -> List[Tuple[Optional[int], Dict[str, Any]]]:
+    """
+    Returns the rows (step, values) of the spool, deduplicated by step:
+    the rows with the same step are merged (the last value of a key wins) at the position of the first one.
+    The rows without step are kept as they are. A truncated last line (process killed while writing) is skipped.
+    """
+    rows: List[Tuple[Optional[int], Dict[str, Any]]] = []
+    positions: Dict[int, int] = {} # Associates a step to its row
+    with open(path, "r") as file:
+        for line_number, line in enumerate(file):
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                warn(f"(Spool) Skipping invalid line {line_number + 1} of {path}")
+                continue
+            step, values = row["step"], row["values"]
+            if step is None:
+                rows.append((None, values))
+            elif step in positions:
+                rows[positions[step]][1].update(values)
+            else:
+                positions[step] = len(rows)
+                rows.append((step, values))
+    return rows
+
+
+def replay_spool(path: str, wandb: Optional[Any] = None, **init_kwargs: Any) -> int:
+    """
+    Uploads the rows of the spool to wandb (see read_spool) and returns the number of rows uploaded.
+    If no run is active, wandb.init(**init_kwargs) is called first (and the run is finished at the end).
+    """
+    if wandb is None:
+        wandb = optional_import("wandb")
+        if wandb is None:
+            raise ImportError("Please install wandb to replay a spool")
+    rows = read_spool(path)
+    own_run = wandb.run is None
+    if own_run:
+        wandb.init(**init_kwargs)
+    for step, values in rows:
+        if step is None:
+            wandb.log(values)
+        else:
+            wandb.log(values, step=step)
+    if own_run:
+        wandb.finish()
+    return len(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Uploads a wandb spool written by TabularModified(wandb_spool=...)")
+    parser.add_argument("path")
+    parser.add_argument("--project", default=None)
+    parser.add_argument("--entity", default=None)
+    parser.add_argument("--name", default=None)
+    parser.add_argument("--id", default=None, help="id of the run to resume")
+    args = parser.parse_args()
+
+    init_kwargs = {key: value for key, value in vars(args).items() if key != "path" and value is not None}
+    if args.id is not None:
+        init_kwargs["resume"] = "allow"
+    n_rows = replay_spool(args.path, **init_kwargs)
+    print_color(f"(Spool) Uploaded {n_rows} rows from {args.path}", "green")
@@ -1,3 +1,4 @@
 # To get sub-modules
 from .utils import *
-from .debug import *
\ No newline at end of file
+from .debug import *
+from .profiling import *
@@ -1,176 +1,328 @@
-from typing import Any, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 from .utils import Colors, get_terminal_width, strike, print_visible, str_without_colors
+from .profiling import debug_profiler
+import ast
 import inspect
+import itertools
+import linecache
+import math
+import sys
+import threading
+import time
+import types
+import warnings
 import dataclasses
 
 
+__all__ = ["TypeFormatter", "register_formatter", "get_formatter", "str_type", "return_str_value", "return_short_str_info",
+           "MAX_DEPTH", "enable_array_stats", "retrieve_name", "debug", "sdebug", "ldebug"]
+
+
+class TypeFormatter:
+    """
+    Functions used by debug to print the values of a type:
+    - type_name(var) returns the name of the type of var (see str_type)
+    - value(var, max_length) returns the value of var in at most max_length characters (see return_str_value)
+    - info(var, max_length) returns the value of var followed by extra infos such as its shape (see return_short_str_info),
+      the value alone if info is None.
+    """
+
+    def __init__(self, type_name: Callable[[Any], str], value: Callable[[Any, int], str], info: Optional[Callable[[Any, int], str]] = None):
+        self.type_name: Callable[[Any], str] = type_name
+        self.value: Callable[[Any, int], str] = value
+        self.info: Callable[[Any, int], str] = info if info is not None else value
+
+
+# Registered formatters, by class or by "module.QualifiedName" for the classes of optional libraries (never imported)
+_FORMATTERS: Dict[Union[type, str], TypeFormatter] = {}
+# Type -> formatter used for its values, resolved once per type
+_DISPATCH_CACHE: Dict[type, TypeFormatter] = {}
+
+
+def register_formatter(cls: Union[type, str], type_name: Optional[Callable[[Any], str]] = None,
+                       value: Optional[Callable[[Any, int], str]] = None, info: Optional[Callable[[Any, int], str]] = None) -> None:
+    """
+    Registers the functions used by debug to print the values of cls and of its subclasses (see TypeFormatter).
+    cls can be a class or the string "module.QualifiedName" of a class, to avoid importing its module.
+    The functions not given are the default ones (class name, str(var)).
+    Usage:
+    >>> register_formatter(Point, type_name=lambda p: "Point", value=lambda p, max_length: f"({p.x}, {p.y})")
+    >>> debug(Point(1, 2))
+    DEBUG: p (Point) = (1, 2)
+    """
+    _FORMATTERS[cls] = TypeFormatter(type_name if type_name is not None else _default_type_name,
+                                     value if value is not None else _default_value,
+                                     info if info is not None else value)
+    _DISPATCH_CACHE.clear()
+
+
+def get_formatter(t: type) -> TypeFormatter:
+    """Returns the formatter of the values of type t: the one of the closest class of its MRO that has one."""
+    try:
+        return _DISPATCH_CACHE[t]
+    except KeyError:
+        pass
+    formatter = _FORMATTERS.get(t)
+    if formatter is None and dataclasses.is_dataclass(t):
+        formatter = _DATACLASS_FORMATTER
+    if formatter is None:
+        for klass in t.__mro__:
+            formatter = _FORMATTERS.get(klass)
+            if formatter is None:
+                formatter = _FORMATTERS.get(f"{klass.__module__}.{klass.__qualname__}")
+            if formatter is not None:
+                break
+    if formatter is None:
+        formatter = _DEFAULT_FORMATTER
+    _DISPATCH_CACHE[t] = formatter
+    return formatter
+
+
 def str_type(var: Any) -> str:
-    t = type(var)
-    if t == int:
-        return "int"
-    elif t == float:
-        return "float"
-    elif t == bool:
-        return "bool"
-    elif t == str:
-        return "str"
-    elif t == list:
-        s =  "list: "
-        s += str_type(var[0]) if len(var) > 0 else "empty"
-        return s
-    elif t == tuple:
-        s = "tuple: "
-        s += str_type(var[0]) if len(var) > 0 else "empty"
-        return s
-    elif t == dict:
-        s = "dict: "
-        s += str_type(list(var.keys())[0]) + " -> " + str_type(list(var.values())[0]) if len(var) > 0 else "empty"
-        return s
-    elif t == set:
-        s = "set: "
-        s += str_type(list(var)[0]) if len(var) > 0 else "empty"
-        return s
-    elif t == frozenset:
-        s = "frozenset: "
-        s += str_type(list(var)[0]) if len(var) > 0 else "empty"
-        return s
-    elif t == range:
-        s = "range: "
-        s += str(var.start) + " -> " + str(var.stop) + " (step: " + str(var.step) + ")"
-        return s
-    # Functions
-    elif inspect.isfunction(var):
-        s = "function: "
-        s += str(inspect.signature(var))
-        return s
-    # Dataclasses
-    elif dataclasses.is_dataclass(var):
-        return str(t).replace("<class '__main__.", "dataclass ").replace("'>", "")
-    # Pandas
-    elif str(t) == "<class 'pandas.core.frame.DataFrame'>":
-        return "DataFrame"
-    elif str(t) == "<class 'pandas.core.series.Series'>":
-        s = "Series: "
-        s += str_type(var[0]) if len(var) > 0 else "empty"
-        return s
-    # Pytorch
-    elif str(t) == "<class 'torch.Tensor'>":
-        return "Tensor: " + str(var.dtype).replace("torch.", "")
-    elif "<class 'torch.nn.modules" in str(t): # Trick to not import torch
-        return "Module: " + str(var.__class__.__name__).replace("<class 'torch.nn.modules.", "").replace("'>", "")
-    # Numpy
-    elif str(t) == "<class 'numpy.ndarray'>":
-        return "ndarray: " + str(var.dtype)
-    elif t == type(None):
-        return "None"
-    else:
-        s = str(t).replace("<class '__main__.", "class ").replace("'>", "")
-        try:
-            s = var.__class__.__name__
-        except:
-            pass
-        return s
-    
+    return get_formatter(type(var)).type_name(var)
+
 
 def return_str_value(var: Any, max_length: int) -> str:
     """Returns a string representation of the value of a variable in at most max_length characters."""
-    if var is None:
-        return "None"
     t = type(var)
-    # Number, booleans
-    if t == int or t == float or t == bool:
-        str_info = str(var)
-        if len(str_info) > max_length:
-            str_info = str_info[:max_length - 8] + "..." + str_info[-5:]
-        return str_info
-    # Strings
-    elif t == str:
-        # Check if the string is too long
-        if len(var) > max_length - 2:
-            return f'"{var[:max_length - 8]}...{var[-3:]}"'
-        else:
-            return f'"{var}"'
-    # Lists
-    elif t == list:
-        str_info = "["
+    formatter = _DISPATCH_CACHE.get(t) or get_formatter(t) # Inlined lookup, this is called for every element
+    return formatter.value(var, max_length)
+
+
+def return_short_str_info(var_name: str, var: Any, max_length: int = 90) -> str:
+    formatter = get_formatter(type(var))
+    str_t = formatter.type_name(var)
+    prefix = f"{var_name} {Colors.BLUE}({str_t}){Colors.END} = "
+    length_available = max_length - len(var_name) - len(str_t) - 6
+    return prefix + formatter.info(var, length_available)
+
+
+def _truncate(s: str, max_length: int) -> str:
+    if len(s) > max_length:
+        s = s[:max_length - 8] + "..." + s[-5:]
+    return s
+
+
+# Default (any object)
+
+def _default_type_name(var: Any) -> str:
+    try:
+        return var.__class__.__name__
+    except:
+        return str(type(var)).replace("<class '__main__.", "class ").replace("'>", "")
+
+
+def _default_value(var: Any, max_length: int) -> str:
+    s = str(var)
+    if len(s) > max_length:
+        s = s[:max_length - 8] + "..." + s[-5:]
+    return s
+
+
+_DEFAULT_FORMATTER = TypeFormatter(_default_type_name, _default_value)
+
+
+# None, numbers, booleans
+
+register_formatter(type(None), type_name=lambda var: "None", value=lambda var, max_length: "None")
+# The name of the class is kept for subclasses (numpy scalars, enums)
+register_formatter(int, type_name=lambda var: type(var).__name__, value=_default_value)
+register_formatter(float, type_name=lambda var: type(var).__name__, value=_default_value)
+register_formatter(bool, type_name=lambda var: "bool", value=_default_value)
+
+
+# Strings
+
+def _str_value(var: str, max_length: int) -> str:
+    # Check if the string is too long
+    if len(var) > max_length - 2:
+        return f'"{var[:max_length - 8]}...{var[-3:]}"'
+    else:
+        return f'"{var}"'
+
+
+def _str_info(var: str, max_length: int) -> str:
+    str_info2 = " (" + str(len(var)) + " chars)"
+    return _str_value(var, max_length - len(str_info2)) + f"{Colors.PURPLE}{str_info2}{Colors.END}"
+
+
+register_formatter(str, type_name=lambda var: "str", value=_str_value, info=_str_info)
+
+
+# Lists and everything that can be printed as a list
+# The containers are formatted element by element and stop as soon as max_length is reached,
+# self-references and containers nested more than MAX_DEPTH times are printed as [...]
+
+MAX_DEPTH = 32
+_formatting = threading.local() # .containers: ids of the containers being formatted by the current thread
+
+
+def _enter_container(var: Any) -> bool:
+    """Marks var as being formatted. Returns False if it already is (self-reference) or if MAX_DEPTH containers are."""
+    containers = getattr(_formatting, "containers", None)
+    if containers is None:
+        containers = _formatting.containers = set()
+    if id(var) in containers or len(containers) >= MAX_DEPTH:
+        return False
+    containers.add(id(var))
+    return True
+
+
+def _exit_container(var: Any) -> None:
+    _formatting.containers.discard(id(var))
+
+
+def _first_type(var: Any) -> str:
+    if len(var) == 0:
+        return "empty"
+    if not _enter_container(var):
+        return "..."
+    try:
+        return str_type(next(iter(var)))
+    finally:
+        _exit_container(var)
+
+
+def _sequence_value(var: Any, max_length: int, opening: str = "[", closing: str = "]") -> str:
+    """Prints the elements of var (iterated lazily) between opening and closing."""
+    if len(var) == 0:
+        return opening + closing
+    if not _enter_container(var):
+        return opening + "..." + closing
+    try:
+        parts = [opening]
+        length = len(opening)
+        last_index = len(var) - 1
         for i, elt in enumerate(var):
-            length_available = max_length - len(str_info) - 6
-            if i == len(var) - 1:
-                length_available = max_length - len(str_info) - 1
-            str_info += return_str_value(elt, length_available) + ", "
-            if len(str_info) >= max_length - 4 and i != len(var) - 1:
-                str_info = str_info[:max_length - 4] +  "...]"
-
-                # Remove the dots that are too long (more than 3)
-                # prev_len = -1
-                # while prev_len != len(str_info):
-                #     prev_len = len(str_info)
-                #     str_info = str_info.replace("....", "...")
-                
-                return str_info
-            elif len(str_info) >= max_length - 1 and i == len(var) - 1:
-                str_info = str_info[:max_length - 1] + "]"
-                return str_info
-        str_info = str_info[:-2] + "]"
-        return str_info
-    # Numpy arrays
-    elif str(t) == "<class 'numpy.ndarray'>": # Trick to not import numpy
-        return return_str_value(var.tolist(), max_length)
-    # Dictionaries
-    elif t == dict:
-        str_info = "{"
-        for key, value in var.items():
-            str_info += return_str_value(key, (max_length-8) / 2)
-            str_info += ": "
-            str_info += return_str_value(value, (max_length-len(str_info)-6)) + ", "
-            # TODO: Handle the case where i == len(var) - 1
-            if len(str_info) >= max_length - 4:
-                str_info = str_info[:max_length-4] + "...}"
-                return str_info
-        str_info = str_info[:-2] + "}"
-        return str_info
-    # Pytorch tensors
-    elif str(t) == "<class 'torch.Tensor'>": # Trick to not import torch
-        # Copy to CPU if necessary
-        var_cpu = var.cpu()
-        return return_str_value(var_cpu.tolist(), max_length)
-    # Pytorch models
-    elif "<class 'torch.nn.modules" in str(t): # Trick to not import torch
-        # List of children
-        try:
-            from ..torch import get_all_modules
-            list_children = get_all_modules(var)
-        except ImportError:
-            list_children = "Error: torch not imported"
-        return return_str_value([str(c) for c in list_children], max_length)
-    # Functions
-    elif inspect.isfunction(var):
-        s = var.__name__
-        if len(s) > max_length:
-            s = s[:max_length - 8] + "..." + s[-5:]
-        return s
-    # Dataclasses
-    elif dataclasses.is_dataclass(var):
+            length_available = max_length - length - (1 if i == last_index else 6)
+            part = return_str_value(elt, length_available)
+            parts.append(part)
+            parts.append(", ")
+            length += len(part) + 2
+            if length >= max_length - 4 and i != last_index:
+                return "".join(parts)[:max_length - 4] + "..." + closing
+            elif length >= max_length - 1 and i == last_index:
+                return "".join(parts)[:max_length - 1] + closing
+        parts[-1] = closing
+        return "".join(parts)
+    finally:
+        _exit_container(var)
+
+
+def _with_length(value: Callable[[Any, int], str]) -> Callable[[Any, int], str]:
+    """Info function printing the value followed by the number of elements."""
+    def info(var: Any, max_length: int) -> str:
+        str_info2 = " (" + str(len(var)) + " elts)"
+        return value(var, max_length - len(str_info2)) + f"{Colors.PURPLE}{str_info2}{Colors.END}"
+    return info
+
+
+def _collection_info(opening: str, closing: str) -> Callable[[Any, int], str]:
+    """Info function of tuples and sets: printed with their own brackets, followed by the number of elements."""
+    return _with_length(lambda var, max_length: _sequence_value(var, max_length, opening, closing))
+
+
+def _container_type_name(var: Any) -> str:
+    """Name of the class (kept for subclasses such as OrderedDict or namedtuples) and type of the first element."""
+    return type(var).__name__ + ": " + _first_type(var)
+
+
+def _tuple_value(var: tuple, max_length: int) -> str:
+    if hasattr(var, "_fields"): # namedtuple, printed with the names of its fields
+        return _default_value(var, max_length)
+    return _sequence_value(var, max_length)
+
+
+def _tuple_info(var: tuple, max_length: int) -> str:
+    if hasattr(var, "_fields"):
+        return _with_length(_default_value)(var, max_length)
+    return _collection_info("(", ")")(var, max_length)
+
+
+register_formatter(list, type_name=_container_type_name, value=_sequence_value, info=_with_length(_sequence_value))
+register_formatter(tuple, type_name=_container_type_name, value=_tuple_value, info=_tuple_info)
+register_formatter(set, type_name=_container_type_name, value=_sequence_value, info=_collection_info("{", "}"))
+register_formatter(frozenset, type_name=_container_type_name, value=_sequence_value, info=_collection_info("{", "}"))
+register_formatter(type(...), type_name=lambda var: "ellipsis", value=lambda var, max_length: "...") # Elements not shown
+register_formatter(range, type_name=lambda var: f"range: {var.start} -> {var.stop} (step: {var.step})", value=_sequence_value)
+
+
+# Dictionaries
+
+def _dict_type_name(var: dict) -> str:
+    name = type(var).__name__ # Kept for subclasses (OrderedDict, defaultdict, Counter)
+    if len(var) == 0:
+        return name + ": empty"
+    if not _enter_container(var):
+        return name + ": ..."
+    try:
+        key, value = next(iter(var.items()))
+        return name + ": " + str_type(key) + " -> " + str_type(value)
+    finally:
+        _exit_container(var)
+
+
+def _dict_value(var: dict, max_length: int) -> str:
+    if len(var) == 0:
+        return "{}"
+    if not _enter_container(var):
+        return "{...}"
+    try:
+        parts = ["{"]
+        length = 1
+        last_index = len(var) - 1
+        for i, (key, value) in enumerate(var.items()):
+            str_key = return_str_value(key, (max_length - 8) // 2)
+            length += len(str_key) + 2
+            str_value = return_str_value(value, max_length - length - (1 if i == last_index else 6))
+            parts += [str_key, ": ", str_value, ", "]
+            length += len(str_value) + 2
+            if length >= max_length - 4 and i != last_index:
+                return "".join(parts)[:max_length - 4] + "...}"
+            elif length >= max_length - 1 and i == last_index:
+                return "".join(parts)[:max_length - 1] + "}"
+        parts[-1] = "}"
+        return "".join(parts)
+    finally:
+        _exit_container(var)
+
+
+register_formatter(dict, type_name=_dict_type_name, value=_dict_value, info=_with_length(_dict_value))
+
+
+# Functions
+
+register_formatter(types.FunctionType, type_name=lambda var: "function: " + str(inspect.signature(var)),
+                   value=lambda var, max_length: _truncate(var.__name__, max_length))
+
+
+# Dataclasses
+
+def _dataclass_value(var: Any, max_length: int) -> str:
+    if not _enter_container(var):
+        return "..."
+    try:
         list_infos = []
         list_types = []
         length_used = 0
-        incomplete = False # Ture if we were not able to include all the fields
-        for i, field in enumerate(dataclasses.fields(var)):
+        incomplete = False # True if we were not able to include all the fields
+        fields = dataclasses.fields(var)
+        for i, field in enumerate(fields):
             list_infos.append(field.name + "=")
             length_available = max_length - length_used - len(list_infos[-1]) - 5
-            if i == len(dataclasses.fields(var)) - 1:
+            if i == len(fields) - 1:
                 length_available += 5
             list_types.append(str_type(getattr(var, field.name)))
             list_infos[-1] += return_str_value(getattr(var, field.name), length_available)
             length_used += len(list_infos[-1]) + 2
-            if length_used >= max_length - 3 and i != len(dataclasses.fields(var)) - 1:
+            if length_used >= max_length - 3 and i != len(fields) - 1:
                 incomplete = True
                 break
             elif length_used >= max_length:
                 incomplete = True
                 break
 
-        # Now add the list_infos 
+        # Now add the list_infos
         # Fit as many types as possible
         last_type_index = -1
         for str_t in list_types:
@@ -179,7 +331,7 @@ def return_str_value(var: Any, max_length: int) -> str:
                 last_type_index += 1
             else:
                 break
-        
+
         str_info = ""
         for i, info in enumerate(list_infos):
             str_info += info
@@ -190,131 +342,238 @@ def return_str_value(var: Any, max_length: int) -> str:
         if incomplete:
             str_info = str_info[:max_length - 3] + "..."
         return str_info
-    # Everything that can be printed as a list
-    elif t == tuple or t == set or t == frozenset or t == range:
-        str_info = return_str_value(list(var), max_length)
-        return str_info
-    # Pandas dataframe
-    elif str(t) == "<class 'pandas.core.frame.DataFrame'>": # Trick to not import pandas
-        str_info = return_str_value(var.values, max_length)
-        return str_info
-    # Pandas series
-    elif str(t) == "<class 'pandas.core.series.Series'>": # Trick to not import pandas
-        str_info = return_str_value(var.values, max_length)
-        return str_info
-    # Other
+    finally:
+        _exit_container(var)
+
+
+_DATACLASS_FORMATTER = TypeFormatter(lambda var: str(type(var)).replace("<class '__main__.", "dataclass ").replace("'>", ""), _dataclass_value)
+
+
+# Numpy arrays (and the shared functions of the arrays of other libraries)
+
+# If True, the infos of arrays and tensors include their min, max, mean and number of NaN (see enable_array_stats)
+_ARRAY_STATS: bool = False
+
+
+def enable_array_stats(enabled: bool = True) -> None:
+    """
+    Enables (or disables) the summary statistics of numpy arrays and torch tensors in debug.
+    They are computed by numpy (or by torch, on the device of the tensor) without converting the values to python objects.
+    Usage:
+    >>> enable_array_stats()
+    >>> debug(a)
+    DEBUG: a (ndarray: float64) = [[0.1, 0.5, ...], ...] (1000, 1000) (min=0.0, max=1.0, mean=0.5, nan=0)
+    """
+    global _ARRAY_STATS
+    _ARRAY_STATS = enabled
+
+
+def _array_budget(max_length: int) -> int:
+    """Number of elements enough to fill max_length characters (each one takes at least 3: "0, ")."""
+    return max(int(max_length), 0) // 3 + 2
+
+
+def _array_head(array: Any, budget: int) -> Any:
+    """
+    Returns the first elements of array (numpy array or torch tensor, or anything with the same slicing) as nested lists,
+    with an Ellipsis after the elements and rows that were not copied. At most about budget values are copied.
+    """
+    if array.ndim == 0:
+        return array.item()
+    if array.ndim == 1:
+        head = array[:budget].tolist()
     else:
-        str_info = str(var)
-        if len(str_info) > max_length:
-            str_info = str_info[:max_length - 8] + "..." + str_info[-5:]
-        return str_info
-    
+        head = []
+        row_size = math.prod(array.shape[1:])
+        for i in range(min(len(array), budget)):
+            if budget <= 0:
+                break
+            head.append(_array_head(array[i], budget))
+            budget -= row_size
+    if len(head) < len(array):
+        head.append(...)
+    return head
 
-def return_short_str_info(var_name: str, var: Any, max_length: int = 90) -> str:
-    t = type(var)
-    str_t = str_type(var)
-    prefix = f"{var_name} {Colors.BLUE}({str_t}){Colors.END} = "
-    str_info = ""
-    length_available = max_length - len(var_name) - len(str_t) - 6
-    # None
-    if var is None:
-        str_info = return_str_value(var, length_available)
-    # Number, booleans
-    if t == int or t == float:
-        str_info = return_str_value(var, length_available)
-    # Strings
-    elif t == str:
-        str_info2 = " (" + str(len(var)) + " chars)"
-        str_info = return_str_value(var, length_available - len(str_info2))
-        str_info += f"{Colors.PURPLE}{str_info2}{Colors.END}"
-    # Lists
-    elif t == list:
-        length = len(var)
-        str_info2 = " (" + str(length) + " elts)"
-        str_info = return_str_value(var, length_available - len(str_info2))
-        str_info += f"{Colors.PURPLE}{str_info2}{Colors.END}"
-    # Numpy arrays
-    elif str(t) == "<class 'numpy.ndarray'>": # Trick to not import numpy
-        shape = var.shape
-        str_info2 = " " + str(shape)
-        str_info = return_str_value(var, length_available - len(str_info2))
-        str_info += f"{Colors.PURPLE}{str_info2}{Colors.END}"
-    # Dictionaries
-    elif t == dict:
-        length = len(var)
-        str_info2 = " (" + str(length) + " elts)"
-        str_info = return_str_value(var, length_available - len(str_info2) )
-        str_info += f"{Colors.PURPLE}{str_info2}{Colors.END}"
-    # Functions
-    elif inspect.isfunction(var):
-        str_info = return_str_value(var, length_available)
-    # Pytorch tensors
-    elif str(t) == "<class 'torch.Tensor'>": # Trick to not import torch
-        shape = var.shape
-        device = var.device
-        req_grad = var.requires_grad
-        str_info2 = " " + str(shape).replace("torch.Size", "").replace('[', '').replace(']', '')
-        str_info3 = f" ({device})"
-        str_info4 = "(req-grad)" if req_grad else "(" + strike("req-grad") + ")"
-        str_info = return_str_value(var, length_available - len(str_info2) - len(str_info3) - len(" (req-grad)"))
-        str_info += f"{Colors.PURPLE}{str_info2}{Colors.END}"
-        str_info += f"{Colors.RED}{str_info3}{Colors.END}"
-        str_info += f" {Colors.GREEN}{str_info4}{Colors.END}"
-    elif "<class 'torch.nn.modules" in str(t): # Trick to not import torch
+
+def _array_value(var: Any, max_length: int) -> str:
+    return return_str_value(_array_head(var, _array_budget(max_length)), max_length)
+
+
+def _array_stats(var: Any) -> str:
+    """Returns " (min=..., max=..., mean=..., nan=...)" if the array stats are enabled and var is a non-empty numeric array."""
+    if not _ARRAY_STATS or var.size == 0 or var.dtype.kind not in "biuf":
+        return ""
+    np = sys.modules["numpy"] # Already imported since var is an array
+    with warnings.catch_warnings(), np.errstate(all="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning) # All NaN
+        n_nan = int(np.isnan(var).sum()) if var.dtype.kind == "f" else 0
+        stats = [np.nanmin(var), np.nanmax(var), np.nanmean(var)]
+    return _format_stats(*[stat.item() for stat in stats], n_nan)
+
+
+def _format_stats(min_value: Any, max_value: Any, mean: float, n_nan: int) -> str:
+    return f" (min={min_value:.4g}, max={max_value:.4g}, mean={mean:.4g}, nan={n_nan})"
+
+
+def _ndarray_info(var: Any, max_length: int) -> str:
+    str_info2 = " " + str(var.shape)
+    str_info3 = _array_stats(var)
+    str_info = _array_value(var, max_length - len(str_info2) - len(str_info3))
+    return str_info + f"{Colors.PURPLE}{str_info2}{Colors.END}" + (f"{Colors.CYAN}{str_info3}{Colors.END}" if str_info3 else "")
+
+
+def _as_ndarray(var: Any) -> Any:
+    """Base ndarray view of var: the rows of subclasses such as np.matrix keep the same ndim, _array_head would never end."""
+    return sys.modules["numpy"].asarray(var)
+
+
+register_formatter("numpy.ndarray", type_name=lambda var: "ndarray: " + str(var.dtype),
+                   value=lambda var, max_length: _array_value(_as_ndarray(var), max_length),
+                   info=lambda var, max_length: _ndarray_info(_as_ndarray(var), max_length))
+
+
+# Pandas
+# Only the rows and columns that can be printed are converted to a numpy array
+
+def _dataframe_value(var: Any, max_length: int) -> str:
+    budget = _array_budget(max_length)
+    head = _array_head(var.iloc[:budget, :budget].to_numpy(), budget)
+    rows = [row for row in head if row is not ...]
+    if var.shape[1] > budget: # Columns not converted
+        for row in rows:
+            if not row or row[-1] is not ...:
+                row.append(...)
+    if var.shape[0] > len(rows) and (not head or head[-1] is not ...): # Rows not converted
+        head.append(...)
+    return return_str_value(head, max_length)
+
+
+def _series_value(var: Any, max_length: int) -> str:
+    budget = _array_budget(max_length)
+    head = var.iloc[:budget].to_numpy().tolist()
+    if len(var) > budget:
+        head.append(...)
+    return return_str_value(head, max_length)
+
+
+def _dataframe_info(var: Any, max_length: int) -> str:
+    shape = var.shape
+    str_info2 = f" ({shape[0]} rows, {shape[1]} cols)"
+    return _dataframe_value(var, max_length - len(str_info2)) + f"{Colors.PURPLE}{str_info2}{Colors.END}"
+
+
+def _series_info(var: Any, max_length: int) -> str:
+    str_info2 = f" ({var.size} elts)"
+    return _series_value(var, max_length - len(str_info2)) + f"{Colors.PURPLE}{str_info2}{Colors.END}"
+
+
+register_formatter("pandas.core.frame.DataFrame", type_name=lambda var: "DataFrame", value=_dataframe_value, info=_dataframe_info)
+register_formatter("pandas.core.series.Series", type_name=lambda var: "Series: " + (str_type(var.iloc[0]) if len(var) > 0 else "empty"),
+                   value=_series_value, info=_series_info)
+
+
+# Pytorch
+# Only the elements printed are copied to the CPU
+
+def _tensor_stats(var: Any) -> str:
+    """Same as _array_stats, computed on the device of the tensor (a single synchronization)."""
+    if not _ARRAY_STATS or var.numel() == 0 or var.is_complex():
+        return ""
+    torch = sys.modules["torch"]
+    values = var.detach().float()
+    nan = values.isnan()
+    stats = torch.stack([values.masked_fill(nan, float("inf")).min(), values.masked_fill(nan, float("-inf")).max(),
+                         values.nanmean(), nan.sum().float()]).tolist()
+    return _format_stats(stats[0], stats[1], stats[2], int(stats[3]))
+
+
+def _tensor_info(var: Any, max_length: int) -> str:
+    str_info2 = " " + str(var.shape).replace("torch.Size", "").replace('[', '').replace(']', '')
+    str_info3 = f" ({var.device})"
+    str_info4 = "(req-grad)" if var.requires_grad else "(" + strike("req-grad") + ")"
+    str_info5 = _tensor_stats(var)
+    str_info = _array_value(var, max_length - len(str_info2) - len(str_info3) - len(" (req-grad)") - len(str_info5))
+    str_info += f"{Colors.PURPLE}{str_info2}{Colors.END}"
+    str_info += f"{Colors.RED}{str_info3}{Colors.END}"
+    str_info += f" {Colors.GREEN}{str_info4}{Colors.END}"
+    if str_info5:
+        str_info += f"{Colors.CYAN}{str_info5}{Colors.END}"
+    return str_info
+
+
+def _module_value(var: Any, max_length: int) -> str:
+    # List of children
+    try:
+        from ..torch import get_all_modules
+        list_children = get_all_modules(var)
+    except ImportError:
+        list_children = "Error: torch not imported"
+    return return_str_value([str(c) for c in list_children], max_length)
+
+
+def _module_info(var: Any, max_length: int) -> str:
+    try:
+        from ..torch import count_learnable_parameters, count_parameters
+        str_info2 = f" ({count_learnable_parameters(var)}/{count_parameters(var)} params)"
+    except ImportError:
+        str_info2 = " (? params)"
+    device = next(var.parameters()).device
+    str_info3 = f" ({device})"
+    str_info = _module_value(var, max_length - len(str_info2) - len(str_info3))
+    str_info += f"{Colors.PURPLE}{str_info2}{Colors.END}"
+    str_info += f"{Colors.RED}{str_info3}{Colors.END}"
+    return str_info
+
+
+register_formatter("torch.Tensor", type_name=lambda var: "Tensor: " + str(var.dtype).replace("torch.", ""),
+                   value=_array_value, info=_tensor_info)
+register_formatter("torch.nn.modules.module.Module", type_name=lambda var: "Module: " + var.__class__.__name__,
+                   value=_module_value, info=_module_info)
+
+
+# (code object of the caller, offset of the call instruction) -> name of the argument
+_NAMES_CACHE: Dict[Tuple[Any, int], str] = {}
+# file name -> calls of the file (parsed once)
+_CALLS_CACHE: Dict[str, List[ast.Call]] = {}
+
+
+def _file_calls(filename: str) -> List[ast.Call]:
+    """Returns the calls of the source file (empty if its source is not available)."""
+    if filename not in _CALLS_CACHE:
         try:
-            from ..torch import count_learnable_parameters, count_parameters
-            str_info2 = f" ({count_learnable_parameters(var)}/{count_parameters(var)} params)"
-        except ImportError:
-            str_info2 = " (? params)"
-        device = next(var.parameters()).device
-        str_info3 = f" ({device})"
-        str_info = return_str_value(var, length_available - len(str_info2) - len(str_info3))
-        str_info += f"{Colors.PURPLE}{str_info2}{Colors.END}"
-        str_info += f"{Colors.RED}{str_info3}{Colors.END}"
-    # Pandas dataframes
-    elif str(t) == "<class 'pandas.core.frame.DataFrame'>": # Trick to not import pandas
-        shape = var.shape
-        str_info2 = f" ({shape[0]} rows, {shape[1]} cols)"
-        str_info = return_str_value(var, length_available - len(str_info2))
-        str_info += f"{Colors.PURPLE}{str_info2}{Colors.END}"
-    # Pandas series
-    elif str(t) == "<class 'pandas.core.series.Series'>": # Trick to not import pandas
-        shape = var.size
-        str_info2 = f" ({shape} elts)"
-        str_info = return_str_value(var, length_available - len(str_info2))
-        str_info += f"{Colors.PURPLE}{str_info2}{Colors.END}"
-    # Pytorch models
-    elif str(t) == "<class 'torch.nn.modules.module.Module'>": # Trick to not import torch
-        str_info2 = " " + str(list(var.children()))
-        str_info3 = " " + str(list(var.parameters()))
-        str_info4 = " " + str(list(var.learnable_parameters()))
-        str_info = return_str_value(var, length_available - len(str_info2) - len(str_info3) - len(str_info4))
-        str_info += f"{Colors.PURPLE}{str_info2}{Colors.END}"
-        str_info += f"{Colors.RED}{str_info3}{Colors.END}"
-        str_info += f"{Colors.GREEN}{str_info4}{Colors.END}"
-    # Dataclasses
-    elif dataclasses.is_dataclass(var):
-        str_info = return_str_value(var, length_available)
-    # Sets, Tuples
-    # Convert to list to call return_str_value
-    elif t == set or t == frozenset or t == tuple:
-        var = list(var)
-        str_info2 = " (" + str(len(var)) + " elts)"
-        str_info = return_str_value(var, length_available - len(str_info2))
-        if t == set or t == frozenset:
-            str_info = str_info.replace("[", "{").replace("]", "}")
-        else:
-            str_info = str_info.replace("[", "(").replace("]", ")")
-        str_info += f"{Colors.PURPLE}{str_info2}{Colors.END}"
-    # Other str_types
-    else:
-        str_info = return_str_value(var, length_available)
-    return prefix + str_info
+            tree = ast.parse("".join(linecache.getlines(filename)))
+            _CALLS_CACHE[filename] = [node for node in ast.walk(tree) if isinstance(node, ast.Call)]
+        except (SyntaxError, ValueError):
+            _CALLS_CACHE[filename] = []
+    return _CALLS_CACHE[filename]
+
+
+def _find_call(frame: Any, func_name: str) -> Optional[ast.Call]:
+    """Returns the call being executed by frame, func_name being the name of the function called."""
+    calls = _file_calls(frame.f_code.co_filename)
+    positions = None
+    if hasattr(frame.f_code, "co_positions"): # Python >= 3.11: exact position of the call instruction
+        positions = next(itertools.islice(frame.f_code.co_positions(), frame.f_lasti // 2, None), None)
+    if positions is not None and None not in positions:
+        for call in calls:
+            if (call.lineno, call.end_lineno, call.col_offset, call.end_col_offset) == positions:
+                return call
+    # Otherwise, first call of func_name on the current line
+    line = frame.f_lineno
+    candidates = [call for call in calls if call.lineno <= line <= call.end_lineno]
+    candidates.sort(key=lambda call: (call.lineno, call.col_offset))
+    for call in candidates:
+        name = call.func.id if isinstance(call.func, ast.Name) else getattr(call.func, "attr", None)
+        if name == func_name:
+            return call
+    return None
+
 
 def retrieve_name(var: Any, call_context: int = 0) -> str:
     """
     Gets the name of var. Use call-context to get the name of the variable in the caller function
     after call_context nested calls.
+    The source of the call is parsed once per call site, the next calls only cost a dictionary lookup.
     Usage:
     >>> a = 1
     >>> retrieve_name(a, call_context=0)
@@ -328,16 +587,33 @@ def retrieve_name(var: Any, call_context: int = 0) -> str:
     >>> g(a)
     'var'
     """
-    stacks = inspect.stack()
     try:
-        func = stacks[0 + call_context].function
-        code = stacks[1 + call_context].code_context[0]
-        s = code.index(func)
-        s = code.index("(", s + len(func)) + 1
-        e = code.index(")", s)
-        return code[s:e].strip()
-    except:
+        func_frame = sys._getframe(call_context) # Frame of the function whose argument is named
+        frame = func_frame.f_back # Frame calling it
+    except ValueError: # Not enough frames
+        return ""
+    if frame is None:
         return ""
+    key = (frame.f_code, frame.f_lasti)
+    name = _NAMES_CACHE.get(key)
+    if name is None:
+        name = ""
+        func_code = func_frame.f_code
+        call = _find_call(frame, func_code.co_name)
+        if call is not None:
+            arg_name = func_code.co_varnames[0] if func_code.co_argcount > 0 else None
+            node = None
+            if call.args and not isinstance(call.args[0], ast.Starred):
+                node = call.args[0]
+            else: # Passed as a keyword argument
+                node = next((keyword.value for keyword in call.keywords if keyword.arg == arg_name), None)
+            if node is not None:
+                source = "".join(linecache.getlines(frame.f_code.co_filename))
+                name = ast.get_source_segment(source, node) or ""
+                if "\n" in name: # Multi-line argument, normalized on one line
+                    name = ast.unparse(node)
+        _NAMES_CACHE[key] = name
+    return name
 
 def debug(var: Any, visible: bool = False, return_str: bool = False, display: bool = True, nested_calls: int = 0) -> Union[None, str]:
     """
@@ -347,14 +623,16 @@ def debug(var: Any, visible: bool = False, return_str: bool = False, display: bo
     >>> debug(a)
     DEBUG: a (int) = 1
     """
+    start = time.perf_counter_ns() if debug_profiler.enabled else 0
     width = get_terminal_width() - 1 - 4 * visible
-    var_name = retrieve_name(var, call_context=1+nested_calls).replace(", visible=False", "").replace(", visible=True", "")
+    var_name = retrieve_name(var, call_context=1+nested_calls)
     to_print = f"{Colors.BOLD}DEBUG: {Colors.END}{return_short_str_info(var_name, var, max_length=width-7)}"
     if display:
         if visible:
             print_visible(to_print)
         else:
             print(to_print)
+    if start: debug_profiler.record("debug", time.perf_counter_ns() - start)
     if return_str:
         return str_without_colors(to_print)
 
@@ -368,7 +646,8 @@ def sdebug(var: Any, visible: bool = False, return_str: bool = False, display: b
     DEBUG: a (ndarray) = [[1. 1. 1. 1. 1. 1. 1. 1. 1. 1.]
      [1. 1. 1. 1. 1. 1. 1. 1. 1. 1.]
     """
-    var_name = retrieve_name(var, call_context=1+nested_calls).replace(", visible=False", "").replace(", visible=True", "")
+    start = time.perf_counter_ns() if debug_profiler.enabled else 0
+    var_name = retrieve_name(var, call_context=1+nested_calls)
     to_print = f"{Colors.BOLD}DEBUG: {Colors.END}{var_name} {Colors.BLUE}({str_type(var)}){Colors.END} = {var}"
     if display:
         if visible:
@@ -378,6 +657,7 @@ def sdebug(var: Any, visible: bool = False, return_str: bool = False, display: b
             print_visible(lines)
         else:
             print(to_print)
+    if start: debug_profiler.record("sdebug", time.perf_counter_ns() - start)
     if return_str:
         return str_without_colors(to_print)
 
@@ -393,8 +673,9 @@ def ldebug(var: Any, n_lines_max: int = 100, visible: bool = False, return_str:
     [[1. 1. 1. 1. 1. 1. 1. 1. 1. 1.]
      [1. 1. 1. 1. 1. 1. 1. 1. 1. 1.]]
     """
+    start = time.perf_counter_ns() if debug_profiler.enabled else 0
     width = (get_terminal_width() - 1) * n_lines_max
-    var_name = retrieve_name(var, call_context=1+nested_calls).replace(", visible=False", "").replace(", visible=True", "")
+    var_name = retrieve_name(var, call_context=1+nested_calls)
     to_print = f"{Colors.BOLD}DEBUG: {Colors.END}{return_short_str_info(var_name, var, max_length=width-7)}"
     if display:
         if visible:
@@ -404,5 +685,6 @@ def ldebug(var: Any, n_lines_max: int = 100, visible: bool = False, return_str:
             print_visible(lines)
         else:
             print(to_print)
+    if start: debug_profiler.record("ldebug", time.perf_counter_ns() - start)
     if return_str:
         return str_without_colors(to_print)
\ No newline at end of file
@@ -0,0 +1,128 @@
+from typing import Any, Callable, Dict, List, Optional
+import functools
+import time
+from .utils import Colors, print_subset_of_args
+
+
+__all__ = ["CallStats", "Profiler", "debug_profiler", "enable_debug_profiling"]
+
+
+def _percentile(sorted_values: List[int], q: float) -> float:
+    """Percentile q (in [0, 100]) of sorted values, with linear interpolation (as numpy.percentile)."""
+    position = (len(sorted_values) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+
+
+class CallStats:
+    """
+    Statistics of the calls of one method: count, cumulative time, and the last window latencies (to compute percentiles).
+    """
+
+    __slots__ = ("count", "total_ns", "max_ns", "_latencies", "_position")
+
+    def __init__(self, window: int = 1024):
+        self.count: int = 0
+        self.total_ns: int = 0
+        self.max_ns: int = 0
+        self._latencies: List[int] = [0] * window
+        self._position: int = 0
+
+    def add(self, duration_ns: int) -> None:
+        self.count += 1
+        self.total_ns += duration_ns
+        if duration_ns > self.max_ns: self.max_ns = duration_ns
+        self._latencies[self._position] = duration_ns
+        self._position = (self._position + 1) % len(self._latencies)
+
+    def report(self) -> Dict[str, float]:
+        """Returns the count, the cumulative time (ms), and the mean, p50, p99 and max latencies (us)."""
+        latencies = sorted(self._latencies[:min(self.count, len(self._latencies))])
+        p50, p99 = (_percentile(latencies, 50), _percentile(latencies, 99)) if latencies else (0., 0.)
+        return {"count": self.count, "total_ms": self.total_ns / 1e6, "mean_us": self.total_ns / max(1, self.count) / 1e3,
+                "p50_us": p50 / 1e3, "p99_us": p99 / 1e3, "max_us": self.max_ns / 1e3}
+
+
+class Profiler:
+    """
+    Records the latency of method calls (with time.perf_counter_ns) and the number of bytes written by each sink.
+    The percentiles are computed over the last window calls of each method.
+    Nothing is recorded while enabled is False.
+    Usage:
+    >>> profiler = Profiler(enabled=True)
+    >>> f = profiler.wrap("f", f)
+    >>> profiler.print_report("Profile")
+    """
+
+    def __init__(self, enabled: bool = False, window: int = 1024):
+        self.enabled: bool = enabled
+        self.window: int = window
+        self.calls: Dict[str, CallStats] = {}
+        self.bytes_written: Dict[str, int] = {}
+
+    def record(self, name: str, duration_ns: int) -> None:
+        stats = self.calls.get(name)
+        if stats is None:
+            stats = self.calls[name] = CallStats(self.window)
+        stats.add(duration_ns)
+
+    def wrap(self, name: str, fn: Callable[..., Any]) -> Callable[..., Any]:
+        """Returns fn, timed under name when the profiler is enabled."""
+        perf_counter_ns = time.perf_counter_ns
+
+        @functools.wraps(fn)
+        def timed(*args: Any, **kwargs: Any) -> Any:
+            if not self.enabled:
+                return fn(*args, **kwargs)
+            start = perf_counter_ns()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(name, perf_counter_ns() - start)
+        return timed
+
+    def reset(self) -> None:
+        self.calls = {}
+        self.bytes_written = {}
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Returns {"calls": {name: {"count", "total_ms", "mean_us", "p50_us", "p99_us", "max_us"}}, "bytes_written": {sink: bytes}}.
+        """
+        return {"calls": {name: stats.report() for name, stats in sorted(self.calls.items())},
+                "bytes_written": dict(self.bytes_written)}
+
+    def print_report(self, title: str = "Profile", color: str = Colors.BLUE, print_length: int = 100, var_length: int = 25) -> Dict[str, Any]:
+        """
+        Prints the report with print_subset_of_args and returns it.
+        """
+        report = self.report()
+        lines = {name: (f"{stats['count']} calls, {stats['total_ms']:.1f} ms, p50 {stats['p50_us']:.1f} us, "
+                        f"p99 {stats['p99_us']:.1f} us, max {stats['max_us']:.1f} us")
+                 for name, stats in report["calls"].items()}
+        lines.update({f"bytes {sink}": f"{n_bytes} B" for sink, n_bytes in report["bytes_written"].items()})
+        print_subset_of_args(_Namespace(lines), title, list(lines.keys()), color=color, print_length=print_length, var_length=var_length)
+        return report
+
+
+class _Namespace:
+    # print_subset_of_args reads the values with getattr
+    def __init__(self, values: Dict[str, Any]):
+        self.__dict__.update(values)
+
+
+# Profiler of debug, sdebug and ldebug (disabled by default)
+debug_profiler = Profiler()
+
+
+def enable_debug_profiling(enabled: bool = True) -> Profiler:
+    """
+    Enables (or disables) the timing of debug, sdebug and ldebug and returns the profiler.
+    Usage:
+    >>> profiler = enable_debug_profiling()
+    >>> debug(a)
+    >>> profiler.print_report("Debug")
+    """
+    debug_profiler.enabled = enabled
+    return debug_profiler
@@ -1,5 +1,14 @@
 import os
-from typing import List, Union, Optional
+import re
+import signal
+import time
+import unicodedata
+from typing import Any, Callable, Dict, List, Union, Optional
+
+
+__all__ = ["Colors", "str_to_color", "ANSI_SGR_REGEX", "str_without_colors", "str_with_color", "str_len_without_colors", "str_display_width",
+           "print_color", "print_centered", "print_wrapped", "print_full_line", "print_visible", "strike", "set_terminal_width",
+           "get_terminal_width", "print_subset_of_args", "warn"]
 
 class Colors:
     """Colors for printing in the terminal."""
@@ -22,15 +31,22 @@ def str_to_color(color_name: str) -> str:
     color_name = color_name.upper()
     return getattr(Colors, color_name)
 
+# Any ANSI SGR sequence (colors, bold, ...), not only the ones of Colors
+ANSI_SGR_REGEX = re.compile(r"\x1b\[[0-9;:]*m")
+# The sequences of Colors are removed with str.replace first, which is faster than the regex
+_COLOR_CODES = tuple(value for name, value in vars(Colors).items() if not name.startswith("_"))
+
 def str_without_colors(text: str) -> str:
     """
-    Returns the string without the color characters.
+    Returns the string without the color characters (any ANSI SGR sequence).
     """
-    white_text = text
-    for color in Colors.__dict__.values():
-        if isinstance(color, str):
-            white_text = white_text.replace(color, "")
-    return white_text
+    if "\x1b" not in text: # Nothing to remove
+        return text
+    for code in _COLOR_CODES:
+        text = text.replace(code, "")
+    if "\x1b" in text: # Sequences that are not in Colors
+        text = ANSI_SGR_REGEX.sub("", text)
+    return text
 
 def str_with_color(text: str, color: Union[str, List[str]]) -> str:
     """
@@ -57,6 +73,42 @@ def str_len_without_colors(text: str) -> int:
     # Removes all the color characters
     return len(str_without_colors(text))
 
+# Display width of the non-ASCII characters already seen
+_CHAR_WIDTHS: Dict[str, int] = {}
+
+def _char_width(c: str) -> int:
+    width = _CHAR_WIDTHS.get(c)
+    if width is None:
+        if unicodedata.combining(c) or unicodedata.category(c) in ("Mn", "Me", "Cf"): # Combining (strike) and zero width characters
+            width = 0
+        elif unicodedata.east_asian_width(c) in ("W", "F"): # Wide characters (CJK, emojis)
+            width = 2
+        else:
+            width = 1
+        _CHAR_WIDTHS[c] = width
+    return width
+
+def str_display_width(text: str) -> int:
+    """
+    Returns the number of columns that text takes in the terminal:
+    color characters and combining characters (such as the ones of strike) take no column, wide characters take 2.
+    Usage:
+    >>> str_display_width(Colors.RED + strike("abc") + Colors.END)
+    3
+    """
+    text = str_without_colors(text)
+    if text.isascii():
+        return len(text)
+    special_chars = [c for c in set(text) if c >= "\x80"]
+    if len(special_chars) > 32: # Many different characters (e.g. CJK text), counting each one would be slower
+        return sum(_char_width(c) if c >= "\x80" else 1 for c in text)
+    width = len(text)
+    for c in special_chars:
+        char_width = _char_width(c)
+        if char_width != 1:
+            width += (char_width - 1) * text.count(c)
+    return width
+
 
 def print_color(text: str, color: Optional[Union[str, List[str]]] = None) -> None:
     """
@@ -81,8 +133,8 @@ def print_centered(text: str, color: Optional[Union[str, List[str]]] = None, wid
     """
     if width is None:
         width = get_terminal_width() - 1
-    # Compensate for the color characters
-    width += len(text) - str_len_without_colors(text)
+    # Compensate for the color and combining characters
+    width += len(text) - str_display_width(text)
     str_color = ""
     if color is not None:
         if not isinstance(color, list):
@@ -97,8 +149,8 @@ def print_wrapped(text: str, color: Optional[Union[str, List[str]]] = None, widt
     """
     if width is None:
         width = get_terminal_width() - 1
-    # Compensate for the color characters
-    width += len(text) - str_len_without_colors(text)
+    # Compensate for the color and combining characters
+    width += len(text) - str_display_width(text)
     str_color = ""
     if color is not None:
         if not isinstance(color, list):
@@ -140,15 +192,72 @@ def print_visible(text: Union[str, List[str]]) -> None:
 def strike(text: str) -> str:
     return ''.join([u'\u0336{}'.format(c) for c in text])
 
+# The width of the terminal is cached: it is computed again after a SIGWINCH (terminal resized),
+# or after _WIDTH_CACHE_DURATION seconds on the platforms/threads where the signal handler cannot be installed
+# and when the application replaced it
+_WIDTH_CACHE_DURATION = 1.
+_terminal_width: Optional[int] = None
+_terminal_width_time: float = 0.
+_terminal_width_override: Optional[int] = None
+_resize_handler: Optional[Callable[[int, Any], None]] = None # SIGWINCH handler installed by get_terminal_width
+_resize_handler_tried: bool = False
+
+def set_terminal_width(width: Optional[int]) -> None:
+    """
+    Forces the width returned by get_terminal_width (useful when the output is not a terminal, e.g. on CI).
+    Use None to go back to the width of the terminal.
+    Usage: set_terminal_width(120)
+    """
+    global _terminal_width_override
+    _terminal_width_override = width
+
+def _install_resize_handler() -> None:
+    """Invalidates the cached width on SIGWINCH (the previous handler is still called)."""
+    global _resize_handler, _resize_handler_tried
+    _resize_handler_tried = True
+    if not hasattr(signal, "SIGWINCH"): # Windows
+        return
+    previous = signal.getsignal(signal.SIGWINCH)
+
+    def on_resize(signum: int, frame: Any) -> None:
+        global _terminal_width
+        _terminal_width = None
+        if callable(previous):
+            previous(signum, frame)
+
+    try:
+        signal.signal(signal.SIGWINCH, on_resize)
+    except ValueError: # Not in the main thread
+        return
+    _resize_handler = on_resize
+
+def _resize_handler_active() -> bool:
+    """True if the handler of _install_resize_handler is still the SIGWINCH handler (the application may have replaced it)."""
+    return _resize_handler is not None and signal.getsignal(signal.SIGWINCH) is _resize_handler
+
 def get_terminal_width() -> int:
     """
-    Returns the width of the terminal.
+    Returns the width of the terminal: the one given to set_terminal_width, or COLUMNS if it is set, or the size of the terminal (80 if there is none).
+    The width is cached, so that it does not cost a system call per print (COLUMNS is read when the width is computed again).
     Usage: get_terminal_width()
     """
-    try:
-        return os.get_terminal_size().columns
-    except OSError:
-        return 80
+    global _terminal_width, _terminal_width_time
+    if _terminal_width_override is not None:
+        return _terminal_width_override
+    if _terminal_width is not None and (time.monotonic() - _terminal_width_time < _WIDTH_CACHE_DURATION or _resize_handler_active()):
+        return _terminal_width
+    if not _resize_handler_tried:
+        _install_resize_handler()
+    columns = os.environ.get("COLUMNS")
+    if columns is not None and columns.isdigit() and int(columns) > 0:
+        width = int(columns)
+    else:
+        try:
+            width = os.get_terminal_size().columns
+        except OSError:
+            width = 80
+    _terminal_width, _terminal_width_time = width, time.monotonic()
+    return width
    
 def print_subset_of_args(args: dict, title: str, list_of_args: List["str"], color: str = Colors.BLUE, print_length: int = 50, var_length: int = 15) -> None:
     """